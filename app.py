@@ -1,8 +1,10 @@
 from bson import ObjectId
-from flask import Flask, render_template, g, request, redirect, url_for, session
+from flask import Flask, render_template, g, request, redirect, url_for, session, make_response
 from dotenv import load_dotenv
 import os
 import jwt
+import click
+from datetime import datetime, timedelta
 from src.auth import auth_blueprint
 from src.tasks import tasks_blueprint
 from src.calendar import calendar_blueprint
@@ -10,12 +12,28 @@ from src.budgeting import budgeting_blueprint
 from src.meals import meals_blueprint
 from src.messaging import messaging_blueprint
 from src.family import family_blueprint
+from src.notifications import notifications_blueprint
+from src.search import search_blueprint
+from src.jobs import jobs_blueprint
+from src import auth, family, tasks, calendar, budgeting, meals, messaging, notifications
 from src.utils.db import get_db
+from src.utils import mailer, message_store, jobs, llm_cache, openai_client
+from src.utils.openai_client import latency_histograms
+from src.utils.indexes import ensure_indexes, verify_query_plans
+from pymongo.errors import PyMongoError
+from src.utils.budget import rebuild_rollups
+from src.utils.notifications import rebuild_unread_counters
+from src.utils.dashboard import load_dashboard, section_percentiles
+from src.utils.identity import Identity
+from src.utils.migrations import migrate_task_comments, migrate_dates, migrate_read_cursors
+from src.utils.dates import format_date
+from src.utils.tokens import verify_token, refresh_token, StaleClaimsError
 
 load_dotenv()
 
 app = Flask(__name__)
 app.secret_key = "supersecretflaskkey"
+app.add_template_filter(format_date, "date")
 
 app.register_blueprint(auth_blueprint, url_prefix="/auth")
 app.register_blueprint(family_blueprint, url_prefix="/family")
@@ -24,24 +42,51 @@ app.register_blueprint(calendar_blueprint, url_prefix="/calendar")
 app.register_blueprint(budgeting_blueprint, url_prefix="/budget")
 app.register_blueprint(meals_blueprint, url_prefix="/meals")
 app.register_blueprint(messaging_blueprint, url_prefix="/messages")
+app.register_blueprint(notifications_blueprint, url_prefix="/notifications")
+app.register_blueprint(search_blueprint, url_prefix="/search")
+app.register_blueprint(jobs_blueprint, url_prefix="/jobs")
 
-JWT_SECRET = os.getenv("JWT_SECRET", "changeme")
-JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 db = get_db()
 
+MANIFEST_MODULES = [auth, family, tasks, calendar, budgeting, meals, messaging, notifications, mailer, message_store, jobs, llm_cache]
+
+if os.getenv("ENSURE_INDEXES_ON_STARTUP", "true").lower() == "true":
+    try:
+        ensure_indexes(db, MANIFEST_MODULES)
+    except PyMongoError as e:
+        app.logger.warning(f"Could not ensure indexes at startup: {e}")
+
+if os.getenv("OUTBOX_WORKER_IN_PROCESS", "false").lower() == "true":
+    mailer.start_outbox_worker()
+
+if os.getenv("JOB_WORKER_IN_PROCESS", "false").lower() == "true":
+    jobs.start_job_worker()
+
+if messaging.MESSAGE_CHANGE_STREAM:
+    messaging.start_message_relay()
+
 @app.before_request
 def load_user():
     g.user = None
+    g.identity = None
     token = session.get("jwt")
     if token:
         try:
-            payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-            g.user = payload
+            payload = verify_token(token)
+        except StaleClaimsError:
+            token, payload = refresh_token(token)
+            if not token:
+                session.pop("jwt", None)
+                return
+            session["jwt"] = token
         except jwt.ExpiredSignatureError:
             session.pop("jwt", None)
             return redirect(url_for("auth.login_user"))
         except jwt.InvalidTokenError:
             session.pop("jwt", None)
+            return
+        g.user = payload
+        g.identity = Identity(payload)
 
 @app.route("/")
 def home():
@@ -55,45 +100,142 @@ def dashboard():
     if not g.user:
         return redirect(url_for("auth.login_user"))
 
-    user_id = ObjectId(g.user["user_id"])
-    user = db.users.find_one({"_id": user_id})
-    family_id = ObjectId(g.user["family_id"])
-
-    tasks = []
-    if user.get("shared_features", {}).get("tasks", True):
-        tasks = list(db.tasks.find({"family_id": family_id, "status": "incomplete"}).sort("due_date", 1).limit(5))
-
-    events = list(db.events.find({"family_id": family_id, "visibility": "family"}).sort("date", 1).limit(5))
-
-    messages = []
-    if user.get("shared_features", {}).get("meals", True):
-        messages = list(db.messages.find({"family_id": family_id}).sort("timestamp", -1).limit(5))
-        messages.reverse()
-
-    total_expenses = 0
-    if user.get("shared_features", {}).get("budget", True):
-        categories = list(db.budget_categories.find({"family_id": family_id}))
-        for cat in categories:
-            cat_id = cat["_id"]
-            cat_expenses = db.expenses.find({"family_id": family_id, "category_id": cat_id})
-            cat_total = sum(e["amount"] for e in cat_expenses)
-            total_expenses += cat_total
-    else:
-        categories = []
+    user = g.identity.user
+    sections, timings, degraded = load_dashboard(user)
+    email_not_verified = not user.get("email_verified", False)
 
-    meal_plan = None
-    if user.get("shared_features", {}).get("meals", True):
-        meal_plan = db.meal_plans.find_one({"family_id": family_id}, sort=[("week_start", -1)])
+    response = make_response(render_template("dashboard.html",
+                                             tasks=sections["tasks"],
+                                             events=sections["events"],
+                                             messages=sections["messages"],
+                                             total_expenses=sections["total_expenses"],
+                                             meal_plan=sections["meal_plan"],
+                                             degraded=degraded,
+                                             email_not_verified=email_not_verified))
+    response.headers["Server-Timing"] = ", ".join(f"{name};dur={ms:.1f}" for name, ms in timings.items())
+    return response
+
+@app.route("/dashboard/timings")
+def dashboard_timings():
+    if not g.user:
+        return redirect(url_for("auth.login_user"))
+    return section_percentiles()
 
-    email_not_verified = not user.get("email_verified", False)
+@app.route("/llm/cache-stats")
+def llm_cache_stats():
+    if not g.user:
+        return redirect(url_for("auth.login_user"))
+    return llm_cache.cache_stats()
 
-    return render_template("dashboard.html",
-                           tasks=tasks,
-                           events=events,
-                           messages=messages,
-                           total_expenses=total_expenses,
-                           meal_plan=meal_plan,
-                           email_not_verified=email_not_verified)
+@app.route("/llm/latency")
+def llm_latency():
+    if not g.user:
+        return redirect(url_for("auth.login_user"))
+    return {"endpoints": latency_histograms(), "breaker": openai_client.client.breaker.state}
+
+@app.cli.command("rebuild-budget-rollups")
+@click.option("--family-id", default=None, help="Only rebuild this family's rollups.")
+@click.option("--batch-size", default=1000, show_default=True)
+def rebuild_budget_rollups(family_id, batch_size):
+    """Recompute budget_rollups from the expenses collection."""
+    scanned, written = rebuild_rollups(ObjectId(family_id) if family_id else None, batch_size)
+    click.echo(f"Scanned {scanned} expenses, wrote {written} rollups.")
+
+@app.cli.command("rebuild-notification-counters")
+@click.option("--batch-size", default=1000, show_default=True)
+def rebuild_notification_counters(batch_size):
+    """Recompute per-user unread notification counters from the notifications collection."""
+    counted, reset = rebuild_unread_counters(batch_size)
+    click.echo(f"Recounted {counted} users with unread notifications, reset {reset} counters to 0.")
+
+@app.cli.command("migrate-task-comments")
+@click.option("--batch-size", default=500, show_default=True)
+def migrate_task_comments_command(batch_size):
+    """Move embedded task comments into the task_comments collection."""
+    tasks_migrated, comments_moved = migrate_task_comments(batch_size)
+    click.echo(f"Migrated {tasks_migrated} tasks, moved {comments_moved} comments.")
+
+@app.cli.command("migrate-dates")
+@click.option("--batch-size", default=500, show_default=True)
+def migrate_dates_command(batch_size):
+    """Convert string dates on events, tasks and expenses to BSON datetimes."""
+    for collection, (converted, failed) in migrate_dates(batch_size).items():
+        click.echo(f"{collection}: converted {converted}, could not parse {failed}.")
+
+@app.cli.command("migrate-read-cursors")
+@click.option("--batch-size", default=500, show_default=True)
+def migrate_read_cursors_command(batch_size):
+    """Replace per-message read_by arrays with per-user read cursors."""
+    processed, updates = migrate_read_cursors(batch_size)
+    click.echo(f"Processed {processed} messages, wrote {updates} read cursor updates.")
+
+@app.cli.command("compact-messages")
+@click.option("--older-than-days", default=30, show_default=True,
+              help="Fold messages older than this; use 0 right after switching to bucketed storage.")
+@click.option("--batch-size", default=1000, show_default=True)
+def compact_messages_command(older_than_days, batch_size):
+    """Fold per-message documents into day buckets (MESSAGE_STORAGE=bucketed only)."""
+    if message_store.MESSAGE_STORAGE != "bucketed":
+        raise click.ClickException("Set MESSAGE_STORAGE=bucketed first; the documents layout does not read buckets.")
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    moved, written = message_store.compact_messages(cutoff, batch_size)
+    click.echo(f"Moved {moved} messages into {written} buckets.")
+
+@app.cli.command("mail-worker")
+@click.option("--once", is_flag=True, help="Drain what is due and exit instead of polling forever.")
+def mail_worker(once):
+    """Deliver queued emails from the outbox."""
+    worker = mailer.OutboxWorker()
+    if once:
+        total = 0
+        try:
+            while True:
+                sent = worker.drain_once()
+                if not sent:
+                    break
+                total += sent
+        finally:
+            worker.session.close()
+        click.echo(f"Handled {total} queued emails.")
+    else:
+        worker.run()
+
+@app.cli.command("job-worker")
+@click.option("--processes", default=1, show_default=True, help="Worker processes to run.")
+@click.option("--once", is_flag=True, help="Run the jobs that are due and exit instead of polling forever.")
+def job_worker(processes, once):
+    """Run queued background jobs (meal plans, transcriptions)."""
+    if once:
+        worker = jobs.JobWorker()
+        total = 0
+        while worker.run_one():
+            total += 1
+        click.echo(f"Ran {total} jobs.")
+    elif processes > 1:
+        for p in jobs.start_worker_processes(processes):
+            p.join()
+    else:
+        jobs.JobWorker().run()
+
+@app.cli.command("ensure-indexes")
+def ensure_indexes_command():
+    """Create the indexes declared by every blueprint manifest."""
+    created, failed = ensure_indexes(db, MANIFEST_MODULES)
+    click.echo(f"Ensured {len(created)} indexes.")
+    for name in failed:
+        click.echo(f"FAILED: {name}")
+    if failed:
+        raise SystemExit(1)
+
+@app.cli.command("verify-query-plans")
+def verify_query_plans_command():
+    """Explain every registered query shape and fail if any of them scans a whole collection."""
+    failures = verify_query_plans(db, MANIFEST_MODULES)
+    for collection, query, sort in failures:
+        click.echo(f"COLLSCAN: {collection}.find({query}) sort={sort}")
+    if failures:
+        raise SystemExit(1)
+    click.echo("All query shapes use an index.")
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=8000, debug=True)
@@ -0,0 +1,84 @@
+# benchmarks/budget_summary.py
+"""Compare the old per-category expense scan with the rollup-backed budget summary.
+
+Usage: MONGODB_URI=mongodb://localhost:27017 python -m benchmarks.budget_summary
+Seeds a throwaway database, so never point it at production.
+"""
+import os
+import random
+import time
+from datetime import datetime
+from bson.objectid import ObjectId
+from pymongo import MongoClient, monitoring
+
+from src.utils import budget
+
+BENCH_DB = os.getenv("BENCH_DB", "home_management_bench")
+SIZES = [(5, 50), (20, 500), (50, 5000)]  # (categories, expenses per category)
+RUNS = 20
+
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def seed(db, n_categories, n_expenses):
+    family_id = ObjectId()
+    cat_ids = db.budget_categories.insert_many([
+        {"family_id": family_id, "name": f"cat-{i}", "limit": 1000.0} for i in range(n_categories)
+    ]).inserted_ids
+    for cat_id in cat_ids:
+        db.expenses.insert_many([
+            {"family_id": family_id, "category_id": cat_id, "amount": round(random.uniform(1, 100), 2),
+             "date": datetime(2024, 1, 1), "description": ""} for _ in range(n_expenses)
+        ])
+    return family_id
+
+
+def legacy_summary(db, family_id):
+    total_expenses = 0
+    for cat in db.budget_categories.find({"family_id": family_id}):
+        cat_expenses = db.expenses.find({"family_id": family_id, "category_id": cat["_id"]})
+        total_expenses += sum(e["amount"] for e in cat_expenses)
+    return total_expenses
+
+
+def measure(fn, counter):
+    counter.count = 0
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        fn()
+    elapsed = (time.perf_counter() - start) / RUNS
+    return counter.count / RUNS, elapsed * 1000
+
+
+def main():
+    counter = CommandCounter()
+    client = MongoClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017"), event_listeners=[counter])
+    client.drop_database(BENCH_DB)
+    db = client[BENCH_DB]
+    budget.db = db
+
+    print(f"{'categories':>10} {'expenses':>9} | {'legacy trips':>12} {'legacy ms':>10} | {'rollup trips':>12} {'rollup ms':>9}")
+    for n_categories, n_expenses in SIZES:
+        family_id = seed(db, n_categories, n_expenses)
+        budget.rebuild_rollups(family_id)
+        legacy_trips, legacy_ms = measure(lambda: legacy_summary(db, family_id), counter)
+        rollup_trips, rollup_ms = measure(lambda: budget.budget_summary(family_id), counter)
+        print(f"{n_categories:>10} {n_categories * n_expenses:>9} | {legacy_trips:>12.1f} {legacy_ms:>10.2f} | {rollup_trips:>12.1f} {rollup_ms:>9.2f}")
+
+    client.drop_database(BENCH_DB)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# benchmarks/ics_import.py
+"""Time ICS import: full-model versus streaming parse (time and peak memory), then one
+insert_one per event versus chunked unordered bulk upserts. Finally imports a weekly series
+with one moved occurrence and checks the original slot no longer shows.
+
+Usage: MONGODB_URI=mongodb://localhost:27017 python -m benchmarks.ics_import [n_events]
+Seeds a throwaway database, so never point it at production.
+"""
+import io
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from bson.objectid import ObjectId
+from pymongo import MongoClient
+
+from src import calendar
+try:
+    from ics import Calendar
+except ImportError:  # no longer a dependency; install ics==0.7 to compare against the old parser
+    Calendar = None
+from src.utils.ics_stream import read_vevents
+
+BENCH_DB = os.getenv("BENCH_DB", "home_management_bench")
+
+
+def generate_ics(n_events):
+    """A school-calendar sized VCALENDAR with n_events one-hour events."""
+    start = datetime(2024, 9, 1, 8, 0)
+    lines = ["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//myte//bench//EN"]
+    for i in range(n_events):
+        begin = start + timedelta(hours=i * 5)
+        lines += [
+            "BEGIN:VEVENT",
+            f"UID:bench-{i}@myte.example",
+            f"DTSTAMP:{start:%Y%m%dT%H%M%SZ}",
+            f"DTSTART:{begin:%Y%m%dT%H%M%SZ}",
+            f"DTEND:{begin + timedelta(hours=1):%Y%m%dT%H%M%SZ}",
+            f"SUMMARY:Event {i}",
+            f"DESCRIPTION:Generated event number {i}",
+            "END:VEVENT",
+        ]
+    lines.append("END:VCALENDAR")
+    return "\r\n".join(lines) + "\r\n"
+
+
+# A weekly series whose second occurrence moved to Wednesday. The override comes first,
+# as some exporters write it, so excluding its original slot cannot depend on file order.
+MOVED_OCCURRENCE_ICS = "\r\n".join([
+    "BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//myte//bench//EN",
+    "BEGIN:VEVENT", "UID:piano@myte.example", "RECURRENCE-ID:20240909T160000",
+    "DTSTART:20240911T170000", "SUMMARY:Piano (moved)", "END:VEVENT",
+    "BEGIN:VEVENT", "UID:piano@myte.example", "DTSTART:20240902T160000",
+    "RRULE:FREQ=WEEKLY;COUNT=4", "SUMMARY:Piano", "END:VEVENT",
+    "END:VCALENDAR", ""
+])
+
+
+def to_event_docs(ics_bytes, family_id, user_id):
+    return [dict(ev,
+                 family_id=family_id,
+                 user_id=user_id,
+                 category="imported",
+                 visibility="family",
+                 recurrence="none",
+                 color="#0000FF") for ev in read_vevents(io.BytesIO(ics_bytes))]
+
+
+def measure(label, fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{label}: {elapsed:.2f}s, peak {peak / 1e6:.1f} MB")
+    return result
+
+
+def main():
+    n_events = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    client = MongoClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017"))
+    client.drop_database(BENCH_DB)
+    db = client[BENCH_DB]
+    calendar.db = db
+    db.events.create_indexes(calendar.INDEXES["events"])
+
+    ics_bytes = generate_ics(n_events).encode("utf-8")
+    print(f"{n_events} events, {len(ics_bytes) / 1e6:.1f} MB")
+    if Calendar is not None:
+        measure("ics.Calendar parse (full model)", lambda: len(Calendar(ics_bytes.decode("utf-8")).events))
+    # Counting without keeping the dicts is what the import route's chunked writes see.
+    measure("streaming parse (discarded)   ", lambda: sum(1 for _ in read_vevents(io.BytesIO(ics_bytes))))
+    docs = to_event_docs(ics_bytes, ObjectId(), ObjectId())
+
+    start = time.perf_counter()
+    for doc in docs:
+        db.events.insert_one(dict(doc, family_id=ObjectId()))
+    print(f"insert_one loop:          {time.perf_counter() - start:.2f}s, {len(docs)} round trips")
+
+    family_id = ObjectId()
+    for chunk_size in (100, 500, 2000):
+        db.events.delete_many({"family_id": family_id})
+        start = time.perf_counter()
+        counts = calendar.upsert_events([dict(d, family_id=family_id) for d in docs], chunk_size)
+        trips = -(-len(docs) // chunk_size)
+        print(f"bulk upsert (chunk {chunk_size:>4}): {time.perf_counter() - start:.2f}s, {trips} round trips, {counts}")
+
+    start = time.perf_counter()
+    counts = calendar.upsert_events([dict(d, family_id=family_id) for d in docs])
+    print(f"re-import (idempotent):   {time.perf_counter() - start:.2f}s, {counts}")
+
+    family_id = ObjectId()
+    overrides = []
+    series = [dict(ev, family_id=family_id, recurrence=ev["rrule"]["freq"] if ev["rrule"] else "none") for ev in read_vevents(io.BytesIO(MOVED_OCCURRENCE_ICS.encode()), overrides=overrides)]
+    calendar.upsert_events(series)
+    calendar.exclude_overridden(family_id, overrides)
+    window = (datetime(2024, 9, 1), datetime(2024, 10, 1))
+    shown = calendar.expand_events(db.events.find(calendar.window_query(family_id, *window)), *window)
+    print("moved occurrence:", ", ".join(f"{e['title']} {e['date']:%a %d %H:%M}" for e in shown))
+
+    client.drop_database(BENCH_DB)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# benchmarks/llm_cache.py
+"""Exercise the meal-plan LLM cache against the local OpenAI stub.
+
+Fires concurrent identical generate_meals calls (one upstream call expected), repeats them
+(all cache hits), then changes the preference order (still a hit) and forces a refresh.
+
+Usage: MONGODB_URI=mongodb://localhost:27017 python -m benchmarks.llm_cache [concurrency] [latency_seconds]
+Uses a throwaway database; never point it at production.
+"""
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pymongo import MongoClient
+
+from benchmarks import openai_stub
+from src.utils import openai_client, llm_cache
+from src.utils.openai_client import generate_meals
+
+BENCH_DB = os.getenv("BENCH_DB", "home_management_bench")
+STUB_PORT = int(os.getenv("STUB_PORT", 8089))
+PREFERENCES = {"dietary_restrictions": ["nut-free"], "common_likes": ["salmon", "broccoli"],
+               "common_dislikes": ["onions"], "servings": 4}
+WEEK_START = "2024-09-02"
+
+
+def burst(label, concurrency, preferences, refresh=False):
+    served = openai_stub.StubHandler.requests_served
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        responses = list(pool.map(lambda _: generate_meals(preferences, WEEK_START, refresh=refresh), range(concurrency)))
+    print(f"{label:>22}: {time.perf_counter() - start:5.2f}s, {concurrency} calls, "
+          f"{openai_stub.StubHandler.requests_served - served} upstream, {len(set(responses))} distinct responses")
+
+
+def main():
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    server = openai_stub.serve(STUB_PORT, latency)
+    openai_client.client = openai_client.OpenAIClient(base_url=f"http://127.0.0.1:{STUB_PORT}/v1", api_key="stub")
+    client = MongoClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017"))
+    client.drop_database(BENCH_DB)
+    # The cache uses the module-level database handle.
+    llm_cache.db = client[BENCH_DB]
+
+    burst("concurrent, cold", concurrency, PREFERENCES)
+    burst("repeat", concurrency, PREFERENCES)
+    reordered = dict(PREFERENCES, common_likes=list(reversed(PREFERENCES["common_likes"])))
+    burst("reordered preferences", concurrency, reordered)
+    burst("refresh", 1, PREFERENCES, refresh=True)
+    print(llm_cache.cache_stats())
+
+    client.drop_database(BENCH_DB)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# benchmarks/meal_images.py
+"""Time image generation for a 21-meal plan: one by one, on the pool, and from the image cache.
+
+Usage: MONGODB_URI=mongodb://localhost:27017 python -m benchmarks.meal_images [latency_seconds]
+Runs against benchmarks.openai_stub on a local port, so no API key is used. Images are stored in
+a throwaway database; never point it at production.
+"""
+import json
+import os
+import sys
+import time
+from pymongo import MongoClient
+
+from benchmarks import openai_stub
+from src.utils import openai_client, meal_images
+from src.utils.openai_client import generate_image
+
+BENCH_DB = os.getenv("BENCH_DB", "home_management_bench")
+STUB_PORT = int(os.getenv("STUB_PORT", 8089))
+
+
+def timed(label, fn):
+    served = openai_stub.StubHandler.requests_served
+    start = time.perf_counter()
+    fn()
+    print(f"{label:>12}: {time.perf_counter() - start:6.2f}s, "
+          f"{openai_stub.StubHandler.requests_served - served} image requests")
+
+
+def main():
+    latency = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    server = openai_stub.serve(STUB_PORT, latency)
+    openai_client.client = openai_client.OpenAIClient(base_url=f"http://127.0.0.1:{STUB_PORT}/v1", api_key="stub")
+    client = MongoClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017"))
+    client.drop_database(BENCH_DB)
+    # The image cache uses the module-level database handle.
+    meal_images.db = client[BENCH_DB]
+    meals = json.loads(openai_stub.meal_plan())["meals"]
+    print(f"{len(meals)} meals, {latency}s per image, {meal_images._executor._max_workers} workers")
+
+    meal_images.assign_image_keys(meals)
+
+    timed("sequential", lambda: [generate_image(m["name"], m["description"]) for m in meals])
+    timed("pool, cold", lambda: meal_images.generate_missing(meals, deadline=None))
+    timed("pool, cached", lambda: meal_images.generate_missing(meals, deadline=None))
+
+    client.drop_database(BENCH_DB)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
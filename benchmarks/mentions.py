@@ -0,0 +1,59 @@
+# benchmarks/mentions.py
+"""Micro-benchmark of the compiled mention matcher against the old word-by-member scan.
+
+Usage: python -m benchmarks.mentions
+Pure Python; no database needed.
+"""
+import random
+import string
+import timeit
+from bson.objectid import ObjectId
+
+from src.utils.mentions import MentionIndex
+
+FAMILY_SIZES = [6, 50, 500]
+MESSAGE_WORDS = [50, 1000, 20000]
+MENTION_RATE = 0.05
+
+
+def legacy_parse_mentions(text, family_members):
+    mentions = []
+    for w in text.split():
+        if w.startswith("@"):
+            username = w[1:]
+            for m in family_members:
+                if m.get("username") == username:
+                    mentions.append(str(m["_id"]))
+    return mentions
+
+
+def make_family(size):
+    return [{"_id": ObjectId(), "username": f"user{i}_{''.join(random.choices(string.ascii_lowercase, k=4))}"} for i in range(size)]
+
+
+def make_message(members, n_words):
+    words = []
+    for _ in range(n_words):
+        if random.random() < MENTION_RATE:
+            words.append("@" + random.choice(members)["username"] + random.choice(["", ",", "!", "."]))
+        else:
+            words.append("".join(random.choices(string.ascii_lowercase, k=random.randint(2, 9))))
+    return " ".join(words)
+
+
+def main():
+    print(f"{'members':>7} {'words':>6} | {'legacy ms':>10} {'compiled ms':>12} {'build ms':>9}")
+    for size in FAMILY_SIZES:
+        members = make_family(size)
+        build_ms = timeit.timeit(lambda: MentionIndex(members), number=20) / 20 * 1000
+        index = MentionIndex(members)
+        for n_words in MESSAGE_WORDS:
+            text = make_message(members, n_words)
+            runs = max(1, 2000 // n_words)
+            legacy_ms = timeit.timeit(lambda: legacy_parse_mentions(text, members), number=runs) / runs * 1000
+            compiled_ms = timeit.timeit(lambda: index.match(text), number=runs) / runs * 1000
+            print(f"{size:>7} {n_words:>6} | {legacy_ms:>10.3f} {compiled_ms:>12.3f} {build_ms:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# benchmarks/message_storage.py
+"""Compare write throughput and recent-history reads for per-message documents and day buckets.
+
+Usage: MONGODB_URI=mongodb://localhost:27017 python -m benchmarks.message_storage [n_messages]
+Writes n_messages (default 50k) through each store into a throwaway database spread over
+N_FAMILIES families, then times the messages page read of the latest 50. Never point it at production.
+"""
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from bson.objectid import ObjectId
+from pymongo import MongoClient
+
+from src import messaging
+from src.utils import message_store
+
+BENCH_DB = os.getenv("BENCH_DB", "home_management_bench")
+N_FAMILIES = 50
+READS = 500
+
+
+def write(store, families, n_messages):
+    rng = random.Random(3)
+    start_time = datetime(2024, 1, 1)
+    start = time.perf_counter()
+    for i in range(n_messages):
+        store.insert({
+            "family_id": families[i % N_FAMILIES],
+            "sender_id": ObjectId(),
+            "recipient_ids": [ObjectId()],
+            "content": f"message {i} " + "x" * rng.randrange(20, 120),
+            "timestamp": start_time + timedelta(seconds=30 * i)
+        })
+    return n_messages / (time.perf_counter() - start)
+
+
+def read(store, families):
+    start = time.perf_counter()
+    for i in range(READS):
+        store.latest(families[i % N_FAMILIES], 50)
+    return (time.perf_counter() - start) / READS
+
+
+def main():
+    n_messages = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    client = MongoClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017"))
+    client.drop_database(BENCH_DB)
+    db = client[BENCH_DB]
+    # The stores use the module-level database handle.
+    message_store.db = db
+    db.messages.create_indexes(messaging.INDEXES["messages"])
+    db.message_buckets.create_indexes(message_store.INDEXES["message_buckets"])
+    families = [ObjectId() for _ in range(N_FAMILIES)]
+
+    for label, store in [("documents", message_store.DocumentStore()), ("bucketed", message_store.BucketStore())]:
+        rate = write(store, families, n_messages)
+        latency = read(store, families)
+        collection = "messages" if label == "documents" else "message_buckets"
+        stats = db.command("collstats", collection)
+        print(f"{label:>9}: {rate:,.0f} writes/s, latest 50 in {latency * 1000:.2f} ms, "
+              f"{db[collection].estimated_document_count():,} documents, "
+              f"{(stats['size'] + stats['totalIndexSize']) / 1e6:.1f} MB with indexes")
+
+    client.drop_database(BENCH_DB)
+
+
+if __name__ == "__main__":
+    main()
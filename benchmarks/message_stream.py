@@ -0,0 +1,66 @@
+# benchmarks/message_stream.py
+"""Cost of idle message streams, and fan-out latency when one message is published.
+
+Each subscriber is a thread blocked on its Subscription, as a /messages/stream request is.
+Compare the idle CPU with what the same number of clients polling every few seconds would cost.
+
+Usage: python -m benchmarks.message_stream [n_subscribers] [idle_seconds]
+Pure Python; no database needed.
+"""
+import resource
+import sys
+import threading
+import time
+
+from src.utils.pubsub import Broker
+
+TOPIC = "messages:bench"
+
+
+def subscriber(broker, ready, received, stop):
+    with broker.subscribe(TOPIC) as sub:
+        ready.release()
+        while not stop.is_set():
+            payload = sub.get(timeout=15)
+            if payload is not None:
+                received.append(time.perf_counter() - payload["sent"])
+
+
+def main():
+    n_subscribers = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    idle_seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    broker = Broker()
+    ready = threading.Semaphore(0)
+    received = []
+    stop = threading.Event()
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    threads = [threading.Thread(target=subscriber, args=(broker, ready, received, stop), daemon=True)
+               for _ in range(n_subscribers)]
+    for t in threads:
+        t.start()
+    for _ in threads:
+        ready.acquire()
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"{n_subscribers} idle subscribers, peak RSS +{(rss_after - rss_before) / 1024:.1f} MB")
+
+    cpu = time.process_time()
+    time.sleep(idle_seconds)
+    print(f"CPU while idle for {idle_seconds:.0f}s: {(time.process_time() - cpu) * 1000:.1f} ms")
+
+    broker.publish(TOPIC, {"sent": time.perf_counter()})
+    deadline = time.monotonic() + 10
+    while len(received) < n_subscribers and time.monotonic() < deadline:
+        time.sleep(0.01)
+    latencies = sorted(received)
+    print(f"fan-out to {len(latencies)} subscribers: "
+          f"p50 {latencies[len(latencies) // 2] * 1000:.2f} ms, max {latencies[-1] * 1000:.2f} ms")
+
+    stop.set()
+    broker.publish(TOPIC, {"sent": time.perf_counter()})  # wake subscribers so they exit
+    for t in threads:
+        t.join()
+
+
+if __name__ == "__main__":
+    main()
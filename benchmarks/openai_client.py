@@ -0,0 +1,62 @@
+# benchmarks/openai_client.py
+"""Drive the shared OpenAI client against the local stub with injected failures.
+
+Sends concurrent image requests while the stub fails a share of them with 429/503, reports how
+many succeeded after retries and the latency histogram. Then every request fails, showing the
+circuit breaker turning repeated failures into immediate errors, and the stub recovers.
+
+Usage: python -m benchmarks.openai_client [n_calls] [error_rate] [latency_seconds]
+No database or API key needed.
+"""
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import openai_stub
+from src.utils.openai_client import CircuitBreaker, OpenAIClient, OpenAIError
+
+STUB_PORT = int(os.getenv("STUB_PORT", 8089))
+
+
+def call(client):
+    try:
+        client.post("/images/generations", 5, json={"prompt": "soup", "response_format": "b64_json"})
+        return True
+    except OpenAIError:
+        return False
+
+
+def main():
+    n_calls = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    error_rate = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+    latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.05
+    server = openai_stub.serve(STUB_PORT, latency, error_rate)
+    client = OpenAIClient(base_url=f"http://127.0.0.1:{STUB_PORT}/v1", api_key="stub",
+                          breaker=CircuitBreaker(failures=5, reset_seconds=2))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(16) as pool:
+        ok = sum(pool.map(lambda _: call(client), range(n_calls)))
+    print(f"{n_calls} calls at {error_rate:.0%} injected errors: {ok} succeeded, "
+          f"{openai_stub.StubHandler.requests_served} upstream requests, {time.perf_counter() - start:.2f}s")
+    for endpoint, stats in client.histogram.snapshot().items():
+        filled = {k: v for k, v in stats["buckets"].items() if v}
+        print(f"{endpoint}: {stats['count']} requests, mean {stats['mean_ms']:.1f} ms, {filled}")
+
+    openai_stub.StubHandler.error_rate = 1.0
+    for i in range(8):
+        start = time.perf_counter()
+        ok = call(client)
+        print(f"outage, call {i + 1}: {'ok' if ok else 'failed'} in {(time.perf_counter() - start) * 1000:.0f} ms, "
+              f"breaker {client.breaker.state}")
+
+    openai_stub.StubHandler.error_rate = 0.0
+    time.sleep(client.breaker.reset_seconds)
+    print(f"recovered, breaker {client.breaker.state}: call {'ok' if call(client) else 'failed'}, "
+          f"breaker {client.breaker.state}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# benchmarks/openai_stub.py
+"""A local stand-in for the OpenAI endpoints the app calls, with configurable latency.
+
+Usage: python -m benchmarks.openai_stub [--port 8089] [--latency 2.0] [--error-rate 0.2]
+then run the app or a benchmark with OPENAI_API_BASE=http://localhost:8089/v1.
+Images are a 1x1 PNG whose pixel depends on the prompt; completions are a fixed 21-meal plan.
+With an error rate, that share of requests gets a 503 or a 429 instead.
+"""
+import argparse
+import base64
+import hashlib
+import json
+import random
+import struct
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+DISHES = ["Oatmeal with Berries", "Chicken Caesar Wrap", "Spaghetti Bolognese"]
+
+
+def png(seed):
+    """A valid 1x1 RGB PNG coloured from seed."""
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    pixel = hashlib.sha256(seed.encode()).digest()[:3]
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", 1, 1, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(b"\x00" + pixel)) + chunk(b"IEND", b""))
+
+
+def meal_plan():
+    meals = [{"day": day, "name": dish, "servings": 4, "ingredients": ["salt"], "instructions": "Cook.",
+              "description": f"{dish} for {day}"} for day in DAYS for dish in DISHES]
+    return json.dumps({"week_start": "2024-01-01", "meals": meals})
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps connections open, as the API does, so client connection reuse shows up.
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    error_rate = 0.0
+    requests_served = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length)
+        with StubHandler.lock:
+            StubHandler.requests_served += 1
+        time.sleep(self.latency)
+        if random.random() < self.error_rate:
+            self.send_response(random.choice([429, 503]))
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        now = int(time.time())
+        if self.path.endswith("/images/generations"):
+            prompt = json.loads(raw or b"{}").get("prompt", "")
+            self._reply({"created": now, "data": [{"b64_json": base64.b64encode(png(prompt)).decode()}]})
+        elif self.path.endswith("/chat/completions"):
+            self._reply({"id": "stub", "object": "chat.completion", "created": now, "choices": [
+                {"index": 0, "message": {"role": "assistant", "content": meal_plan()}, "finish_reason": "stop"}]})
+        elif self.path.endswith("/completions"):
+            self._reply({"id": "stub", "object": "text_completion", "created": now, "choices": [
+                {"index": 0, "text": meal_plan(), "finish_reason": "stop"}]})
+        elif self.path.endswith("/audio/transcriptions"):
+            self._reply({"text": "I like broccoli but I hate onions"})
+        else:
+            self.send_error(404)
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def serve(port=8089, latency=0.0, error_rate=0.0):
+    """Start the stub on a daemon thread and return the server; call shutdown() to stop it."""
+    StubHandler.latency = latency
+    StubHandler.error_rate = error_rate
+    server = StubServer(("127.0.0.1", port), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=2.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    StubHandler.latency = args.latency
+    StubHandler.error_rate = args.error_rate
+    print(f"OpenAI stub on http://127.0.0.1:{args.port}/v1 ({args.latency}s per request, "
+          f"{args.error_rate:.0%} errors)")
+    StubServer(("127.0.0.1", args.port), StubHandler).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
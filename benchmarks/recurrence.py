@@ -0,0 +1,50 @@
+# benchmarks/recurrence.py
+"""Time expanding a busy family's recurring series for a year view, cold and from the LRU.
+
+Usage: python -m benchmarks.recurrence [n_series]
+Pure Python; no database needed.
+"""
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from src.utils.recurrence import FREQUENCIES, expand, make_rule, occurrence_dates
+
+
+def make_series(n_series):
+    rng = random.Random(7)
+    events = []
+    for i in range(n_series):
+        start = datetime(2019, 1, 1, 8) + timedelta(days=rng.randrange(5 * 365))
+        events.append({
+            "title": f"Series {i}",
+            "date": start,
+            "time": "08:00",
+            "rrule": make_rule(rng.choice(FREQUENCIES), rng.choice([1, 1, 2])),
+            "exdates": []
+        })
+    return events
+
+
+def year_view(events):
+    return sum(len(expand(e, datetime(2024, 1, 1), datetime(2025, 1, 1))) for e in events)
+
+
+def main():
+    n_series = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    events = make_series(n_series)
+
+    occurrence_dates.cache_clear()
+    start = time.perf_counter()
+    total = year_view(events)
+    print(f"{n_series} series -> {total} occurrences in a year view")
+    print(f"cold expansion:   {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    start = time.perf_counter()
+    year_view(events)
+    print(f"cached expansion: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
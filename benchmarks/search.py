@@ -0,0 +1,91 @@
+# benchmarks/search.py
+"""Compare the old unanchored $regex event search with the family-prefixed text index.
+
+Usage: MONGODB_URI=mongodb://localhost:27017 python -m benchmarks.search [n_documents]
+Seeds a throwaway database with n_documents events (default 100k) spread over 500 families,
+so never point it at production.
+"""
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from bson.objectid import ObjectId
+from pymongo import MongoClient
+
+from src import calendar
+from src.utils.search import text_query
+
+BENCH_DB = os.getenv("BENCH_DB", "home_management_bench")
+N_FAMILIES = 500
+WORDS = ("piano soccer dentist swim school recital birthday dinner grocery practice lesson match "
+         "doctor meeting homework library karate concert vet haircut").split()
+QUERIES = ["piano", "dentist appointment", "karate"]
+REPEATS = 20
+
+
+def seed(db, n_documents):
+    rng = random.Random(42)
+    families = [ObjectId() for _ in range(N_FAMILIES)]
+    start = datetime(2024, 1, 1)
+    batch = []
+    for i in range(n_documents):
+        batch.append({
+            "family_id": families[i % N_FAMILIES],
+            "title": " ".join(rng.sample(WORDS, 2)).title(),
+            "description": " ".join(rng.choices(WORDS, k=12)),
+            "date": start + timedelta(hours=rng.randrange(24 * 365)),
+            "time": "09:00",
+            "category": "general",
+        })
+        if len(batch) == 5000:
+            db.events.insert_many(batch)
+            batch = []
+    if batch:
+        db.events.insert_many(batch)
+    return families
+
+
+def regex_query(family_id, search):
+    return {"family_id": family_id, "$or": [
+        {"title": {"$regex": search, "$options": "i"}},
+        {"description": {"$regex": search, "$options": "i"}}
+    ]}
+
+
+def run(db, label, build, families):
+    examined = 0
+    start = time.perf_counter()
+    for i in range(REPEATS):
+        for search in QUERIES:
+            family_id = families[i % len(families)]
+            list(db.events.find(build(family_id, search)))
+    elapsed = (time.perf_counter() - start) / (REPEATS * len(QUERIES))
+    for search in QUERIES:
+        stats = db.events.find(build(families[0], search)).explain()["executionStats"]
+        examined += stats["totalDocsExamined"]
+    print(f"{label}: {elapsed * 1000:.2f} ms/query, {examined / len(QUERIES):.0f} docs examined/query")
+
+
+def main():
+    n_documents = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    client = MongoClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017"))
+    client.drop_database(BENCH_DB)
+    db = client[BENCH_DB]
+    families = seed(db, n_documents)
+    print(f"Seeded {n_documents} events across {N_FAMILIES} families")
+
+    # The regex path as it ran before: (family_id, date) is the only index it could use.
+    db.events.create_index([("family_id", 1), ("date", 1)])
+    run(db, "$regex (family_id index)", regex_query, families)
+
+    start = time.perf_counter()
+    db.events.create_indexes(calendar.INDEXES["events"])
+    print(f"Built manifest indexes in {time.perf_counter() - start:.1f}s")
+    run(db, "$text (family-prefixed)", text_query, families)
+
+    client.drop_database(BENCH_DB)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,36 @@
 # src/auth.py
 from datetime import datetime, timedelta
-import jwt
-import os
 import secrets
 from flask import Blueprint, request, render_template, redirect, url_for, session, flash, g
 from passlib.context import CryptContext
 from bson.objectid import ObjectId
-from src.utils.mailer import send_email
+from pymongo import IndexModel, ASCENDING
+from src.utils.mailer import queue_email
 from src.utils.db import get_db
+from src.utils.tokens import mint_token
+from src.utils.mentions import invalidate_mentions
 from dotenv import load_dotenv
 
 load_dotenv()
 
 auth_blueprint = Blueprint("auth", __name__)
 db = get_db()
-JWT_SECRET = os.getenv("JWT_SECRET", "changeme")
-JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+INDEXES = {
+    "users": [
+        IndexModel([("email", ASCENDING)], unique=True),
+        IndexModel([("email_verification_token", ASCENDING)], sparse=True),
+        IndexModel([("password_reset_token", ASCENDING)], sparse=True),
+    ],
+}
+QUERY_SHAPES = [
+    ("users", {"email": "someone@example.com"}, None),
+    ("users", {"email_verification_token": "token"}, None),
+    ("users", {"password_reset_token": "token"}, None),
+]
+
 @auth_blueprint.route("/register", methods=["GET", "POST"])
 def register_user():
     if request.method == "POST":
@@ -74,6 +86,7 @@ def register_user():
 
         user_id = db.users.insert_one(new_user).inserted_id
         db.families.update_one({"_id": family_id}, {"$push": {"members": user_id}})
+        invalidate_mentions(family_id)
 
         verification_token = secrets.token_urlsafe(32)
         db.users.update_one({"_id": user_id}, {"$set": {
@@ -83,7 +96,7 @@ def register_user():
 
         verify_url = url_for("auth.verify_email", token=verification_token, _external=True)
         email_body = f"Welcome to Myte Home Assistant!\n\nPlease verify your email by clicking this link: {verify_url}"
-        send_email(email, "Verify your email - Myte Home Assistant", email_body)
+        queue_email(email, "Verify your email - Myte Home Assistant", email_body)
         flash("Registration successful! Please check your email for a verification link.")
         return redirect(url_for("auth.login_user"))
 
@@ -99,14 +112,7 @@ def login_user():
         if not user or not pwd_context.verify(password, user["hashed_password"]):
             return render_template("login.html", error="Invalid credentials")
 
-        payload = {
-            "sub": user["email"],
-            "user_id": str(user["_id"]),
-            "family_id": str(user["family_id"]),
-            "exp": datetime.utcnow() + timedelta(hours=1)
-        }
-        access_token = jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
-        session["jwt"] = access_token
+        session["jwt"] = mint_token(user)
         return redirect(url_for("home"))
 
     return render_template("login.html")
@@ -131,7 +137,7 @@ def verify_email(token):
 def resend_verification():
     if not g.user:
         return redirect(url_for("auth.login_user"))
-    user = db.users.find_one({"_id": ObjectId(g.user["user_id"])})
+    user = g.identity.user
     if user.get("email_verified", False):
         flash("Your email is already verified.")
         return redirect(url_for("home"))
@@ -139,7 +145,7 @@ def resend_verification():
     db.users.update_one({"_id": user["_id"]}, {"$set": {"email_verification_token": new_token}})
     verify_url = url_for("auth.verify_email", token=new_token, _external=True)
     email_body = f"Please verify your email: {verify_url}"
-    send_email(user["email"], "Resend: Verify your email", email_body)
+    queue_email(user["email"], "Resend: Verify your email", email_body)
     flash("Verification email resent!")
     return redirect(url_for("home"))
 
@@ -158,7 +164,7 @@ def request_password_reset():
             }})
             reset_url = url_for("auth.reset_password", token=reset_token, _external=True)
             email_body = f"Reset your password by clicking here: {reset_url}\nIf you didn't request this, ignore."
-            send_email(user["email"], "Password Reset - Myte Home Assistant", email_body)
+            queue_email(user["email"], "Password Reset - Myte Home Assistant", email_body)
         flash("If that email exists, a reset link has been sent.")
         return redirect(url_for("auth.login_user"))
     return render_template("request_password_reset.html")
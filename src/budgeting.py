@@ -1,12 +1,25 @@
 # src/budgeting.py
 from flask import Blueprint, g, redirect, url_for, render_template, request, flash
 from bson.objectid import ObjectId
+from pymongo import IndexModel, ASCENDING
 from src.utils.db import get_db
-from datetime import datetime
+from src.utils.budget import budget_summary, record_expense
+from src.utils.dates import parse_date, start_of_day
 
 budgeting_blueprint = Blueprint("budgeting", __name__)
 db = get_db()
 
+INDEXES = {
+    "budget_categories": [IndexModel([("family_id", ASCENDING)])],
+    "budget_rollups": [IndexModel([("family_id", ASCENDING), ("category_id", ASCENDING), ("month", ASCENDING)])],
+    "expenses": [IndexModel([("family_id", ASCENDING), ("category_id", ASCENDING), ("date", ASCENDING)])],
+}
+QUERY_SHAPES = [
+    ("budget_categories", {"family_id": ObjectId()}, None),
+    ("budget_rollups", {"family_id": ObjectId()}, None),
+    ("expenses", {"family_id": ObjectId()}, None),
+]
+
 def login_required(f):
     def wrapper(*args, **kwargs):
         if not g.user:
@@ -19,17 +32,8 @@ def login_required(f):
 @login_required
 def budgeting_home():
     family_id = ObjectId(g.user["family_id"])
-    categories = list(db.budget_categories.find({"family_id": family_id}))
-    total_expenses = 0
-    category_sums = {}
-    for cat in categories:
-        cat_id = cat["_id"]
-        cat_expenses = db.expenses.find({"family_id": family_id, "category_id": cat_id})
-        cat_total = sum(e["amount"] for e in cat_expenses)
-        category_sums[str(cat_id)] = {"name": cat["name"], "total": cat_total, "limit": cat["limit"]}
-        total_expenses += cat_total
-
-    return render_template("budget_home.html", categories=categories, category_sums=category_sums, total=total_expenses)
+    summary = budget_summary(family_id)
+    return render_template("budget_home.html", categories=summary["categories"], category_sums=summary["category_sums"], total=summary["total"])
 
 @budgeting_blueprint.route("/add_category", methods=["GET","POST"])
 @login_required
@@ -54,9 +58,13 @@ def add_expense():
     if request.method == "POST":
         category_id = request.form.get("category_id")
         amount = float(request.form.get("amount"))
-        date = request.form.get("date", datetime.utcnow().strftime("%Y-%m-%d"))
+        try:
+            date = parse_date(request.form.get("date")) or start_of_day()
+        except ValueError:
+            flash("Date must be YYYY-MM-DD.")
+            return redirect(url_for("budgeting.add_expense"))
         description = request.form.get("description", "")
-        db.expenses.insert_one({
+        record_expense({
             "family_id": family_id,
             "category_id": ObjectId(category_id),
             "amount": amount,
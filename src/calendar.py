@@ -1,14 +1,152 @@
-from flask import Blueprint, render_template, request, redirect, url_for, g, flash, send_file
+from flask import Blueprint, render_template, request, redirect, url_for, g, flash, jsonify, current_app
 from bson.objectid import ObjectId
+from pymongo import IndexModel, ASCENDING, TEXT, InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
 from datetime import datetime, timedelta
+from itertools import islice
 from src.utils.db import get_db
-from ics import Calendar, Event as ICSEvent
-import io
-from src.utils.mailer import send_email
+import os
+from src.utils.mailer import queue_emails
+from src.utils.ics_stream import read_vevents
+from src.utils.recurrence import make_rule, expand
+from src.utils.ics_export import iter_calendar, feed_cache, EXPORT_PROJECTION
+from src.utils.http_cache import is_fresh, set_validators
+from src.utils.dates import parse_date, start_of_day, day_range
+from src.utils.search import text_query
 
 db = get_db()
 calendar_blueprint = Blueprint("calendar", __name__)
 
+INDEXES = {
+    "events": [
+        IndexModel([("family_id", ASCENDING), ("date", ASCENDING)]),
+        IndexModel([("family_id", ASCENDING), ("visibility", ASCENDING), ("date", ASCENDING)]),
+        IndexModel([("family_id", ASCENDING), ("ics_uid", ASCENDING)], unique=True,
+                   partialFilterExpression={"ics_uid": {"$type": "string"}}),
+        # Recurring series only, so the "started before the window ends" branch stays small.
+        IndexModel([("family_id", ASCENDING), ("rrule.freq", ASCENDING), ("date", ASCENDING)],
+                   partialFilterExpression={"rrule.freq": {"$exists": True}}),
+        IndexModel([("family_id", ASCENDING), ("title", TEXT), ("description", TEXT)],
+                   weights={"title": 3}, name="events_text"),
+    ],
+}
+QUERY_SHAPES = [
+    ("events", {"family_id": ObjectId()}, [("date", ASCENDING)]),
+    ("events", {"family_id": ObjectId(), "date": {"$gte": datetime(2024, 1, 1), "$lt": datetime(2025, 1, 1)}}, [("date", ASCENDING)]),
+    ("events", {"family_id": ObjectId(), "visibility": "family"}, [("date", ASCENDING)]),
+    ("events", {"family_id": ObjectId(), "rrule.freq": {"$exists": True}, "date": {"$lt": datetime(2025, 1, 1)}}, [("date", ASCENDING)]),
+    ("events", {"family_id": ObjectId(), "$text": {"$search": "piano"}}, None),
+]
+
+EVENT_WRITE_CHUNK_SIZE = int(os.getenv("EVENT_WRITE_CHUNK_SIZE", 500))
+# Fields an ICS re-import refreshes; everything else keeps what the family set after the first import.
+# exdates are merged rather than replaced, so occurrences skipped in the app stay skipped.
+ICS_SYNCED_FIELDS = ["title", "date", "time", "description", "recurrence", "rrule"]
+# How far ahead recurring series are expanded when a view gives no end date.
+RECURRENCE_WINDOW_DAYS = int(os.getenv("RECURRENCE_WINDOW_DAYS", 90))
+# Only what the calendar widget renders.
+FULLCALENDAR_PROJECTION = {"title": 1, "date": 1, "time": 1, "description": 1, "color": 1, "rrule": 1, "exdates": 1}
+
+def chunked(iterable, size):
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+def upsert_events(events, chunk_size=EVENT_WRITE_CHUNK_SIZE, failures=None):
+    """Write events in unordered bulk_write chunks. Events with an ics_uid are upserted on
+       (family_id, ics_uid) so re-importing a calendar is idempotent, with their exdates added to
+       the stored ones; the rest are inserted.
+       Writes rejected for any reason other than a duplicate-key race are counted as failed and
+       appended to `failures` as (ics_uid or title, message).
+       Returns {"inserted", "updated", "skipped", "failed"} counts.
+    """
+    failures = [] if failures is None else failures
+    counts = {"inserted": 0, "updated": 0, "skipped": 0, "failed": 0}
+    for chunk in chunked(events, chunk_size):
+        ops = []
+        for e in chunk:
+            if e.get("ics_uid"):
+                synced = {f: e[f] for f in ICS_SYNCED_FIELDS}
+                ops.append(UpdateOne(
+                    {"family_id": e["family_id"], "ics_uid": e["ics_uid"]},
+                    {"$set": synced,
+                     "$addToSet": {"exdates": {"$each": e.get("exdates") or []}},
+                     "$setOnInsert": {k: v for k, v in e.items() if k not in synced and k != "exdates"}},
+                    upsert=True
+                ))
+            else:
+                ops.append(InsertOne(e))
+        try:
+            result = db.events.bulk_write(ops, ordered=False).bulk_api_result
+        except BulkWriteError as e:
+            result = e.details
+            for error in result["writeErrors"]:
+                # Two concurrent imports can race on the same UID; the loser's write is skipped.
+                if error["code"] == 11000:
+                    counts["skipped"] += 1
+                    continue
+                counts["failed"] += 1
+                event = chunk[error["index"]]
+                failures.append((event.get("ics_uid") or event.get("title", ""), error["errmsg"]))
+        counts["inserted"] += result["nInserted"] + result["nUpserted"]
+        counts["updated"] += result["nModified"]
+        counts["skipped"] += result["nMatched"] - result["nModified"]
+    return counts
+
+def exclude_overridden(family_id, overrides):
+    """Add each overridden occurrence's original start to its series' exdates, so a moved or edited
+       occurrence only shows as its override. overrides is [(series ics_uid, original start)], as
+       collected by read_vevents. Returns the number of series changed.
+    """
+    starts = {}
+    for uid, original in overrides:
+        starts.setdefault(uid, set()).add(original)
+    ops = [UpdateOne({"family_id": family_id, "ics_uid": uid}, {"$addToSet": {"exdates": {"$each": sorted(originals)}}})
+           for uid, originals in starts.items()]
+    if not ops:
+        return 0
+    return db.events.bulk_write(ops, ordered=False).modified_count
+
+def bump_calendar_version(family_id):
+    """Record that a family's events changed. Call after every event write."""
+    db.calendar_versions.update_one(
+        {"_id": family_id},
+        {"$inc": {"version": 1}, "$set": {"updated_at": datetime.utcnow()}},
+        upsert=True
+    )
+
+def calendar_version(family_id):
+    """(version, updated_at) of a family's events; (0, None) if they were never written through the app."""
+    doc = db.calendar_versions.find_one({"_id": family_id}) or {}
+    return doc.get("version", 0), doc.get("updated_at")
+
+def window_query(family_id, start, end):
+    """Events that can have an occurrence in [start, end): one-offs dated inside it and
+       series that began before it ends. Each $or branch carries family_id so both use an index.
+    """
+    return {"$or": [
+        {"family_id": family_id, "date": {"$gte": start, "$lt": end}},
+        {"family_id": family_id, "rrule.freq": {"$exists": True}, "date": {"$lt": end}}
+    ]}
+
+def expand_events(events, start, end):
+    """Replace each recurring series with its occurrences in [start, end), sorted by start time."""
+    expanded = []
+    for e in events:
+        if e.get("rrule"):
+            expanded.extend(expand(e, start, end))
+        else:
+            expanded.append(e)
+    expanded.sort(key=lambda e: e["date"])
+    return expanded
+
+def rule_from_form(form):
+    recurrence = form.get("recurrence", "none")
+    return recurrence, make_rule(recurrence, form.get("interval"), form.get("until"), form.get("count"))
+
 def login_required(f):
     def wrapper(*args, **kwargs):
         if not g.user:
@@ -28,25 +166,29 @@ def view_calendar():
     start_date = request.args.get("start_date", "")
     end_date = request.args.get("end_date", "")
 
-    query = {"family_id": family_id}
-
+    # Recurring series are expanded from the start date (or today) for RECURRENCE_WINDOW_DAYS unless an end is given.
+    try:
+        window_start = start_of_day(start_date)
+        window_end = start_of_day(end_date) + timedelta(days=1) if end_date else window_start + timedelta(days=RECURRENCE_WINDOW_DAYS)
+        # Date filtering
+        date_filter = day_range(start_date, end_date)
+    except ValueError:
+        flash("Dates must be YYYY-MM-DD.")
+        return redirect(url_for("calendar.view_calendar"))
+    series = {"rrule.freq": {"$exists": True}, "date": {"$lt": window_end}}
     if search:
-        query["$or"] = [
-            {"title": {"$regex": search, "$options": "i"}},
-            {"description": {"$regex": search, "$options": "i"}}
-        ]
+        # $text has to sit at the top level beside family_id to use the family-prefixed text index.
+        query = text_query(family_id, search)
+        if date_filter:
+            query["$or"] = [{"date": date_filter}, series]
+    elif date_filter:
+        query = {"$or": [{"family_id": family_id, "date": date_filter}, dict(series, family_id=family_id)]}
+    else:
+        query = {"family_id": family_id}
     if category:
         query["category"] = category
 
-    # Date filtering
-    if start_date and end_date:
-        query["date"] = {"$gte": start_date, "$lte": end_date}
-    elif start_date:
-        query["date"] = {"$gte": start_date}
-    elif end_date:
-        query["date"] = {"$lte": end_date}
-
-    events = list(db.events.find(query).sort("date", 1))
+    events = expand_events(db.events.find(query), window_start, window_end)
     # Convert ObjectIds to strings
     for ev in events:
         ev["_id"] = str(ev["_id"])
@@ -71,51 +213,40 @@ def add_event():
     if request.method == "POST":
         title = request.form.get("title")
         date = request.form.get("date")
-        time = request.form.get("time", "00:00")
+        time = request.form.get("time") or "00:00"
         description = request.form.get("description", "")
         category = request.form.get("category", "general")
         visibility = request.form.get("visibility", "family")
-        recurrence = request.form.get("recurrence", "none")
         color = request.form.get("color", "#378006")
+        try:
+            recurrence, rrule = rule_from_form(request.form)
+            start = parse_date(date, time)
+        except ValueError:
+            flash("Dates must be YYYY-MM-DD, times HH:MM and repeat counts whole numbers.")
+            return redirect(url_for("calendar.add_event"))
 
         new_event = {
             "family_id": family_id,
             "user_id": user_id,
             "title": title,
-            "date": date,
+            "date": start,
             "time": time,
             "description": description,
             "category": category,
             "visibility": visibility,
-            "recurrence": recurrence,
+            "recurrence": recurrence if rrule else "none",
+            "rrule": rrule,
+            "exdates": [],
             "color": color
         }
-
-        inserted_ids = []
-        if recurrence in ["daily", "weekly", "monthly"]:
-            base_date = datetime.strptime(date, "%Y-%m-%d")
-            increments = {
-                "daily": 1,
-                "weekly": 7,
-                "monthly": 30
-            }
-            for i in range(4):
-                dt = base_date + timedelta(days=increments[recurrence] * i)
-                ev = new_event.copy()
-                ev["date"] = dt.strftime("%Y-%m-%d")
-                inserted_id = db.events.insert_one(ev).inserted_id
-                inserted_ids.append(inserted_id)
-        else:
-            inserted_id = db.events.insert_one(new_event).inserted_id
-            inserted_ids.append(inserted_id)
+        db.events.insert_one(new_event)
+        bump_calendar_version(family_id)
 
         # Send email notifications to family members after creating events
-        family = db.families.find_one({"_id": family_id})
-        members = db.users.find({"_id": {"$in": family["members"]}})
+        members = g.identity.members
         subject = "New Event(s) Added"
         body = f"Hello,\n\nNew event(s) have been added to your family calendar:\n\nTitle: {title}\nDate: {date} {time}\nDescription: {description}\n\nLogin to view more details."
-        for m in members:
-            send_email(m["email"], subject, body)
+        queue_emails([(m["email"], subject, body) for m in members])
 
         flash("Event(s) added and family notified!")
         return redirect(url_for("calendar.view_calendar"))
@@ -134,19 +265,29 @@ def edit_event(event_id):
     if request.method == "POST":
         title = request.form.get("title")
         date = request.form.get("date")
-        time = request.form.get("time")
+        time = request.form.get("time") or event.get("time", "00:00")
         description = request.form.get("description", "")
         category = request.form.get("category", "general")
         color = request.form.get("color", "#378006")
+        try:
+            recurrence, rrule = rule_from_form(request.form)
+            start = parse_date(date, time)
+        except ValueError:
+            flash("Dates must be YYYY-MM-DD, times HH:MM and repeat counts whole numbers.")
+            return redirect(url_for("calendar.edit_event", event_id=event_id))
 
+        # Edits apply to the whole series; skipped dates are kept.
         db.events.update_one({"_id": obj_id}, {"$set": {
             "title": title,
-            "date": date,
+            "date": start,
             "time": time,
             "description": description,
             "category": category,
-            "color": color
+            "color": color,
+            "recurrence": recurrence if rrule else "none",
+            "rrule": rrule
         }})
+        bump_calendar_version(family_id)
         flash("Event updated!")
         return redirect(url_for("calendar.view_calendar"))
 
@@ -160,26 +301,60 @@ def delete_event(event_id):
     obj_id = ObjectId(event_id)
     result = db.events.delete_one({"_id": obj_id, "family_id": family_id})
     if result.deleted_count:
+        bump_calendar_version(family_id)
         flash("Event deleted!")
     else:
         flash("Event not found.")
     return redirect(url_for("calendar.view_calendar"))
 
+@calendar_blueprint.route("/skip/<event_id>/<date>", methods=["POST"])
+@login_required
+def skip_occurrence(event_id, date):
+    """Drop one occurrence from a recurring series by adding it to the series' exception dates."""
+    family_id = ObjectId(g.user["family_id"])
+    try:
+        day = start_of_day(date)
+    except ValueError:
+        flash("Dates must be YYYY-MM-DD.")
+        return redirect(request.referrer or url_for("calendar.view_calendar"))
+    result = db.events.update_one(
+        {"_id": ObjectId(event_id), "family_id": family_id, "rrule.freq": {"$exists": True}},
+        {"$addToSet": {"exdates": day}}
+    )
+    if result.modified_count:
+        bump_calendar_version(family_id)
+    flash("Occurrence skipped." if result.matched_count else "Event not found.")
+    return redirect(request.referrer or url_for("calendar.view_calendar"))
+
 @calendar_blueprint.route("/events_api")
 @login_required
 def events_api():
     family_id = ObjectId(g.user["family_id"])
-    events = list(db.events.find({"family_id": family_id}))
+    # FullCalendar sends the visible range as ISO timestamps with an exclusive end; only the dates matter here.
+    end = request.args.get("end", "")[:10]
+    try:
+        window_start = start_of_day(request.args.get("start", "")[:10])
+        window_end = start_of_day(end) if end else window_start + timedelta(days=RECURRENCE_WINDOW_DAYS)
+    except ValueError:
+        return jsonify({"error": "start and end must be ISO dates"}), 400
+
+    version, updated_at = calendar_version(family_id)
+    etag = f"{family_id}-{version}-{window_start:%Y%m%d}-{window_end:%Y%m%d}"
+    if is_fresh(etag, updated_at):
+        return set_validators(current_app.response_class(status=304), etag, updated_at)
+
+    query = window_query(family_id, window_start, window_end)
+    events = expand_events(db.events.find(query, FULLCALENDAR_PROJECTION), window_start, window_end)
     fullcal_events = []
     for e in events:
-        start = f"{e['date']}T{e['time']}"
         fullcal_events.append({
+            "id": str(e["_id"]),
             "title": e["title"],
-            "start": start,
+            "start": e["date"].strftime("%Y-%m-%dT%H:%M"),
             "description": e.get("description",""),
             "color": e.get("color", "#378006")
         })
-    return {"events": fullcal_events}
+    return set_validators(jsonify({"events": fullcal_events}), etag, updated_at)
 
 @calendar_blueprint.route("/import_ics", methods=["GET","POST"])
 @login_required
@@ -190,26 +365,32 @@ def import_ics():
             flash("No ICS file provided.")
             return redirect(url_for("calendar.view_calendar"))
 
-        data = file.read().decode("utf-8")
-        c = Calendar(data)
         family_id = ObjectId(g.user["family_id"])
-        for ev in c.events:
-            event_date = ev.begin.date().strftime("%Y-%m-%d")
-            event_time = ev.begin.time().strftime("%H:%M") if ev.begin.time() else "00:00"
-            new_event = {
-                "family_id": family_id,
-                "user_id": ObjectId(g.user["user_id"]),
-                "title": ev.name,
-                "date": event_date,
-                "time": event_time,
-                "description": ev.description if ev.description else "",
-                "category": "imported",
-                "visibility": "family",
-                "recurrence": "none",
-                "color": "#0000FF"
-            }
-            db.events.insert_one(new_event)
-        flash("ICS file imported successfully!")
+        user_id = ObjectId(g.user["user_id"])
+        errors = []
+        overrides = []
+        failures = []
+        new_events = ({
+            **ev,
+            "family_id": family_id,
+            "user_id": user_id,
+            "category": "imported",
+            "visibility": "family",
+            "recurrence": ev["rrule"]["freq"] if ev["rrule"] else "none",
+            "color": "#0000FF"
+        } for ev in read_vevents(file.stream, errors, overrides))
+        counts = upsert_events(new_events, failures=failures)
+        # After every chunk is written, so a series' own EXDATEs are in place and it exists whatever the file order.
+        if exclude_overridden(family_id, overrides) or counts["inserted"] or counts["updated"]:
+            bump_calendar_version(family_id)
+        flash(f"ICS file imported: {counts['inserted']} new, {counts['updated']} updated, {counts['skipped']} unchanged.")
+        if errors:
+            shown = "; ".join(f"line {line_no}: {message}" for line_no, message in errors[:5])
+            flash(f"Skipped {len(errors)} malformed event(s): {shown}")
+        if failures:
+            shown = "; ".join(f"{name}: {message}" for name, message in failures[:5])
+            current_app.logger.error(f"ICS import for family {family_id} could not save {len(failures)} event(s): {shown}")
+            flash(f"Could not save {len(failures)} event(s): {shown}")
         return redirect(url_for("calendar.view_calendar"))
 
     return render_template("import_ics.html")
@@ -218,17 +399,15 @@ def import_ics():
 @login_required
 def export_ics():
     family_id = ObjectId(g.user["family_id"])
-    events = list(db.events.find({"family_id": family_id}))
-    c = Calendar()
-    for e in events:
-        ev = ICSEvent()
-        dt_str = f"{e['date']} {e['time']}"
-        dt = datetime.strptime(dt_str, "%Y-%m-%d %H:%M")
-        ev.name = e["title"]
-        ev.begin = dt
-        ev.description = e.get("description", "")
-        c.events.add(ev)
-    output = io.StringIO(str(c))
-    mem = io.BytesIO(output.getvalue().encode('utf-8'))
-    mem.seek(0)
-    return send_file(mem, download_name="family_calendar.ics", as_attachment=True, mimetype="text/calendar")
+    version, updated_at = calendar_version(family_id)
+    etag = f"{family_id}-{version}"
+    if is_fresh(etag, updated_at):
+        return set_validators(current_app.response_class(status=304), etag, updated_at)
+
+    feed = feed_cache.get(family_id, version)
+    if feed is None:
+        events = db.events.find({"family_id": family_id}, EXPORT_PROJECTION)
+        feed = feed_cache.stream(family_id, version, iter_calendar(events))
+    response = current_app.response_class(feed, mimetype="text/calendar")
+    response.headers["Content-Disposition"] = "attachment; filename=family_calendar.ics"
+    return set_validators(response, etag, updated_at)
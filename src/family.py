@@ -1,31 +1,33 @@
 # src/family.py
 from flask import Blueprint, g, redirect, url_for, render_template, request, flash
 from bson.objectid import ObjectId
+from pymongo import IndexModel, ASCENDING
 from src.utils.db import get_db
 from src.utils.security import login_required
+from src.utils.tokens import bump_claims_version
+from src.utils.mentions import invalidate_mentions
 
 family_blueprint = Blueprint("family", __name__)
 db = get_db()
 
-def is_parent(user_id):
-    user = db.users.find_one({"_id": ObjectId(user_id)})
-    return user.get("role", "child") == "parent"
+INDEXES = {
+    "families": [IndexModel([("invite_code", ASCENDING)], unique=True)],
+    "groups": [IndexModel([("family_id", ASCENDING)])],
+}
+QUERY_SHAPES = [
+    ("families", {"invite_code": "code"}, None),
+    ("groups", {"family_id": ObjectId()}, None),
+]
 
 @family_blueprint.route("/members")
 @login_required
 def family_members():
-    family_id = ObjectId(g.user["family_id"])
-    family = db.families.find_one({"_id": family_id})
-    member_ids = family["members"]
-    members = list(db.users.find({"_id": {"$in": member_ids}}))
-    return render_template("family_members.html", members=members, family=family)
+    return render_template("family_members.html", members=g.identity.members, family=g.identity.family)
 
 @family_blueprint.route("/invite", methods=["GET","POST"])
 @login_required
 def invite_member():
-    family_id = ObjectId(g.user["family_id"])
-    family = db.families.find_one({"_id": family_id})
-    invite_code = family["invite_code"]
+    invite_code = g.identity.family["invite_code"]
     return render_template("invite_code.html", invite_code=invite_code)
 
 @family_blueprint.route("/search", methods=["GET","POST"])
@@ -47,20 +49,23 @@ def join_family(fid):
     if not family:
         flash("Family not found.")
         return redirect(url_for("family.search_family"))
-    user_id = ObjectId(g.user["user_id"])
-    user = db.users.find_one({"_id": user_id})
+    user_id = g.identity.user_id
+    user = g.identity.user
     if "original_family_id" not in user:
         db.users.update_one({"_id": user_id}, {"$set": {"original_family_id": user["family_id"]}})
     db.users.update_one({"_id": user_id}, {"$set": {"current_family_id": family["_id"], "family_id": family["_id"]}})
     db.families.update_one({"_id": family["_id"]}, {"$addToSet": {"members": user_id}})
+    bump_claims_version(user_id)
+    invalidate_mentions(family["_id"])
+    g.identity.refresh()
     flash("You have joined the family!")
     return redirect(url_for("family.family_members"))
 
 @family_blueprint.route("/preferences", methods=["GET","POST"])
 @login_required
 def update_preferences():
-    user_id = ObjectId(g.user["user_id"])
-    user = db.users.find_one({"_id": user_id})
+    user_id = g.identity.user_id
+    user = g.identity.user
     if request.method == "POST":
         tasks_shared = bool(request.form.get("tasks_shared"))
         meals_shared = bool(request.form.get("meals_shared"))
@@ -80,7 +85,7 @@ def update_preferences():
 def manage_groups():
     family_id = ObjectId(g.user["family_id"])
     if request.method == "POST":
-        if not is_parent(g.user["user_id"]):
+        if not g.identity.is_parent:
             flash("Only a parent can create groups.")
             return redirect(url_for("family.manage_groups"))
         group_name = request.form.get("group_name")
@@ -97,7 +102,7 @@ def manage_groups():
 @family_blueprint.route("/group/<group_id>/add_member", methods=["POST"])
 @login_required
 def add_group_member(group_id):
-    if not is_parent(g.user["user_id"]):
+    if not g.identity.is_parent:
         flash("Only a parent can manage groups.")
         return redirect(url_for("family.manage_groups"))
 
@@ -115,7 +120,7 @@ def add_group_member(group_id):
 @family_blueprint.route("/group/<group_id>/remove_member/<member_id>", methods=["POST"])
 @login_required
 def remove_group_member(group_id, member_id):
-    if not is_parent(g.user["user_id"]):
+    if not g.identity.is_parent:
         flash("Only a parent can manage groups.")
         return redirect(url_for("family.manage_groups"))
     family_id = ObjectId(g.user["family_id"])
@@ -0,0 +1,23 @@
+# src/jobs.py
+from flask import Blueprint, g, jsonify, abort
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from src.utils.db import get_db
+from src.utils.security import login_required
+from src.utils.jobs import public_status
+
+db = get_db()
+jobs_blueprint = Blueprint("jobs", __name__)
+
+@jobs_blueprint.route("/<job_id>", methods=["GET"])
+@login_required
+def job_status(job_id):
+    """Status and progress of one of the family's background jobs, for polling."""
+    try:
+        job = db.jobs.find_one({"_id": ObjectId(job_id), "family_id": g.identity.family_id},
+                               {"payload": 0})
+    except InvalidId:
+        job = None
+    if job is None:
+        abort(404)
+    return jsonify(public_status(job))
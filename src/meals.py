@@ -1,15 +1,30 @@
 # src/meals.py
-from flask import Blueprint, g, redirect, url_for, render_template, request, flash
+from flask import Blueprint, g, redirect, url_for, render_template, request, flash, abort, current_app
 from bson.objectid import ObjectId
-from datetime import datetime
+from pymongo import IndexModel, ASCENDING, DESCENDING
+from datetime import datetime, timedelta
 from werkzeug.utils import secure_filename
+import hashlib
+import json
 import os
 from src.utils.db import get_db
-from src.utils.openai_client import generate_meals, generate_image, transcribe_audio
+from src.utils.openai_client import generate_meals, transcribe_audio
+from src.utils.meal_images import assign_image_keys, generate_missing, image_data
+from src.utils.jobs import enqueue
+from src.utils.dates import start_of_day
 
 meals_blueprint = Blueprint("meals", __name__)
 db = get_db()
 
+INDEXES = {
+    "meal_plans": [IndexModel([("family_id", ASCENDING), ("week_start", DESCENDING)])],
+    "grocery_list": [IndexModel([("family_id", ASCENDING)], unique=True)],
+}
+QUERY_SHAPES = [
+    ("meal_plans", {"family_id": ObjectId()}, [("week_start", DESCENDING)]),
+    ("grocery_list", {"family_id": ObjectId()}, None),
+]
+
 def login_required(f):
     def wrapper(*args, **kwargs):
         if not g.user:
@@ -18,6 +33,11 @@ def login_required(f):
     wrapper.__name__ = f.__name__
     return wrapper
 
+def upcoming_week_start(today=None):
+    """The Monday a generated plan is for, as YYYY-MM-DD: today if it is a Monday, otherwise the next one."""
+    today = start_of_day(today)
+    return (today + timedelta(days=-today.weekday() % 7)).strftime("%Y-%m-%d")
+
 UPLOAD_FOLDER = "uploads"
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
@@ -26,10 +46,17 @@ if not os.path.exists(UPLOAD_FOLDER):
 @login_required
 def meals_home():
     family_id = ObjectId(g.user["family_id"])
-    plan = db.meal_plans.find_one({"family_id": family_id}, sort=[("week_start", -1)])
+    job_id = request.args.get("job")
+    plan = None
+    if job_id and ObjectId.is_valid(job_id):
+        # While a generation job runs, show the plan it produced.
+        job = db.jobs.find_one({"_id": ObjectId(job_id), "family_id": family_id}, {"progress.plan_id": 1})
+        if job and job.get("progress", {}).get("plan_id"):
+            plan = db.meal_plans.find_one({"_id": ObjectId(job["progress"]["plan_id"]), "family_id": family_id})
+    plan = plan or db.meal_plans.find_one({"family_id": family_id}, sort=[("week_start", -1)])
     grocery = db.grocery_list.find_one({"family_id": family_id})
     items = grocery["items"] if grocery else []
-    return render_template("meals_home.html", plan=plan, items=items)
+    return render_template("meals_home.html", plan=plan, items=items, job_id=job_id)
 
 @meals_blueprint.route("/create_plan", methods=["GET","POST"])
 @login_required
@@ -81,8 +108,8 @@ def remove_grocery_item(index):
 @login_required
 def voice_input():
     transcription = request.form.get("transcription", "")
-    user_id = ObjectId(g.user["user_id"])
-    user = db.users.find_one({"_id": user_id})
+    user_id = g.identity.user_id
+    user = g.identity.user
     likes = user.get("dietary_preferences", {}).get("likes", [])
     dislikes = user.get("dietary_preferences", {}).get("dislikes", [])
     if "salmon" not in likes:
@@ -106,13 +133,21 @@ def voice_input_audio():
     if audio_file.filename == '':
         flash("No selected file.")
         return redirect(url_for("meals.meals_home"))
-    filename = secure_filename(audio_file.filename)
+    # Unique names so uploads waiting for the worker never overwrite each other.
+    filename = f"{ObjectId()}_{secure_filename(audio_file.filename)}"
     audio_path = os.path.join(UPLOAD_FOLDER, filename)
     audio_file.save(audio_path)
+    job_id = enqueue("transcription", g.identity.family_id, g.identity.user_id, {"audio_path": audio_path})
+    flash("Processing your recording...")
+    return redirect(url_for("meals.meals_home", job=str(job_id)))
+
+def run_transcription_job(job, progress):
+    """Transcribe an uploaded recording and update the uploader's preferences from it."""
+    audio_path = job["payload"]["audio_path"]
     transcript = transcribe_audio(audio_path)
 
-    user_id = ObjectId(g.user["user_id"])
-    user = db.users.find_one({"_id": user_id})
+    user_id = job["user_id"]
+    user = db.users.find_one({"_id": user_id}, {"dietary_preferences": 1}) or {}
     likes = user.get("dietary_preferences", {}).get("likes", [])
     dislikes = user.get("dietary_preferences", {}).get("dislikes", [])
 
@@ -128,16 +163,21 @@ def voice_input_audio():
         "dietary_preferences.likes": likes,
         "dietary_preferences.dislikes": dislikes
     }})
+    return {"likes": likes, "dislikes": dislikes}
 
-    flash("Preferences updated from audio input!")
-    return redirect(url_for("meals.meals_home"))
+def discard_transcription_upload(job):
+    """Remove the recording of a transcription job once its result is recorded or it has failed for good."""
+    try:
+        os.remove(job["payload"]["audio_path"])
+    except FileNotFoundError:
+        pass
 
 @meals_blueprint.route("/generate", methods=["POST"])
 @login_required
 def generate_meal_plan():
     family_id = ObjectId(g.user["family_id"])
-    family = db.families.find_one({"_id": family_id})
-    members = db.users.find({"_id": {"$in": family["members"]}})
+    family = g.identity.family
+    members = g.identity.members
     restrictions = set()
     likes = set()
     dislikes = set()
@@ -151,30 +191,42 @@ def generate_meal_plan():
             dislikes.add(d)
 
     family_preferences = {
-        "dietary_restrictions": list(restrictions),
-        "common_likes": list(likes),
-        "common_dislikes": list(dislikes),
+        "dietary_restrictions": sorted(restrictions),
+        "common_likes": sorted(likes),
+        "common_dislikes": sorted(dislikes),
         "servings": len(family["members"])
     }
 
-    meal_plan_json = generate_meals(family_preferences)
-    try:
-        import json
-        meal_plan = json.loads(meal_plan_json)
-    except:
-        flash("Could not parse meal plan. Please try again.")
-        return redirect(url_for("meals.meals_home"))
-
-    # Add images to each meal
-    for meal in meal_plan.get("meals", []):
-        desc = meal.get("description", "")
-        image_url = generate_image(meal["name"], desc)
-        meal["image_url"] = image_url
-
-    meal_plan["family_id"] = family_id
-    db.meal_plans.insert_one(meal_plan)
-    flash("Meal plan generated with images!")
-    return redirect(url_for("meals.meals_home"))
+    week_start = upcoming_week_start()
+    # Parents clicking generate together share one job.
+    prefs_hash = hashlib.sha256(json.dumps(family_preferences, sort_keys=True).encode()).hexdigest()
+    job_id = enqueue("meal_plan", family_id, g.identity.user_id,
+                     {"family_preferences": family_preferences, "week_start": week_start,
+                      "refresh": bool(request.form.get("refresh"))},
+                     dedupe_key=f"meal_plan:{family_id}:{week_start}:{prefs_hash}")
+    flash("Generating your meal plan...")
+    return redirect(url_for("meals.meals_home", job=str(job_id)))
+
+def run_meal_plan_job(job, progress):
+    """Generate the plan text, save it so it can be shown, then fill in its images."""
+    progress(stage="text")
+    # An unparseable completion raises, and the job is retried.
+    payload = job["payload"]
+    week_start = payload.get("week_start") or upcoming_week_start()
+    meal_plan = json.loads(generate_meals(payload["family_preferences"], week_start, refresh=payload.get("refresh", False)))
+    meals = meal_plan.get("meals", [])
+    assign_image_keys(meals)
+    meal_plan["family_id"] = job["family_id"]
+    # The week the plan was asked for, whatever date the model wrote.
+    meal_plan["week_start"] = week_start
+    # Keyed by the job so a retried job replaces its own plan instead of adding another.
+    db.meal_plans.replace_one({"_id": job["_id"]}, meal_plan, upsert=True)
+    plan_id = str(job["_id"])
+
+    progress(stage="images", plan_id=plan_id, images_done=0, images_total=len(meals))
+    missing = generate_missing(meals, deadline=None,
+                               on_done=lambda done, total: progress(images_done=done, images_total=total))
+    return {"plan_id": plan_id, "missing_images": missing}
 
 @meals_blueprint.route("/details/<day>", methods=["GET"])
 @login_required
@@ -189,3 +241,14 @@ def meal_details(day):
         flash("Meal not found for this day.")
         return redirect(url_for("meals.meals_home"))
     return render_template("meal_details.html", meal=meal)
+
+@meals_blueprint.route("/images/<key>.png", methods=["GET"])
+@login_required
+def meal_image(key):
+    data = image_data(key)
+    if data is None:
+        abort(404)
+    response = current_app.response_class(data, mimetype="image/png")
+    # Keys are content hashes, so an image never changes.
+    response.headers["Cache-Control"] = "private, max-age=31536000, immutable"
+    return response
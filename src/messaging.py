@@ -1,29 +1,86 @@
 # src/messaging.py
-from flask import Blueprint, g, render_template, request, flash, redirect, url_for
+from flask import Blueprint, g, render_template, request, flash, redirect, url_for, jsonify, current_app
 from bson.objectid import ObjectId
+from pymongo import IndexModel, ASCENDING, DESCENDING, TEXT
 from datetime import datetime
+import json
+import logging
+import os
+import time
 from src.utils.db import get_db
 from src.utils.security import login_required
-from src.utils.notifications import parse_mentions, notify_mentions
+from src.utils.notifications import notify_mentions
+from src.utils.mentions import parse_mentions
+from src.utils.pagination import encode_time_cursor, decode_time_cursor, page_limit
+from src.utils.pubsub import broker, start_relay
+from src.utils import read_cursors
+from src.utils.message_store import message_store, MESSAGE_STORAGE
 
 db = get_db()
+logger = logging.getLogger(__name__)
 messaging_blueprint = Blueprint("messaging", __name__)
 
-def get_family_members(family_id):
-    family = db.families.find_one({"_id": family_id})
-    return list(db.users.find({"_id": {"$in": family["members"]}}))
+INDEXES = {
+    "messages": [
+        IndexModel([("family_id", ASCENDING), ("timestamp", DESCENDING)]),
+        IndexModel([("family_id", ASCENDING), ("content", TEXT)], name="messages_text"),
+        IndexModel([("family_id", ASCENDING), ("recipient_ids", ASCENDING), ("timestamp", ASCENDING)]),
+    ],
+    "read_cursors": [
+        IndexModel([("user_id", ASCENDING), ("family_id", ASCENDING)], unique=True),
+    ],
+}
+QUERY_SHAPES = [
+    ("messages", {"family_id": ObjectId()}, [("timestamp", DESCENDING)]),
+    ("messages", {"family_id": ObjectId(), "$text": {"$search": "dinner"}}, None),
+    ("messages", {"family_id": ObjectId(), "timestamp": {"$gt": datetime(2024, 1, 1)}}, [("timestamp", ASCENDING), ("_id", ASCENDING)]),
+    ("messages", {"family_id": ObjectId(), "recipient_ids": ObjectId(), "timestamp": {"$gt": datetime(2024, 1, 1)}}, None),
+    ("read_cursors", {"user_id": ObjectId(), "family_id": ObjectId()}, None),
+]
+
+FEED_PAGE_SIZE = 50
+MAX_FEED_PAGE_SIZE = 200
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", 15))
+# Streams are closed after this long; EventSource reconnects with Last-Event-ID and catches up.
+SSE_MAX_SECONDS = float(os.getenv("SSE_MAX_SECONDS", 300))
+# With several app processes, live delivery comes from the change stream relay started in app.py
+# rather than from the process that handled the send.
+MESSAGE_CHANGE_STREAM = os.getenv("MESSAGE_CHANGE_STREAM", "false").lower() == "true"
+
+def message_topic(family_id):
+    return f"messages:{family_id}"
+
+def serialize_message(m):
+    return {
+        "id": str(m["_id"]),
+        "sender_id": str(m["sender_id"]),
+        "content": m["content"],
+        "timestamp": m["timestamp"].isoformat(),
+        "cursor": encode_time_cursor(m)
+    }
+
+def messages_since(family_id, cursor, limit=FEED_PAGE_SIZE):
+    """Messages after a (timestamp, _id) cursor, oldest first. Without a cursor, the latest `limit` messages."""
+    if not cursor:
+        return message_store.latest(family_id, limit)
+    return message_store.since(family_id, cursor, limit)
+
+def sse_event(message):
+    return f"id: {message['cursor']}\nevent: message\ndata: {json.dumps(message)}\n\n"
 
 @messaging_blueprint.route("/", methods=["GET"])
 @login_required
 def messaging_home():
     family_id = ObjectId(g.user["family_id"])
-    messages = list(db.messages.find({"family_id": family_id}).sort("timestamp", -1).limit(50))
+    messages = message_store.latest(family_id, 50)
     for m in messages:
         m["_id"] = str(m["_id"])
         m["sender_id"] = str(m["sender_id"])
         m["recipient_ids"] = [str(r) for r in m.get("recipient_ids", [])]
-    messages.reverse()
-    return render_template("messaging_home.html", messages=messages)
+    cursor = encode_time_cursor(messages[-1]) if messages else ""
+    return render_template("messaging_home.html", messages=messages, cursor=cursor,
+                           last_read=read_cursors.last_read(g.identity.user_id, family_id),
+                           unread=read_cursors.unread_count(g.identity.user_id, family_id))
 
 @messaging_blueprint.route("/send", methods=["POST"])
 @login_required
@@ -38,12 +95,9 @@ def send_message():
         flash("Message cannot be empty.")
         return redirect(url_for("messaging.messaging_home"))
 
-    family_members = get_family_members(family_id)
-
     if recipient_type == "family":
         # send to entire family except sender
-        family = db.families.find_one({"_id": family_id})
-        recipient_ids = [m for m in family["members"] if m != sender_id]
+        recipient_ids = [m for m in g.identity.family["members"] if m != sender_id]
     elif recipient_type == "user":
         recipient_ids = [ObjectId(recipient_id)]
     elif recipient_type == "group":
@@ -53,16 +107,20 @@ def send_message():
         flash("Invalid recipient type.")
         return redirect(url_for("messaging.messaging_home"))
 
-    mentioned_user_ids = parse_mentions(content, family_members)
+    mentioned_user_ids = parse_mentions(content, family_id)
 
-    db.messages.insert_one({
+    # BSON stores milliseconds; truncate so the published cursor matches the stored document.
+    now = datetime.utcnow()
+    message = {
         "family_id": family_id,
         "sender_id": sender_id,
         "recipient_ids": recipient_ids,
         "content": content,
-        "timestamp": datetime.utcnow(),
-        "read_by": [sender_id]
-    })
+        "timestamp": now.replace(microsecond=now.microsecond // 1000 * 1000)
+    }
+    message_store.insert(message)
+    if not MESSAGE_CHANGE_STREAM:
+        broker.publish(message_topic(family_id), serialize_message(message))
 
     if mentioned_user_ids:
         msg = "You were mentioned in a new message."
@@ -74,9 +132,90 @@ def send_message():
 @messaging_blueprint.route("/read/<message_id>", methods=["POST"])
 @login_required
 def read_message(message_id):
+    """Mark this message, and everything before it, read."""
     family_id = ObjectId(g.user["family_id"])
-    user_id = ObjectId(g.user["user_id"])
-    db.messages.update_one({"_id": ObjectId(message_id), "family_id": family_id},
-                           {"$addToSet": {"read_by": user_id}})
+    message = message_store.get(family_id, message_id)
+    if message:
+        read_cursors.mark_read_through(g.identity.user_id, family_id, message["timestamp"])
     flash("Message marked as read")
     return redirect(url_for("messaging.messaging_home"))
+
+@messaging_blueprint.route("/read_all", methods=["POST"])
+@login_required
+def read_all_messages():
+    read_cursors.mark_all_read(g.identity.user_id, g.identity.family_id)
+    flash("All messages marked as read")
+    return redirect(url_for("messaging.messaging_home"))
+
+@messaging_blueprint.route("/unread_count", methods=["GET"])
+@login_required
+def message_unread_count():
+    return jsonify({"unread": read_cursors.unread_count(g.identity.user_id, g.identity.family_id)})
+
+@messaging_blueprint.route("/feed", methods=["GET"])
+@login_required
+def message_feed():
+    """JSON messages newer than `since` (a cursor from a previous response), oldest first.
+       Without `since`, the latest page. Query params: since, limit.
+    """
+    since = request.args.get("since")
+    try:
+        if since:
+            decode_time_cursor(since)
+        limit = page_limit(request.args.get("limit"), FEED_PAGE_SIZE, MAX_FEED_PAGE_SIZE)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    messages = [serialize_message(m) for m in messages_since(g.identity.family_id, since, limit)]
+    cursor = messages[-1]["cursor"] if messages else since
+    return jsonify({"messages": messages, "cursor": cursor, "has_more": len(messages) == limit})
+
+@messaging_blueprint.route("/stream", methods=["GET"])
+@login_required
+def message_stream():
+    """Server-Sent Events of new family messages. Catches up from `since` (or Last-Event-ID on
+       reconnect), then blocks until messages are published; idle streams only send heartbeats.
+    """
+    family_id = g.identity.family_id
+    start_cursor = request.headers.get("Last-Event-ID") or request.args.get("since")
+    if start_cursor:
+        try:
+            decode_time_cursor(start_cursor)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    def events():
+        cursor = start_cursor
+        deadline = time.monotonic() + SSE_MAX_SECONDS
+        # Subscribe before catching up so nothing sent during the catch-up query is missed.
+        with broker.subscribe(message_topic(family_id)) as sub:
+            yield "retry: 3000\n\n"
+            resync = bool(cursor)
+            while time.monotonic() < deadline:
+                if cursor and (resync or sub.overflowed):
+                    sub.overflowed = False
+                    batch = messages_since(family_id, cursor, MAX_FEED_PAGE_SIZE)
+                    for m in batch:
+                        payload = serialize_message(m)
+                        cursor = payload["cursor"]
+                        yield sse_event(payload)
+                    resync = len(batch) == MAX_FEED_PAGE_SIZE
+                    if resync:
+                        continue
+                payload = sub.get(timeout=SSE_HEARTBEAT_SECONDS)
+                if payload is None:
+                    yield ": keep-alive\n\n"
+                elif not cursor or decode_time_cursor(payload["cursor"]) > decode_time_cursor(cursor):
+                    cursor = payload["cursor"]
+                    yield sse_event(payload)
+
+    return current_app.response_class(events(), mimetype="text/event-stream",
+                                      headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def start_message_relay():
+    """Fan out messages inserted by any app process to this process's stream subscribers.
+       Only the documents layout is relayed; bucketed appends are updates, not inserts.
+    """
+    if MESSAGE_STORAGE == "bucketed":
+        logger.warning("MESSAGE_CHANGE_STREAM is not supported with bucketed message storage.")
+        return None
+    return start_relay(db.messages, lambda m: message_topic(m["family_id"]), serialize_message)
@@ -0,0 +1,65 @@
+# src/notifications.py
+from flask import Blueprint, g, request, jsonify
+from bson.objectid import ObjectId
+from pymongo import IndexModel, ASCENDING, DESCENDING
+from src.utils.db import get_db
+from src.utils.security import login_required
+from src.utils.pagination import encode_time_cursor, older_than, page_limit
+from src.utils.notifications import unread_count, mark_read, mark_all_read
+
+db = get_db()
+notifications_blueprint = Blueprint("notifications", __name__)
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+INDEXES = {
+    "notifications": [
+        IndexModel([("user_id", ASCENDING), ("read", ASCENDING), ("timestamp", DESCENDING)]),
+        IndexModel([("user_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)]),
+    ],
+}
+QUERY_SHAPES = [
+    ("notifications", {"user_id": ObjectId(), "read": False}, None),
+    ("notifications", {"user_id": ObjectId()}, [("timestamp", DESCENDING), ("_id", DESCENDING)]),
+]
+
+@notifications_blueprint.route("/", methods=["GET"])
+@login_required
+def notification_feed():
+    """Newest-first page of the user's notifications. Query params: before (cursor), limit, unread=1."""
+    query = {"user_id": g.identity.user_id}
+    if request.args.get("unread"):
+        query["read"] = False
+    try:
+        if request.args.get("before"):
+            query.update(older_than(request.args["before"]))
+        limit = page_limit(request.args.get("limit"), PAGE_SIZE, MAX_PAGE_SIZE)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    notifications = list(db.notifications.find(query, {"user_id": 0})
+                         .sort([("timestamp", DESCENDING), ("_id", DESCENDING)]).limit(limit + 1))
+    next_cursor = None
+    if len(notifications) > limit:
+        notifications = notifications[:limit]
+        next_cursor = encode_time_cursor(notifications[-1])
+    for n in notifications:
+        n["_id"] = str(n["_id"])
+    return jsonify({"notifications": notifications, "next_cursor": next_cursor, "unread": unread_count(g.identity.user_id)})
+
+@notifications_blueprint.route("/unread_count", methods=["GET"])
+@login_required
+def notification_unread_count():
+    return jsonify({"unread": unread_count(g.identity.user_id)})
+
+@notifications_blueprint.route("/read/<notification_id>", methods=["POST"])
+@login_required
+def read_notification(notification_id):
+    mark_read(g.identity.user_id, notification_id)
+    return jsonify({"unread": unread_count(g.identity.user_id)})
+
+@notifications_blueprint.route("/read_all", methods=["POST"])
+@login_required
+def read_all_notifications():
+    marked = mark_all_read(g.identity.user_id)
+    return jsonify({"marked": marked, "unread": unread_count(g.identity.user_id)})
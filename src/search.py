@@ -0,0 +1,50 @@
+# src/search.py
+from flask import Blueprint, g, render_template, request, jsonify, abort
+from src.utils.security import login_required
+from src.utils.search import search_family, SOURCES, SEARCH_PAGE_SIZE
+from src.utils.dates import format_date
+
+search_blueprint = Blueprint("search", __name__)
+
+def run_search(args):
+    """Shared by the page and the JSON endpoint. Query params: q, page, kind (events|tasks|messages).
+       Raises ValueError if page is not an integer.
+    """
+    terms = args.get("q", "").strip()
+    try:
+        page = max(1, int(args.get("page", 1)))
+    except ValueError:
+        raise ValueError("page must be an integer") from None
+    kind = args.get("kind", "")
+    if not terms:
+        return terms, page, kind, [], False
+
+    # Children only see their own tasks, as on the task list.
+    filters = {"tasks": {"assigned_to": g.identity.user_id}} if g.identity.role == "child" else None
+    hits, has_more = search_family(g.identity.family_id, terms, page, SEARCH_PAGE_SIZE,
+                                   collections=[kind] if kind in SOURCES else None, filters=filters)
+    senders = {m["_id"]: m.get("username") or m["email"] for m in g.identity.members} \
+        if any(h["kind"] == "message" for h in hits) else {}
+    for h in hits:
+        if h["kind"] == "message":
+            h["title"] = senders.get(h.pop("sender_id"), "")
+        h["date"] = format_date(h["date"])
+    return terms, page, kind, hits, has_more
+
+@search_blueprint.route("/", methods=["GET"])
+@login_required
+def search_home():
+    try:
+        terms, page, kind, hits, has_more = run_search(request.args)
+    except ValueError:
+        abort(400)
+    return render_template("search.html", q=terms, page=page, kind=kind, hits=hits, has_more=has_more)
+
+@search_blueprint.route("/api", methods=["GET"])
+@login_required
+def search_api():
+    try:
+        terms, page, kind, hits, has_more = run_search(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"q": terms, "page": page, "results": hits, "next_page": page + 1 if has_more else None})
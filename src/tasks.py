@@ -1,66 +1,165 @@
 # src/tasks.py
-from flask import Blueprint, request, render_template, redirect, url_for, g, flash, jsonify
+from flask import Blueprint, request, render_template, redirect, url_for, g, flash, jsonify, make_response, abort
 from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from pymongo import IndexModel, ASCENDING, DESCENDING, TEXT
 from datetime import datetime
+import base64
+import json
 from src.utils.db import get_db
-from src.utils.notifications import parse_mentions, notify_mentions
+from src.utils.notifications import notify_mentions
+from src.utils.mentions import parse_mentions
 from src.utils.security import login_required
+from src.utils.pagination import encode_time_cursor, older_than, page_limit
+from src.utils.dates import parse_date, format_date, start_of_day
 
 db = get_db()
 tasks_blueprint = Blueprint("tasks", __name__)
 
-def is_parent(user_id):
-    user = db.users.find_one({"_id": ObjectId(user_id)})
-    return user.get("role", "child") == "parent"
-
-def current_user_role():
-    user = db.users.find_one({"_id": ObjectId(g.user["user_id"])})
-    return user.get("role", "child")
+INDEXES = {
+    "tasks": [
+        IndexModel([("family_id", ASCENDING), ("due_date", ASCENDING)]),
+        IndexModel([("family_id", ASCENDING), ("assigned_to", ASCENDING), ("due_date", ASCENDING)]),
+        IndexModel([("family_id", ASCENDING), ("status", ASCENDING), ("due_date", ASCENDING)]),
+        IndexModel([("family_id", ASCENDING), ("title", TEXT), ("description", TEXT)],
+                   weights={"title": 3}, name="tasks_text"),
+    ],
+    "task_categories": [IndexModel([("family_id", ASCENDING)])],
+    "task_comments": [IndexModel([("task_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)])],
+}
+QUERY_SHAPES = [
+    ("tasks", {"family_id": ObjectId()}, [("due_date", ASCENDING)]),
+    ("tasks", {"family_id": ObjectId(), "assigned_to": ObjectId()}, [("due_date", ASCENDING)]),
+    ("tasks", {"family_id": ObjectId(), "status": "incomplete"}, [("due_date", ASCENDING)]),
+    ("tasks", {"family_id": ObjectId(), "$text": {"$search": "dishes"}}, None),
+    ("task_categories", {"family_id": ObjectId()}, None),
+    ("task_comments", {"task_id": ObjectId()}, [("timestamp", DESCENDING), ("_id", DESCENDING)]),
+]
+
+TASK_FIELDS = ["title", "description", "due_date", "status", "assigned_to", "priority", "category", "recurring",
+               "reminder_date", "comment_count", "last_comment"]
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+COMMENT_PAGE_SIZE = 20
+COMMENT_PREVIEW_LENGTH = 140
+
+def encode_cursor(task):
+    due_date = task["due_date"].isoformat() if task.get("due_date") else None
+    return base64.urlsafe_b64encode(json.dumps([due_date, task["_id"]]).encode()).decode()
+
+def decode_cursor(cursor):
+    """(due_date, _id) from a cursor. Raises ValueError if it was not made by encode_cursor."""
+    try:
+        due_date, task_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(due_date) if due_date else None, ObjectId(task_id)
+    except (ValueError, TypeError, InvalidId) as e:
+        raise ValueError("Invalid cursor") from e
+
+def after_cursor(due_date, task_id):
+    """Tasks sorting after (due_date, task_id). Undated tasks sort first, and $gt never crosses BSON types."""
+    if due_date is None:
+        return [{"due_date": {"$ne": None}}, {"due_date": None, "_id": {"$gt": task_id}}]
+    return [{"due_date": {"$gt": due_date}}, {"due_date": due_date, "_id": {"$gt": task_id}}]
+
+def comment_preview(comment):
+    """The denormalized last_comment kept on the task document."""
+    return {
+        "user_name": comment["user_name"],
+        "comment": comment["comment"][:COMMENT_PREVIEW_LENGTH],
+        "timestamp": comment["timestamp"]
+    }
 
-def get_family_members(family_id):
-    family = db.families.find_one({"_id": family_id})
-    return list(db.users.find({"_id": {"$in": family["members"]}}))
+def list_tasks(family_id, user_id, role, args):
+    """One page of tasks ordered by (due_date, _id), filtered and projected server-side.
+       Ids are stringified and `overdue` computed in the pipeline. Comments live in task_comments;
+       each task only carries its comment_count and last_comment preview. Returns (tasks, next_cursor).
+       Raises ValueError for a malformed cursor, limit or assigned_to.
+    """
+    query = {"family_id": family_id}
+    if role == "child":
+        query["assigned_to"] = user_id
+    elif args.get("assigned_to"):
+        if not ObjectId.is_valid(args["assigned_to"]):
+            raise ValueError("Invalid assigned_to")
+        query["assigned_to"] = ObjectId(args["assigned_to"])
+    for field in ("status", "category", "priority"):
+        if args.get(field):
+            query[field] = args[field]
+    if args.get("cursor"):
+        due_date, task_id = decode_cursor(args["cursor"])
+        query["$or"] = after_cursor(due_date, task_id)
+
+    limit = page_limit(args.get("limit"), PAGE_SIZE, MAX_PAGE_SIZE)
+    today = start_of_day()
+    projection = {field: 1 for field in TASK_FIELDS}
+    projection.update({
+        "_id": {"$toString": "$_id"},
+        "assigned_to": {"$toString": "$assigned_to"},
+        "overdue": {"$and": [
+            # BSON orders null and strings below dates, so this is "has a date".
+            {"$gt": ["$due_date", datetime.min]},
+            {"$lt": ["$due_date", today]},
+            {"$ne": ["$status", "complete"]}
+        ]}
+    })
+
+    tasks = list(db.tasks.aggregate([
+        {"$match": query},
+        {"$sort": {"due_date": 1, "_id": 1}},
+        {"$limit": limit + 1},
+        {"$project": projection}
+    ]))
+    next_cursor = None
+    if len(tasks) > limit:
+        tasks = tasks[:limit]
+        next_cursor = encode_cursor(tasks[-1])
+    for t in tasks:
+        t["due_date"] = format_date(t.get("due_date"))
+    return tasks, next_cursor
 
 @tasks_blueprint.route("/", methods=["GET"])
 @login_required
 def all_tasks():
     family_id = ObjectId(g.user["family_id"])
-    user_id = ObjectId(g.user["user_id"])
-    role = current_user_role()
-
-    query = {"family_id": family_id}
-    if role == "child":
-        query["assigned_to"] = user_id
-
-    tasks = list(db.tasks.find(query).sort("due_date", 1))
-    family = db.families.find_one({"_id": family_id})
-    members = list(db.users.find({"_id": {"$in": family["members"]}}))
+    role = g.identity.role
+    try:
+        tasks, next_cursor = list_tasks(family_id, g.identity.user_id, role, request.args)
+    except ValueError:
+        abort(400)
+    members = [{"_id": str(m["_id"]), "email": m["email"]} for m in g.identity.members]
     categories = list(db.task_categories.find({"family_id": family_id}))
+    return render_template("tasks.html", tasks=tasks, next_cursor=next_cursor, role=role, members=members, categories=categories)
 
-    # Check overdue
-    for t in tasks:
-        if t.get("due_date"):
-            due = datetime.strptime(t["due_date"], "%Y-%m-%d")
-            if due < datetime.utcnow() and t["status"] != "complete":
-                t["overdue"] = True
-            else:
-                t["overdue"] = False
-        t["_id"] = str(t["_id"])
-        t["assigned_to"] = str(t["assigned_to"])
-        # Convert comments user_ids to str
-        if "comments" in t:
-            for c in t["comments"]:
-                c["user_id"] = str(c["user_id"])
-
-    for m in members:
-        m["_id"] = str(m["_id"])
-
-    return render_template("tasks.html", tasks=tasks, role=role, members=members, categories=categories)
+@tasks_blueprint.route("/api", methods=["GET"])
+@login_required
+def tasks_api():
+    """JSON task listing. Query params: status, assigned_to, category, priority, limit, cursor."""
+    family_id = ObjectId(g.user["family_id"])
+    try:
+        tasks, next_cursor = list_tasks(family_id, g.identity.user_id, g.identity.role, request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"tasks": tasks, "next_cursor": next_cursor})
+
+@tasks_blueprint.route("/page", methods=["GET"])
+@login_required
+def tasks_page():
+    """The next page of task list items as HTML, for the task page's lazy loading."""
+    family_id = ObjectId(g.user["family_id"])
+    role = g.identity.role
+    try:
+        tasks, next_cursor = list_tasks(family_id, g.identity.user_id, role, request.args)
+    except ValueError:
+        abort(400)
+    members = [{"_id": str(m["_id"]), "email": m["email"]} for m in g.identity.members]
+    response = make_response(render_template("task_items.html", tasks=tasks, role=role, members=members))
+    response.headers["X-Next-Cursor"] = next_cursor or ""
+    return response
 
 @tasks_blueprint.route("/ajax_create", methods=["POST"])
 @login_required
 def ajax_create_task():
-    if not is_parent(g.user["user_id"]):
+    if not g.identity.is_parent:
         return jsonify({"error": "Only a parent can create tasks."}), 403
 
     family_id = ObjectId(g.user["family_id"])
@@ -75,19 +174,22 @@ def ajax_create_task():
 
     if not title or not assigned_to:
         return jsonify({"error": "Title and assigned_to are required"}), 400
+    try:
+        parsed_due_date = parse_date(due_date)
+    except ValueError:
+        return jsonify({"error": "Due date must be YYYY-MM-DD"}), 400
 
-    family_members = get_family_members(family_id)
-    mentioned_user_ids = parse_mentions(description, family_members)
+    mentioned_user_ids = parse_mentions(description, family_id)
 
     new_task = {
         "family_id": family_id,
         "title": title,
         "description": description,
-        "due_date": due_date,
+        "due_date": parsed_due_date,
         "status": "incomplete",
         "assigned_to": ObjectId(assigned_to),
         "priority": priority,
-        "comments": [],
+        "comment_count": 0,
         "category": category,
         "recurring": recurring,
         "reminder_date": reminder_date
@@ -95,6 +197,8 @@ def ajax_create_task():
 
     result = db.tasks.insert_one(new_task)
     new_task["_id"] = str(result.inserted_id)
+    new_task["family_id"] = str(family_id)
+    new_task["due_date"] = due_date
     new_task["assigned_to"] = assigned_to
 
     # Notify mentioned users
@@ -108,12 +212,11 @@ def ajax_create_task():
 @login_required
 def inline_update(task_id):
     family_id = ObjectId(g.user["family_id"])
-    user_id = g.user["user_id"]
-    task = db.tasks.find_one({"_id": ObjectId(task_id), "family_id": family_id})
+    task = db.tasks.find_one({"_id": ObjectId(task_id), "family_id": family_id}, {"_id": 1})
     if not task:
         return jsonify({"error": "Task not found"}), 404
 
-    if not is_parent(user_id):
+    if not g.identity.is_parent:
         return jsonify({"error": "Only a parent can inline update tasks."}), 403
 
     field = request.form.get("field")
@@ -126,15 +229,19 @@ def inline_update(task_id):
     update_value = value
     if field == "assigned_to":
         update_value = ObjectId(value)
+    elif field == "due_date":
+        try:
+            update_value = parse_date(value)
+        except ValueError:
+            return jsonify({"error": "Due date must be YYYY-MM-DD"}), 400
 
     # If description updated, parse mentions again
     mentioned_user_ids = []
     if field == "description":
-        family_members = get_family_members(family_id)
-        mentioned_user_ids = parse_mentions(value, family_members)
+        mentioned_user_ids = parse_mentions(value, family_id)
 
     db.tasks.update_one({"_id": ObjectId(task_id)}, {"$set": {field: update_value}})
-    updated_task = db.tasks.find_one({"_id": ObjectId(task_id)})
+    updated_task = db.tasks.find_one({"_id": ObjectId(task_id)}, {"comments": 0})
 
     # Notify mentions if description changed
     if mentioned_user_ids:
@@ -142,7 +249,9 @@ def inline_update(task_id):
         notify_mentions(mentioned_user_ids, msg)
 
     updated_task["_id"] = str(updated_task["_id"])
+    updated_task["family_id"] = str(updated_task["family_id"])
     updated_task["assigned_to"] = str(updated_task["assigned_to"])
+    updated_task["due_date"] = format_date(updated_task.get("due_date"))
     return jsonify(updated_task), 200
 
 @tasks_blueprint.route("/edit/<task_id>", methods=["GET", "POST"])
@@ -150,15 +259,15 @@ def inline_update(task_id):
 def edit_task(task_id):
     family_id = ObjectId(g.user["family_id"])
     obj_id = ObjectId(task_id)
-    task = db.tasks.find_one({"_id": obj_id, "family_id": family_id})
+    task = db.tasks.find_one({"_id": obj_id, "family_id": family_id}, {"comments": 0})
     if not task:
         return "Task not found", 404
 
-    if not is_parent(g.user["user_id"]):
+    if not g.identity.is_parent:
         flash("Only a parent can edit tasks.")
         return redirect(url_for("tasks.all_tasks"))
 
-    family_members = get_family_members(family_id)
+    family_members = g.identity.members
 
     if request.method == "POST":
         title = request.form.get("title")
@@ -169,13 +278,18 @@ def edit_task(task_id):
         category = request.form.get("category", task.get("category",""))
         recurring = request.form.get("recurring", task.get("recurring","none"))
         reminder_date = request.form.get("reminder_date", task.get("reminder_date",""))
+        try:
+            parsed_due_date = parse_date(due_date)
+        except ValueError:
+            flash("Due date must be YYYY-MM-DD.")
+            return redirect(url_for("tasks.edit_task", task_id=task_id))
 
-        mentioned_user_ids = parse_mentions(description, family_members)
+        mentioned_user_ids = parse_mentions(description, family_id)
 
         update_fields = {
             "title": title,
             "description": description,
-            "due_date": due_date,
+            "due_date": parsed_due_date,
             "priority": priority,
             "assigned_to": ObjectId(assigned_to),
             "category": category,
@@ -200,13 +314,14 @@ def edit_task(task_id):
 @login_required
 def delete_task(task_id):
     family_id = ObjectId(g.user["family_id"])
-    if not is_parent(g.user["user_id"]):
+    if not g.identity.is_parent:
         flash("Only a parent can delete tasks.")
         return redirect(url_for("tasks.all_tasks"))
 
     obj_id = ObjectId(task_id)
     result = db.tasks.delete_one({"_id": obj_id, "family_id": family_id})
     if result.deleted_count == 1:
+        db.task_comments.delete_many({"task_id": obj_id})
         flash("Task deleted successfully!")
     else:
         flash("Task not found or could not be deleted.")
@@ -218,7 +333,7 @@ def complete_task(task_id):
     user_id = ObjectId(g.user["user_id"])
     family_id = ObjectId(g.user["family_id"])
     obj_id = ObjectId(task_id)
-    task = db.tasks.find_one({"_id": obj_id, "family_id": family_id})
+    task = db.tasks.find_one({"_id": obj_id, "family_id": family_id}, {"assigned_to": 1})
     if not task:
         return "Task not found", 404
     if task["assigned_to"] != user_id:
@@ -234,7 +349,7 @@ def in_progress_task(task_id):
     user_id = ObjectId(g.user["user_id"])
     family_id = ObjectId(g.user["family_id"])
     obj_id = ObjectId(task_id)
-    task = db.tasks.find_one({"_id": obj_id, "family_id": family_id})
+    task = db.tasks.find_one({"_id": obj_id, "family_id": family_id}, {"assigned_to": 1})
     if not task:
         return "Task not found", 404
     if task["assigned_to"] != user_id:
@@ -250,7 +365,7 @@ def add_comment(task_id):
     user_id = ObjectId(g.user["user_id"])
     family_id = ObjectId(g.user["family_id"])
     obj_id = ObjectId(task_id)
-    task = db.tasks.find_one({"_id": obj_id, "family_id": family_id})
+    task = db.tasks.find_one({"_id": obj_id, "family_id": family_id}, {"title": 1})
     if not task:
         return "Task not found", 404
 
@@ -259,15 +374,21 @@ def add_comment(task_id):
         flash("Comment cannot be empty.")
         return redirect(url_for("tasks.all_tasks"))
 
-    family_members = get_family_members(family_id)
-    mentioned_user_ids = parse_mentions(comment_text, family_members)
+    mentioned_user_ids = parse_mentions(comment_text, family_id)
 
     comment = {
+        "task_id": obj_id,
+        "family_id": family_id,
         "user_id": user_id,
+        "user_name": g.identity.user.get("username", ""),
         "comment": comment_text,
         "timestamp": datetime.utcnow()
     }
-    db.tasks.update_one({"_id": obj_id}, {"$push": {"comments": comment}})
+    db.task_comments.insert_one(comment)
+    db.tasks.update_one({"_id": obj_id}, {
+        "$inc": {"comment_count": 1},
+        "$set": {"last_comment": comment_preview(comment)}
+    })
 
     if mentioned_user_ids:
         msg = f"You were mentioned in a comment on task: {task['title']}"
@@ -275,3 +396,35 @@ def add_comment(task_id):
 
     flash("Comment added!")
     return redirect(url_for("tasks.all_tasks"))
+
+@tasks_blueprint.route("/<task_id>/comments", methods=["GET"])
+@login_required
+def task_comments(task_id):
+    """Newest-first page of a task's comments. Pass the returned next_cursor as `before` for older ones.
+       Children only see comments on tasks assigned to them, as in the task list.
+    """
+    family_id = ObjectId(g.user["family_id"])
+    if not ObjectId.is_valid(task_id):
+        return jsonify({"error": "Invalid task id"}), 400
+    visible = {"_id": ObjectId(task_id), "family_id": family_id}
+    if g.identity.role == "child":
+        visible["assigned_to"] = g.identity.user_id
+    if not db.tasks.find_one(visible, {"_id": 1}):
+        return jsonify({"error": "Task not found"}), 404
+    query = {"task_id": visible["_id"], "family_id": family_id}
+    try:
+        if request.args.get("before"):
+            query.update(older_than(request.args["before"]))
+        limit = page_limit(request.args.get("limit"), COMMENT_PAGE_SIZE, MAX_PAGE_SIZE)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    comments = list(db.task_comments.find(query, {"family_id": 0, "task_id": 0})
+                    .sort([("timestamp", DESCENDING), ("_id", DESCENDING)]).limit(limit + 1))
+    next_cursor = None
+    if len(comments) > limit:
+        comments = comments[:limit]
+        next_cursor = encode_time_cursor(comments[-1])
+    for c in comments:
+        c["_id"] = str(c["_id"])
+        c["user_id"] = str(c["user_id"])
+    return jsonify({"comments": comments, "next_cursor": next_cursor})
@@ -0,0 +1,89 @@
+# src/utils/budget.py
+from datetime import datetime
+from pymongo import ReplaceOne
+from src.utils.db import get_db
+from src.utils.dates import month_key
+
+db = get_db()
+
+def rollup_key(family_id, category_id, month):
+    return {"family_id": family_id, "category_id": category_id, "month": month}
+
+def record_expense(expense):
+    """Insert an expense and fold it into its (family, category, month) rollup."""
+    result = db.expenses.insert_one(expense)
+    key = rollup_key(expense["family_id"], expense["category_id"], month_key(expense["date"]))
+    db.budget_rollups.update_one(
+        {"_id": key},
+        {"$inc": {"total": expense["amount"], "count": 1}, "$setOnInsert": key},
+        upsert=True
+    )
+    return result.inserted_id
+
+def category_totals(family_id, max_time_ms=None):
+    """Sum a family's monthly rollups per category.
+       Returns {category_id: {"total": float, "count": int}}.
+    """
+    pipeline = [
+        {"$match": {"family_id": family_id}},
+        {"$group": {"_id": "$category_id", "total": {"$sum": "$total"}, "count": {"$sum": "$count"}}}
+    ]
+    options = {"maxTimeMS": max_time_ms} if max_time_ms else {}
+    return {row["_id"]: {"total": row["total"], "count": row["count"]}
+            for row in db.budget_rollups.aggregate(pipeline, **options)}
+
+def budget_summary(family_id, max_time_ms=None):
+    """Per-category totals, expense counts and limit utilization plus the grand total.
+       Costs two round trips (categories + one rollup aggregation) regardless of expense history.
+       With max_time_ms, the server cancels either query that runs longer.
+    """
+    categories = list(db.budget_categories.find({"family_id": family_id}, max_time_ms=max_time_ms))
+    totals = category_totals(family_id, max_time_ms)
+
+    category_sums = {}
+    total_expenses = 0
+    for cat in categories:
+        row = totals.get(cat["_id"], {"total": 0, "count": 0})
+        limit = cat.get("limit", 0)
+        category_sums[str(cat["_id"])] = {
+            "name": cat["name"],
+            "total": row["total"],
+            "count": row["count"],
+            "limit": limit,
+            "utilization": row["total"] / limit if limit else None
+        }
+        total_expenses += row["total"]
+
+    return {"categories": categories, "category_sums": category_sums, "total": total_expenses}
+
+def rebuild_rollups(family_id=None, batch_size=1000):
+    """Recompute budget_rollups from expenses, for one family or all of them.
+       Expenses are streamed in cursor batches and only the per-month sums are held
+       in memory. Rollups written by this run are stamped, and rows the run did not
+       produce are removed afterwards. Expenses added while it runs may be missed,
+       so run it when the app is quiet. Returns (expenses scanned, rollups written).
+    """
+    query = {} if family_id is None else {"family_id": family_id}
+    projection = {"family_id": 1, "category_id": 1, "amount": 1, "date": 1}
+    sums = {}
+    scanned = 0
+    for e in db.expenses.find(query, projection).batch_size(batch_size):
+        key = (e["family_id"], e["category_id"], month_key(e["date"]))
+        row = sums.setdefault(key, [0, 0])
+        row[0] += e["amount"]
+        row[1] += 1
+        scanned += 1
+
+    stamp = datetime.utcnow()
+    ops = []
+    for (fam_id, cat_id, month), (total, count) in sums.items():
+        key = rollup_key(fam_id, cat_id, month)
+        ops.append(ReplaceOne({"_id": key}, dict(key, _id=key, total=total, count=count, rebuilt_at=stamp), upsert=True))
+        if len(ops) >= batch_size:
+            db.budget_rollups.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        db.budget_rollups.bulk_write(ops, ordered=False)
+
+    db.budget_rollups.delete_many(dict(query, rebuilt_at={"$ne": stamp}))
+    return scanned, len(sums)
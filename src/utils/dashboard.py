@@ -0,0 +1,95 @@
+# src/utils/dashboard.py
+import logging
+import os
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from pymongo.errors import ExecutionTimeout
+from src.utils.db import get_db
+from src.utils.budget import budget_summary
+from src.utils.message_store import message_store
+
+db = get_db()
+logger = logging.getLogger(__name__)
+
+SECTION_TIMEOUT = float(os.getenv("DASHBOARD_SECTION_TIMEOUT", 1.0))
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("DASHBOARD_WORKERS", 12)), thread_name_prefix="dashboard")
+_timings = defaultdict(lambda: deque(maxlen=1000))
+
+def _max_time_ms():
+    return int(SECTION_TIMEOUT * 1000)
+
+def fetch_tasks(family_id):
+    return list(db.tasks.find({"family_id": family_id, "status": "incomplete"})
+                .sort("due_date", 1).limit(5).max_time_ms(_max_time_ms()))
+
+def fetch_events(family_id):
+    return list(db.events.find({"family_id": family_id, "visibility": "family"})
+                .sort("date", 1).limit(5).max_time_ms(_max_time_ms()))
+
+def fetch_messages(family_id):
+    return message_store.latest(family_id, 5, _max_time_ms())
+
+def fetch_total_expenses(family_id):
+    return budget_summary(family_id, _max_time_ms())["total"]
+
+def fetch_meal_plan(family_id):
+    return db.meal_plans.find_one({"family_id": family_id}, sort=[("week_start", -1)], max_time_ms=_max_time_ms())
+
+# name -> (fetcher, value when disabled or degraded, shared_features flag that gates it)
+SECTIONS = {
+    "tasks": (fetch_tasks, [], "tasks"),
+    "events": (fetch_events, [], None),
+    "messages": (fetch_messages, [], "meals"),
+    "total_expenses": (fetch_total_expenses, 0, "budget"),
+    "meal_plan": (fetch_meal_plan, None, "meals"),
+}
+
+def _timed(name, fetcher, family_id):
+    start = time.perf_counter()
+    try:
+        return fetcher(family_id), time.perf_counter() - start
+    finally:
+        _timings[name].append(time.perf_counter() - start)
+
+def load_dashboard(user):
+    """Fetch every enabled dashboard section concurrently.
+       A section that errors or misses its timeout falls back to its default value;
+       errors other than timeouts are logged.
+       Returns (sections, timings in ms, names of degraded sections).
+    """
+    family_id = user["family_id"]
+    shared = user.get("shared_features", {})
+    start = time.perf_counter()
+    deadline = start + SECTION_TIMEOUT
+
+    sections = {}
+    futures = {}
+    for name, (fetcher, default, flag) in SECTIONS.items():
+        sections[name] = default
+        if flag is None or shared.get(flag, True):
+            futures[name] = _executor.submit(_timed, name, fetcher, family_id)
+
+    timings = {}
+    degraded = []
+    for name, future in futures.items():
+        try:
+            sections[name], elapsed = future.result(timeout=max(0, deadline - time.perf_counter()))
+        except Exception as e:
+            if not isinstance(e, (TimeoutError, ExecutionTimeout)):
+                logger.exception(f"Dashboard section {name} failed")
+            degraded.append(name)
+            elapsed = time.perf_counter() - start
+        timings[name] = elapsed * 1000
+    return sections, timings, degraded
+
+def section_percentiles(percentiles=(50, 95, 99)):
+    """Latency percentiles in ms per section over the most recent fetches."""
+    report = {}
+    for name, samples in _timings.items():
+        ordered = sorted(samples)
+        if not ordered:
+            continue
+        report[name] = {f"p{p}": ordered[min(len(ordered) - 1, len(ordered) * p // 100)] * 1000 for p in percentiles}
+        report[name]["samples"] = len(ordered)
+    return report
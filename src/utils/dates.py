@@ -0,0 +1,49 @@
+# src/utils/dates.py
+"""Conversions between form values and the naive-UTC BSON datetimes stored on events, tasks and expenses,
+   plus range filters built from them.
+"""
+from datetime import date, datetime, time, timedelta
+
+DATE_FORMAT = "%Y-%m-%d"
+TIME_FORMAT = "%H:%M"
+
+def parse_date(value, at="00:00"):
+    """A "YYYY-MM-DD" form value (optionally with an "HH:MM" time) as a datetime. Empty values give None;
+       datetimes and dates pass through.
+    """
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, time())
+    day = datetime.strptime(value[:10], DATE_FORMAT)
+    if at:
+        clock = datetime.strptime(at, TIME_FORMAT)
+        day = day.replace(hour=clock.hour, minute=clock.minute)
+    return day
+
+def format_date(value):
+    """The "YYYY-MM-DD" form of a stored date; strings (not yet migrated) pass through and None becomes ""."""
+    if isinstance(value, (datetime, date)):
+        return value.strftime(DATE_FORMAT)
+    return value or ""
+
+def month_key(value):
+    """The "YYYY-MM" bucket a stored date falls in."""
+    return value.strftime("%Y-%m") if isinstance(value, (datetime, date)) else (value or "")[:7]
+
+def start_of_day(value=None):
+    value = parse_date(value) if value else datetime.utcnow()
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def day_range(start=None, end=None):
+    """A query filter for whole days from start through end inclusive; either side may be open.
+       Returns None when both are empty.
+    """
+    bounds = {}
+    if start:
+        bounds["$gte"] = start_of_day(start)
+    if end:
+        bounds["$lt"] = start_of_day(end) + timedelta(days=1)
+    return bounds or None
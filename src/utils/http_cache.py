@@ -0,0 +1,23 @@
+# src/utils/http_cache.py
+from datetime import timezone
+from flask import request
+
+def _http_time(value):
+    # Mongo hands back naive UTC datetimes; HTTP dates have one-second resolution.
+    return value.replace(microsecond=0, tzinfo=value.tzinfo or timezone.utc)
+
+def is_fresh(etag, last_modified=None):
+    """True if the client's cached copy (If-None-Match, else If-Modified-Since) is still current."""
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        return _http_time(last_modified) <= request.if_modified_since
+    return False
+
+def set_validators(response, etag, last_modified=None):
+    """Attach a weak ETag and Last-Modified, and make browsers revalidate before reusing the body."""
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = _http_time(last_modified)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
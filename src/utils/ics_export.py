@@ -0,0 +1,105 @@
+# src/utils/ics_export.py
+"""Streaming iCalendar writer, the counterpart of ics_stream.
+
+VEVENT blocks are rendered one event at a time from a cursor, and whole feeds are kept in a
+small per-family cache keyed by calendar version so subscription polls skip the events query.
+"""
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from src.utils.recurrence import to_rrule
+
+ICS_CACHE_ENTRIES = int(os.getenv("ICS_CACHE_ENTRIES", 256))
+# Feeds larger than this are streamed every time rather than held in memory.
+ICS_CACHE_MAX_BYTES = int(os.getenv("ICS_CACHE_MAX_BYTES", 2 * 1024 * 1024))
+PRODID = "-//Myte Home//Family Calendar//EN"
+EXPORT_PROJECTION = {"title": 1, "description": 1, "date": 1, "rrule": 1, "exdates": 1, "ics_uid": 1}
+
+def escape_text(value):
+    return (value or "").replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\r\n", "\\n").replace("\n", "\\n")
+
+def fold(line):
+    """Fold a content line at 75 octets (RFC 5545 3.1) without splitting a UTF-8 sequence."""
+    data = line.encode("utf-8")
+    if len(data) <= 75:
+        return data + b"\r\n"
+    parts, limit = [], 75
+    while len(data) > limit:
+        cut = limit
+        while cut and (data[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(data[:cut])
+        data, limit = data[cut:], 74  # continuation lines start with a space
+    parts.append(data)
+    return b"\r\n ".join(parts) + b"\r\n"
+
+def format_utc(value):
+    # Stored datetimes are naive UTC.
+    return value.strftime("%Y%m%dT%H%M%SZ")
+
+def vevent(event, stamp):
+    """One VEVENT block as bytes. Series are written once with RRULE/EXDATE for clients to expand."""
+    uid = event.get("ics_uid") or f"{event['_id']}@myte-home"
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:{uid}",
+        f"DTSTAMP:{stamp}",
+        f"DTSTART:{format_utc(event['date'])}",
+        f"SUMMARY:{escape_text(event.get('title'))}",
+    ]
+    if event.get("description"):
+        lines.append(f"DESCRIPTION:{escape_text(event['description'])}")
+    if event.get("rrule"):
+        lines.append(f"RRULE:{to_rrule(event['rrule'])}")
+        for day in event.get("exdates") or []:
+            lines.append(f"EXDATE:{format_utc(datetime.combine(day.date(), event['date'].time()))}")
+    lines.append("END:VEVENT")
+    return b"".join(fold(line) for line in lines)
+
+def iter_calendar(events):
+    """Yield a VCALENDAR as byte chunks, one per event, from any iterable of event documents."""
+    stamp = format_utc(datetime.utcnow())
+    yield fold("BEGIN:VCALENDAR") + fold("VERSION:2.0") + fold(f"PRODID:{PRODID}")
+    for event in events:
+        yield vevent(event, stamp)
+    yield fold("END:VCALENDAR")
+
+class FeedCache:
+    """Thread-safe LRU of rendered feeds: family_id -> (calendar version, bytes)."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, family_id, version):
+        with self._lock:
+            entry = self._entries.get(family_id)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(family_id)
+            return entry[1]
+
+    def put(self, family_id, version, feed):
+        with self._lock:
+            self._entries[family_id] = (version, feed)
+            self._entries.move_to_end(family_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def stream(self, family_id, version, chunks):
+        """Pass chunks through, keeping a copy that is cached once the feed completes within the size cap."""
+        kept, size = [], 0
+        for chunk in chunks:
+            if kept is not None:
+                size += len(chunk)
+                if size <= ICS_CACHE_MAX_BYTES:
+                    kept.append(chunk)
+                else:
+                    kept = None
+            yield chunk
+        if kept is not None:
+            self.put(family_id, version, b"".join(kept))
+
+feed_cache = FeedCache(ICS_CACHE_ENTRIES)
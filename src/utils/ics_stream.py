@@ -0,0 +1,133 @@
+# src/utils/ics_stream.py
+"""Incremental VEVENT reader for iCalendar uploads.
+
+Only one event's properties are held in memory at a time, so an upload of any size can be
+fed straight into batched writes. Malformed events are skipped and reported with the line
+they start on instead of failing the whole file.
+"""
+from datetime import datetime
+from src.utils.recurrence import parse_rrule
+
+MAX_REPORTED_ERRORS = 100
+
+def unfolded_lines(stream):
+    """Yield (line_no, line) from a binary line stream, joining RFC 5545 folded continuation lines."""
+    current, start = None, 0
+    for line_no, raw in enumerate(stream, 1):
+        line = raw.decode("utf-8", errors="replace").rstrip("\r\n")
+        if line[:1] in (" ", "\t") and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield start, current
+        current, start = line, line_no
+    if current is not None:
+        yield start, current
+
+def parse_property(line):
+    """Split 'NAME;PARAM=VALUE:value' into (NAME, {PARAM: VALUE}, value). Colons inside quoted params are kept."""
+    in_quotes = False
+    for i, ch in enumerate(line):
+        if ch == '"':
+            in_quotes = not in_quotes
+        elif ch == ":" and not in_quotes:
+            head, value = line[:i], line[i + 1:]
+            break
+    else:
+        raise ValueError("missing ':' in property line")
+    name, *raw_params = head.split(";")
+    params = {}
+    for p in raw_params:
+        key, _, val = p.partition("=")
+        params[key.upper()] = val.strip('"')
+    return name.upper(), params, value
+
+def unescape_text(value):
+    out, i = [], 0
+    while i < len(value):
+        ch = value[i]
+        if ch == "\\" and i + 1 < len(value):
+            nxt = value[i + 1]
+            out.append("\n" if nxt in "nN" else nxt)
+            i += 2
+        else:
+            out.append(ch)
+            i += 1
+    return "".join(out)
+
+def parse_ics_datetime(value, params):
+    """Parse a DATE or DATE-TIME value into a naive datetime. UTC ('Z') and TZID values keep their wall-clock time."""
+    value = value.strip()
+    if params.get("VALUE") == "DATE" or len(value) == 8:
+        return datetime.strptime(value, "%Y%m%d")
+    return datetime.strptime(value.rstrip("Z"), "%Y%m%dT%H%M%S")
+
+def _normalize(props):
+    if "DTSTART" not in props:
+        raise ValueError("VEVENT has no DTSTART")
+    begin = parse_ics_datetime(*props["DTSTART"])
+    uid = props.get("UID", ("", {}))[0].strip()
+    if uid and "RECURRENCE-ID" in props:
+        # Overrides of a recurring event share its UID; keep them distinct.
+        uid = f"{uid}#{props['RECURRENCE-ID'][0].strip()}"
+    return {
+        "ics_uid": uid or None,
+        "title": unescape_text(props.get("SUMMARY", ("", {}))[0]),
+        "date": begin,
+        "time": begin.strftime("%H:%M"),
+        "description": unescape_text(props.get("DESCRIPTION", ("", {}))[0]),
+        "rrule": parse_rrule(props["RRULE"][0], begin) if "RRULE" in props else None,
+        "exdates": sorted({parse_ics_datetime(v, params) for value, params in props.get("EXDATE", []) for v in value.split(",")})
+    }
+
+def read_vevents(stream, errors=None, overrides=None):
+    """Yield normalized event dicts ({ics_uid, title, date, time, description, rrule, exdates}) from an .ics byte stream.
+       Skipped events are appended to `errors` as (line_no, message), up to MAX_REPORTED_ERRORS.
+       Each RECURRENCE-ID override is also appended to `overrides` as (series UID, original start), so
+       the caller can exclude that start from the series once the whole file is written; the series
+       may come before or after its overrides.
+    """
+    errors = [] if errors is None else errors
+    props, start, depth = None, 0, 0
+
+    def report(line_no, message):
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append((line_no, message))
+
+    for line_no, line in unfolded_lines(stream):
+        if not line.strip():
+            continue
+        upper = line.upper()
+        if upper == "BEGIN:VEVENT":
+            if props is not None:
+                report(start, "VEVENT not closed before the next one began")
+            props, start, depth = {}, line_no, 0
+        elif props is None:
+            continue
+        elif upper.startswith("BEGIN:"):
+            depth += 1  # nested component such as VALARM
+        elif upper.startswith("END:") and depth:
+            depth -= 1
+        elif upper == "END:VEVENT":
+            try:
+                event = _normalize(props)
+                if overrides is not None and "RECURRENCE-ID" in props and "UID" in props:
+                    overrides.append((props["UID"][0].strip(), parse_ics_datetime(*props["RECURRENCE-ID"])))
+            except ValueError as e:
+                report(start, str(e))
+            else:
+                yield event
+            props = None
+        elif not depth:
+            try:
+                name, params, value = parse_property(line)
+            except ValueError as e:
+                report(line_no, str(e))
+                continue
+            if name == "EXDATE":
+                props.setdefault(name, []).append((value, params))
+            else:
+                props.setdefault(name, (value, params))
+
+    if props is not None:
+        report(start, "VEVENT not closed before end of file")
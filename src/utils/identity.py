@@ -0,0 +1,66 @@
+# src/utils/identity.py
+from collections import Counter
+from bson.objectid import ObjectId
+from src.utils.db import get_db
+
+db = get_db()
+
+class Identity:
+    """Request-scoped view of the logged-in user and their family, hung off g.identity.
+       The user, family and member documents are each fetched at most once per request;
+       `queries` counts the lookups actually made per collection.
+    """
+
+    def __init__(self, claims):
+        self.claims = claims
+        self.user_id = ObjectId(claims["user_id"])
+        self.family_id = ObjectId(claims["family_id"])
+        self.queries = Counter()
+        self._user = None
+        self._family = None
+        self._members = None
+
+    @property
+    def user(self):
+        if self._user is None:
+            if self._members is not None:
+                self._user = next((m for m in self._members if m["_id"] == self.user_id), None)
+            if self._user is None:
+                self.queries["users"] += 1
+                self._user = db.users.find_one({"_id": self.user_id})
+        return self._user
+
+    @property
+    def role(self):
+        """Taken from the token claims when present, so parent-only checks need no lookup."""
+        if "role" in self.claims:
+            return self.claims["role"]
+        return self.user.get("role", "child")
+
+    @property
+    def is_parent(self):
+        return self.role == "parent"
+
+    @property
+    def family(self):
+        if self._family is None:
+            self.queries["families"] += 1
+            self._family = db.families.find_one({"_id": self.family_id})
+        return self._family
+
+    @property
+    def members(self):
+        """User docs for every family member. Reuses the current user's doc if it is already loaded."""
+        if self._members is None:
+            member_ids = self.family["members"]
+            known = [self._user] if self._user is not None and self.user_id in member_ids else []
+            wanted = [m for m in member_ids if not known or m != self.user_id]
+            self.queries["users"] += 1
+            self._members = known + list(db.users.find({"_id": {"$in": wanted}}))
+        return self._members
+
+    def refresh(self):
+        """Drop cached documents after the request has modified them."""
+        self._user = None
+        self._family = None
+        self._members = None
@@ -0,0 +1,56 @@
+# src/utils/indexes.py
+#
+# Each blueprint module declares the indexes it relies on and the query shapes it runs:
+#
+#   INDEXES = {"tasks": [IndexModel([("family_id", ASCENDING), ("due_date", ASCENDING)])]}
+#   QUERY_SHAPES = [("tasks", {"family_id": ObjectId()}, [("due_date", ASCENDING)])]
+#
+# ensure_indexes() applies the manifests and verify_query_plans() explains every shape.
+import logging
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+def ensure_indexes(db, modules):
+    """Create every index declared by the given modules, one at a time. An index the server refuses
+       to build (a unique index over duplicate data, say) is logged and skipped, and the rest are
+       still created; connection errors are raised. Existing indexes are left as they are.
+       Returns (created, failed) lists of "collection.index" names.
+    """
+    created, failed = [], []
+    for module in modules:
+        for collection, models in getattr(module, "INDEXES", {}).items():
+            for model in models:
+                name = f"{collection}.{model.document['name']}"
+                try:
+                    db[collection].create_indexes([model])
+                except OperationFailure as e:
+                    logger.error(f"Could not create index {name}: {e}")
+                    failed.append(name)
+                else:
+                    created.append(name)
+    return created, failed
+
+def _stages(plan):
+    """Yield every stage name in an explain() plan tree."""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from _stages(value)
+
+def verify_query_plans(db, modules):
+    """Explain every registered query shape and return the ones whose winning plan is a COLLSCAN."""
+    failures = []
+    for module in modules:
+        for collection, query, sort in getattr(module, "QUERY_SHAPES", []):
+            cursor = db[collection].find(query)
+            if sort:
+                cursor = cursor.sort(sort)
+            winning_plan = cursor.explain().get("queryPlanner", {}).get("winningPlan", {})
+            if "COLLSCAN" in _stages(winning_plan):
+                failures.append((collection, query, sort))
+    return failures
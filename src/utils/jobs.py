@@ -0,0 +1,211 @@
+# src/utils/jobs.py
+"""Background jobs for work too slow for a request, such as LLM calls.
+
+A request enqueues a job and returns; `flask job-worker` processes claim jobs one at a time with
+find_one_and_update and record progress on the job document, which the /jobs endpoints expose.
+"""
+import importlib
+import logging
+import multiprocessing
+import os
+import random
+import threading
+from datetime import datetime, timedelta
+from bson.objectid import ObjectId
+from pymongo import IndexModel, ASCENDING, ReturnDocument
+from pymongo.errors import PyMongoError, DuplicateKeyError
+from src.utils.db import get_db
+
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", 300))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", 1))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", 10))
+
+# kind -> "module:function". Handlers take (job, progress) and return a JSON-able result.
+HANDLERS = {
+    "meal_plan": "src.meals:run_meal_plan_job",
+    "transcription": "src.meals:run_transcription_job",
+}
+# kind -> "module:function" called with the job once its result is recorded, or once it has failed
+# for good, to release what it holds.
+ON_SUCCESS = {
+    "transcription": "src.meals:discard_transcription_upload",
+}
+ON_FAILURE = {
+    "transcription": "src.meals:discard_transcription_upload",
+}
+
+db = get_db()
+logger = logging.getLogger(__name__)
+
+INDEXES = {
+    "jobs": [
+        IndexModel([("status", ASCENDING), ("run_at", ASCENDING)]),
+        # Held only while a job is queued or running, so at most one active job per dedupe key.
+        IndexModel([("active_key", ASCENDING)], unique=True, partialFilterExpression={"active_key": {"$exists": True}}),
+    ],
+}
+QUERY_SHAPES = [
+    ("jobs", {"status": "queued", "run_at": {"$lte": datetime(2024, 1, 1)}}, [("run_at", ASCENDING)]),
+]
+
+def enqueue(kind, family_id, user_id, payload, dedupe_key=None):
+    """Queue a job and return its id. With dedupe_key, a job already queued or running under the
+       same key is returned instead of starting another.
+    """
+    while True:
+        now = datetime.utcnow()
+        job = {
+            "kind": kind,
+            "family_id": family_id,
+            "user_id": user_id,
+            "payload": payload,
+            "status": "queued",
+            "progress": {},
+            "attempts": 0,
+            "created_at": now,
+            "run_at": now
+        }
+        if dedupe_key:
+            job["active_key"] = dedupe_key
+        try:
+            return db.jobs.insert_one(job).inserted_id
+        except DuplicateKeyError:
+            active = db.jobs.find_one({"active_key": dedupe_key}, {"_id": 1})
+            if active:
+                return active["_id"]
+            # It finished between the insert and the lookup; queue a new one.
+
+def public_status(job):
+    return {
+        "id": str(job["_id"]),
+        "kind": job["kind"],
+        "status": job["status"],
+        "progress": job.get("progress", {}),
+        "result": job.get("result"),
+        "error": job.get("error") if job["status"] == "failed" else None
+    }
+
+def _resolve(target):
+    module, name = target.split(":")
+    return getattr(importlib.import_module(module), name)
+
+class JobWorker:
+    """Claims and runs queued jobs, retrying failures with exponential backoff."""
+
+    def claim(self):
+        """Atomically lease the next due job, or one whose worker died holding it with attempts left.
+           Each claim gets a fresh lease_token; a worker only records results while it still holds it.
+        """
+        now = datetime.utcnow()
+        return db.jobs.find_one_and_update(
+            {"$or": [
+                {"status": "queued", "run_at": {"$lte": now}},
+                {"status": "running", "lease_until": {"$lt": now}, "attempts": {"$lt": JOB_MAX_ATTEMPTS}}
+            ]},
+            {"$set": {"status": "running", "started_at": now, "lease_until": now + timedelta(seconds=JOB_LEASE_SECONDS),
+                      "lease_token": ObjectId()},
+             "$inc": {"attempts": 1}},
+            sort=[("run_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def fail_abandoned(self):
+        """Fail jobs whose worker died holding the lease of their last attempt. Returns how many."""
+        failed = 0
+        while True:
+            now = datetime.utcnow()
+            job = db.jobs.find_one_and_update(
+                {"status": "running", "lease_until": {"$lt": now}, "attempts": {"$gte": JOB_MAX_ATTEMPTS}},
+                {"$set": {"status": "failed", "error": "Worker stopped during the last attempt", "finished_at": now},
+                 "$unset": {"lease_until": "", "lease_token": "", "active_key": ""}}
+            )
+            if job is None:
+                return failed
+            logger.warning(f"Job {job['_id']} ({job['kind']}) failed: its last attempt's lease expired")
+            self._release(job, ON_FAILURE)
+            failed += 1
+
+    def _progress(self, job):
+        def progress(**fields):
+            """Merge fields into the job's progress and extend its lease."""
+            update = {f"progress.{k}": v for k, v in fields.items()}
+            update["lease_until"] = datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS)
+            db.jobs.update_one(self._owned(job), {"$set": update})
+        return progress
+
+    def _owned(self, job):
+        """Filter matching the job only while this claim still holds its lease."""
+        return {"_id": job["_id"], "lease_token": job["lease_token"]}
+
+    def run_one(self):
+        """Run the next due job. Returns False when there was nothing to do."""
+        self.fail_abandoned()
+        job = self.claim()
+        if job is None:
+            return False
+        try:
+            result = _resolve(HANDLERS[job["kind"]])(job, self._progress(job))
+        except Exception as e:
+            logger.exception(f"Job {job['_id']} ({job['kind']}) failed")
+            self._retry(job, e)
+        else:
+            finished = db.jobs.update_one(self._owned(job), {
+                "$set": {"status": "succeeded", "result": result, "finished_at": datetime.utcnow()},
+                "$unset": {"lease_until": "", "lease_token": "", "active_key": ""}
+            })
+            if finished.matched_count:
+                self._release(job, ON_SUCCESS)
+            else:
+                logger.warning(f"Job {job['_id']} ({job['kind']}) finished after its lease was taken over; result dropped")
+        return True
+
+    def _release(self, job, hooks):
+        if job["kind"] not in hooks:
+            return
+        try:
+            _resolve(hooks[job["kind"]])(job)
+        except Exception:
+            logger.exception(f"Cleanup for job {job['_id']} ({job['kind']}) failed")
+
+    def _retry(self, job, error):
+        update = {"error": str(error)}
+        unset = {"lease_until": "", "lease_token": ""}
+        final = job["attempts"] >= JOB_MAX_ATTEMPTS
+        if final:
+            update.update(status="failed", finished_at=datetime.utcnow())
+            unset["active_key"] = ""
+        else:
+            delay = JOB_RETRY_BASE_SECONDS * 2 ** (job["attempts"] - 1)
+            update.update(status="queued", run_at=datetime.utcnow() + timedelta(seconds=delay * random.uniform(0.8, 1.2)))
+        if not db.jobs.update_one(self._owned(job), {"$set": update, "$unset": unset}).matched_count:
+            logger.warning(f"Job {job['_id']} ({job['kind']}) failed after its lease was taken over")
+        elif final:
+            self._release(job, ON_FAILURE)
+
+    def run(self, stop_event=None):
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            try:
+                if self.run_one():
+                    continue
+            except PyMongoError as e:
+                logger.warning(f"Job worker could not reach the database: {e}")
+            stop_event.wait(JOB_POLL_SECONDS)
+
+def run_worker():
+    JobWorker().run()
+
+def start_worker_processes(count):
+    """Start count worker processes. Spawned rather than forked, so none inherits a MongoClient."""
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=run_worker, name=f"job-worker-{i}", daemon=True) for i in range(count)]
+    for p in processes:
+        p.start()
+    return processes
+
+def start_job_worker():
+    """Run a JobWorker on a daemon thread in this process. Returns the event that stops it."""
+    stop_event = threading.Event()
+    threading.Thread(target=JobWorker().run, args=(stop_event,), name="jobs", daemon=True).start()
+    return stop_event
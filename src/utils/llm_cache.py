@@ -0,0 +1,81 @@
+# src/utils/llm_cache.py
+"""Prompt-keyed cache for LLM responses.
+
+Responses are stored in llm_cache under a hash of the model and whitespace-normalized prompt and
+expire after LLM_CACHE_TTL_SECONDS. Concurrent misses for the same prompt in one process share a
+single upstream call. Hit, miss and shared counts are kept per namespace in llm_cache_stats, so
+they add up across web and worker processes.
+"""
+import hashlib
+import os
+import threading
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from pymongo import IndexModel, ASCENDING
+from src.utils.db import get_db
+
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+
+db = get_db()
+
+INDEXES = {
+    "llm_cache": [IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0)],
+}
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+def prompt_key(model, prompt):
+    return hashlib.sha256(f"{model}\n{' '.join(prompt.split())}".encode("utf-8")).hexdigest()
+
+def _count(namespace, outcome):
+    db.llm_cache_stats.update_one({"_id": namespace}, {"$inc": {outcome: 1}}, upsert=True)
+
+def cached_call(namespace, key, call, refresh=False, valid=None):
+    """call()'s response for key: from the cache unless refresh, otherwise computed once per process
+       however many threads ask at the same time. Responses failing valid(response) are not cached.
+    """
+    if not refresh:
+        doc = db.llm_cache.find_one({"_id": key, "expires_at": {"$gt": datetime.utcnow()}}, {"response": 1})
+        if doc:
+            _count(namespace, "hits")
+            return doc["response"]
+
+    with _inflight_lock:
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = _inflight[key] = Future()
+    if not leader:
+        _count(namespace, "shared")
+        return future.result()
+
+    try:
+        _count(namespace, "misses")
+        response = call()
+        if valid is None or valid(response):
+            now = datetime.utcnow()
+            db.llm_cache.replace_one({"_id": key}, {
+                "namespace": namespace,
+                "response": response,
+                "created_at": now,
+                "expires_at": now + timedelta(seconds=LLM_CACHE_TTL_SECONDS)
+            }, upsert=True)
+        future.set_result(response)
+        return response
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+def cache_stats():
+    """{namespace: {hits, misses, shared, hit_rate}}"""
+    report = {}
+    for doc in db.llm_cache_stats.find():
+        counts = {k: doc.get(k, 0) for k in ("hits", "misses", "shared")}
+        total = sum(counts.values())
+        counts["hit_rate"] = (counts["hits"] + counts["shared"]) / total if total else 0.0
+        report[doc["_id"]] = counts
+    return report
@@ -1,20 +1,195 @@
 # src/utils/mailer.py
+import logging
 import os
+import random
 import smtplib
+import threading
+import time
+from datetime import datetime, timedelta
 from email.mime.text import MIMEText
+from bson.objectid import ObjectId
+from pymongo import IndexModel, ASCENDING, ReturnDocument
+from pymongo.errors import PyMongoError
+from src.utils.db import get_db
 
 SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
 SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
 SMTP_USER = os.getenv("SMTP_USER")
 SMTP_PASS = os.getenv("SMTP_PASS")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", 30))
+SMTP_FROM = os.getenv("SMTP_FROM", SMTP_USER)
 
-def send_email(to_email, subject, body):
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 50))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 6))
+OUTBOX_RETRY_BASE_SECONDS = float(os.getenv("OUTBOX_RETRY_BASE_SECONDS", 30))
+OUTBOX_LEASE_SECONDS = int(os.getenv("OUTBOX_LEASE_SECONDS", 300))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", 2))
+# An idle SMTP session is closed after this long rather than left for the server to drop.
+SMTP_IDLE_SECONDS = float(os.getenv("SMTP_IDLE_SECONDS", 60))
+
+db = get_db()
+logger = logging.getLogger(__name__)
+
+INDEXES = {
+    "email_outbox": [IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)])],
+}
+QUERY_SHAPES = [
+    ("email_outbox", {"status": "pending", "next_attempt_at": {"$lte": datetime(2024, 1, 1)}}, [("next_attempt_at", ASCENDING)]),
+]
+
+def build_message(to_email, subject, body):
     msg = MIMEText(body, "plain")
     msg["Subject"] = subject
-    msg["From"] = SMTP_USER
+    msg["From"] = SMTP_FROM
     msg["To"] = to_email
+    return msg
+
+def send_email(to_email, subject, body):
+    """Send one email synchronously on a fresh connection. Request handlers should use queue_email."""
+    session = SMTPSession()
+    try:
+        session.send(build_message(to_email, subject, body))
+    finally:
+        session.close()
+
+def queue_emails(messages):
+    """Put (to_email, subject, body) tuples in the outbox for the mail worker to deliver."""
+    now = datetime.utcnow()
+    docs = [{
+        "to": to_email,
+        "subject": subject,
+        "body": body,
+        "status": "pending",
+        "attempts": 0,
+        "created_at": now,
+        "next_attempt_at": now
+    } for to_email, subject, body in messages]
+    if docs:
+        db.email_outbox.insert_many(docs, ordered=False)
+
+def queue_email(to_email, subject, body):
+    queue_emails([(to_email, subject, body)])
+
+class SMTPSession:
+    """One SMTP connection kept open and authenticated across sends, reopened when it drops."""
+
+    def __init__(self, host=None, port=None, user=None, password=None, starttls=None):
+        self.host = host or SMTP_HOST
+        self.port = port or SMTP_PORT
+        self.user = user if user is not None else SMTP_USER
+        self.password = password if password is not None else SMTP_PASS
+        self.starttls = SMTP_STARTTLS if starttls is None else starttls
+        self._server = None
+        self.last_used = 0
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+        if self.starttls:
+            server.starttls()
+        if self.user:
+            server.login(self.user, self.password)
+        self._server = server
+
+    def send(self, msg):
+        if self._server is None:
+            self._connect()
+        try:
+            self._server.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # The server closed an idle connection; reconnect once and retry.
+            self._server = None
+            self._connect()
+            self._server.send_message(msg)
+        self.last_used = time.monotonic()
+
+    def close(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._server = None
+
+class OutboxWorker:
+    """Drains email_outbox over a reused SMTP session, retrying failures with exponential backoff."""
+
+    def __init__(self, session=None, batch_size=OUTBOX_BATCH_SIZE):
+        self.session = session or SMTPSession()
+        self.batch_size = batch_size
+
+    def claim(self):
+        """Atomically lease the next due message, or one whose previous lease expired.
+           Each claim gets a fresh lease_token; a worker only records the outcome while it still holds it.
+        """
+        now = datetime.utcnow()
+        return db.email_outbox.find_one_and_update(
+            {"$or": [
+                {"status": "pending", "next_attempt_at": {"$lte": now}},
+                {"status": "sending", "lease_until": {"$lt": now}}
+            ]},
+            {"$set": {"status": "sending", "lease_until": now + timedelta(seconds=OUTBOX_LEASE_SECONDS),
+                      "lease_token": ObjectId()}},
+            sort=[("next_attempt_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def drain_once(self):
+        """Send up to one batch on the current connection. Returns the number of messages handled."""
+        handled = 0
+        while handled < self.batch_size:
+            job = self.claim()
+            if job is None:
+                break
+            handled += 1
+            try:
+                self.session.send(build_message(job["to"], job["subject"], job["body"]))
+            except (smtplib.SMTPException, OSError) as e:
+                self.session.close()
+                self._retry(job, e)
+            else:
+                sent = db.email_outbox.update_one(self._owned(job), {
+                    "$set": {"status": "sent", "sent_at": datetime.utcnow()},
+                    "$unset": {"lease_until": "", "lease_token": ""}
+                })
+                if not sent.matched_count:
+                    logger.warning(f"Outbox message {job['_id']} was sent after its lease was taken over")
+        return handled
+
+    def _owned(self, job):
+        """Filter matching the message only while this claim still holds its lease."""
+        return {"_id": job["_id"], "lease_token": job["lease_token"]}
+
+    def _retry(self, job, error):
+        attempts = job.get("attempts", 0) + 1
+        update = {"attempts": attempts, "last_error": str(error)}
+        if attempts >= OUTBOX_MAX_ATTEMPTS:
+            update["status"] = "failed"
+        else:
+            delay = OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+            update["status"] = "pending"
+            update["next_attempt_at"] = datetime.utcnow() + timedelta(seconds=delay * random.uniform(0.8, 1.2))
+        if not db.email_outbox.update_one(self._owned(job), {"$set": update, "$unset": {"lease_until": "", "lease_token": ""}}).matched_count:
+            logger.warning(f"Outbox message {job['_id']} failed after its lease was taken over")
+
+    def run(self, stop_event=None):
+        stop_event = stop_event or threading.Event()
+        try:
+            while not stop_event.is_set():
+                try:
+                    if self.drain_once():
+                        continue
+                except PyMongoError as e:
+                    logger.warning(f"Outbox worker could not reach the database: {e}")
+                if self.session.last_used and time.monotonic() - self.session.last_used > SMTP_IDLE_SECONDS:
+                    self.session.close()
+                    self.session.last_used = 0
+                stop_event.wait(OUTBOX_POLL_SECONDS)
+        finally:
+            self.session.close()
 
-    with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
-        server.starttls()
-        server.login(SMTP_USER, SMTP_PASS)
-        server.send_message(msg)
+def start_outbox_worker():
+    """Run an OutboxWorker on a daemon thread in this process. Returns the event that stops it."""
+    stop_event = threading.Event()
+    threading.Thread(target=OutboxWorker().run, args=(stop_event,), name="email-outbox", daemon=True).start()
+    return stop_event
@@ -0,0 +1,79 @@
+# src/utils/meal_images.py
+"""Meal photos, generated concurrently and stored by content.
+
+An image's key is the sha256 of the normalized meal name and description, so a dish that comes back
+week after week is generated once. Generation runs on a bounded pool shared by all callers; a caller
+waits at most its deadline (MEAL_IMAGE_DEADLINE by default), and images still in flight are stored for next time.
+"""
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, as_completed
+from datetime import datetime
+from bson.binary import Binary
+from src.utils.db import get_db
+from src.utils.openai_client import generate_image
+
+db = get_db()
+logger = logging.getLogger(__name__)
+
+MEAL_IMAGE_DEADLINE = float(os.getenv("MEAL_IMAGE_DEADLINE", 20))
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("MEAL_IMAGE_WORKERS", 6)), thread_name_prefix="meal-image")
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+def _normalize(text):
+    return " ".join((text or "").casefold().split())
+
+def image_key(name, description):
+    return hashlib.sha256(f"{_normalize(name)}\n{_normalize(description)}".encode("utf-8")).hexdigest()
+
+def _generate(key, name, description):
+    data = generate_image(name, description)
+    db.meal_images.update_one({"_id": key}, {"$setOnInsert": {
+        "data": Binary(data),
+        "name": name,
+        "description": description,
+        "created_at": datetime.utcnow()
+    }}, upsert=True)
+    return key
+
+def _submit(key, name, description):
+    """One generation per key at a time, however many requests want it."""
+    with _inflight_lock:
+        future = _inflight.get(key)
+        if future is None:
+            future = _executor.submit(_generate, key, name, description)
+            _inflight[key] = future
+            future.add_done_callback(lambda _: _inflight.pop(key, None))
+    return future
+
+def assign_image_keys(meals):
+    for meal in meals:
+        meal["image_key"] = image_key(meal.get("name"), meal.get("description"))
+
+def generate_missing(meals, deadline=MEAL_IMAGE_DEADLINE, on_done=None):
+    """Generate the images of keyed meals that are not cached yet, waiting up to deadline (None waits
+       for all). on_done(finished, total) is called as each completes. Returns the number not ready.
+    """
+    keys = {meal["image_key"] for meal in meals}
+    cached = {doc["_id"] for doc in db.meal_images.find({"_id": {"$in": list(keys)}}, {"_id": 1})}
+    futures = [_submit(meal["image_key"], meal.get("name", ""), meal.get("description", ""))
+               for meal in {m["image_key"]: m for m in meals if m["image_key"] not in cached}.values()]
+    ready = 0
+    try:
+        for finished, future in enumerate(as_completed(futures, timeout=deadline), 1):
+            if future.exception():
+                logger.warning(f"Meal image generation failed: {future.exception()}")
+            else:
+                ready += 1
+            if on_done:
+                on_done(finished, len(futures))
+    except TimeoutError:
+        pass
+    return len(futures) - ready
+
+def image_data(key):
+    doc = db.meal_images.find_one({"_id": key}, {"data": 1})
+    return bytes(doc["data"]) if doc else None
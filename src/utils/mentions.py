@@ -0,0 +1,54 @@
+# src/utils/mentions.py
+import os
+import re
+import threading
+import time
+from src.utils.db import get_db
+
+db = get_db()
+
+# Other app processes don't see invalidations, so cached indexes are also rebuilt after this many seconds.
+MENTION_INDEX_TTL = int(os.getenv("MENTION_INDEX_TTL", 300))
+
+class MentionIndex:
+    """A family's username -> user_id map compiled into a single regex."""
+
+    def __init__(self, members):
+        self.user_ids = {m["username"]: str(m["_id"]) for m in members if m.get("username")}
+        # Longest names first so "@bob.smith" is not cut short by a member called "bob".
+        names = sorted(self.user_ids, key=len, reverse=True)
+        self.pattern = re.compile(r"(?<![\w@])@(" + "|".join(map(re.escape, names)) + r")(?![\w-])") if names else None
+        self.built_at = time.monotonic()
+
+    def match(self, text):
+        """User ids mentioned in text, deduplicated, in order of first mention."""
+        if self.pattern is None or "@" not in text:
+            return []
+        return list(dict.fromkeys(self.user_ids[name] for name in self.pattern.findall(text)))
+
+_indexes = {}
+_lock = threading.Lock()
+
+def mention_index(family_id):
+    with _lock:
+        index = _indexes.get(family_id)
+    if index is not None and time.monotonic() - index.built_at < MENTION_INDEX_TTL:
+        return index
+
+    family = db.families.find_one({"_id": family_id}, {"members": 1})
+    members = db.users.find({"_id": {"$in": family["members"]}}, {"username": 1}) if family else []
+    index = MentionIndex(members)
+    with _lock:
+        _indexes[family_id] = index
+    return index
+
+def invalidate_mentions(family_id):
+    """Call after a family's membership or a member's username changes."""
+    with _lock:
+        _indexes.pop(family_id, None)
+
+def parse_mentions(text, family_id):
+    """Parse @mentions from text. Returns the deduplicated user_ids (as strings) of mentioned family members."""
+    if not text or "@" not in text:
+        return []
+    return mention_index(family_id).match(text)
@@ -0,0 +1,214 @@
+# src/utils/message_store.py
+"""Storage layouts for chat messages, selected with MESSAGE_STORAGE.
+
+"documents" keeps one document per message in `messages`. "bucketed" packs each family's messages
+into `message_buckets` documents holding up to MESSAGE_BUCKET_SIZE messages from a single day, so
+recent history is one or two document reads. Both stores return plain message dicts with the same
+fields. Messages already in `messages` are folded into buckets by compact_messages.
+"""
+import os
+import re
+from datetime import datetime
+from itertools import islice
+from bson.objectid import ObjectId
+from pymongo import IndexModel, ASCENDING, DESCENDING, TEXT
+from pymongo.errors import BulkWriteError
+from src.utils.db import get_db
+from src.utils.dates import start_of_day
+from src.utils.pagination import decode_time_cursor, newer_than
+
+db = get_db()
+
+MESSAGE_STORAGE = os.getenv("MESSAGE_STORAGE", "documents")
+BUCKET_SIZE = int(os.getenv("MESSAGE_BUCKET_SIZE", 200))
+TEXT_SCORE = {"$meta": "textScore"}
+
+INDEXES = {
+    "message_buckets": [
+        IndexModel([("family_id", ASCENDING), ("end", DESCENDING)]),
+        IndexModel([("family_id", ASCENDING), ("day", ASCENDING)]),
+        IndexModel([("family_id", ASCENDING), ("messages._id", ASCENDING)]),
+        IndexModel([("family_id", ASCENDING), ("messages.content", TEXT)], name="message_buckets_text"),
+    ],
+    # compact_messages walks old messages in this order.
+    "messages": [IndexModel([("family_id", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)])],
+}
+QUERY_SHAPES = [
+    ("message_buckets", {"family_id": ObjectId()}, [("end", DESCENDING)]),
+    ("message_buckets", {"family_id": ObjectId(), "day": datetime(2024, 1, 1), "count": {"$lt": BUCKET_SIZE}}, None),
+    ("message_buckets", {"family_id": ObjectId(), "end": {"$gte": datetime(2024, 1, 1)}}, [("start", ASCENDING)]),
+    ("message_buckets", {"family_id": ObjectId(), "messages._id": ObjectId()}, None),
+    ("message_buckets", {"family_id": {"$in": [ObjectId()]}, "messages._id": {"$in": [ObjectId()]}}, None),
+    ("messages", {"timestamp": {"$lt": datetime(2024, 1, 1)}},
+     [("family_id", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)]),
+]
+
+def _order(message):
+    return message["timestamp"], message["_id"]
+
+class DocumentStore:
+    def insert(self, message):
+        db.messages.insert_one(message)
+        return message
+
+    def latest(self, family_id, limit, max_time_ms=None):
+        """The newest `limit` messages, oldest first."""
+        cursor = db.messages.find({"family_id": family_id}).sort("timestamp", DESCENDING).limit(limit)
+        if max_time_ms:
+            cursor = cursor.max_time_ms(max_time_ms)
+        messages = list(cursor)
+        messages.reverse()
+        return messages
+
+    def since(self, family_id, cursor, limit):
+        """Messages after a (timestamp, _id) cursor, oldest first."""
+        query = {"family_id": family_id}
+        query.update(newer_than(cursor))
+        return list(db.messages.find(query).sort([("timestamp", ASCENDING), ("_id", ASCENDING)]).limit(limit))
+
+    def get(self, family_id, message_id):
+        return db.messages.find_one({"_id": ObjectId(message_id), "family_id": family_id})
+
+    def count_unread(self, family_id, user_id, after, limit):
+        query = {"family_id": family_id, "recipient_ids": user_id, "timestamp": {"$gt": after}}
+        return db.messages.count_documents(query, limit=limit)
+
+    def text_search(self, query, projection, limit):
+        return list(db.messages.find(query, dict(projection, score=TEXT_SCORE))
+                    .sort([("score", TEXT_SCORE)]).limit(limit))
+
+class BucketStore:
+    def insert(self, message):
+        """Append to the family's open bucket for the message's day, opening a new one when it is full."""
+        message.setdefault("_id", ObjectId())
+        stored = {k: v for k, v in message.items() if k != "family_id"}
+        timestamp = message["timestamp"]
+        db.message_buckets.update_one(
+            {"family_id": message["family_id"], "day": start_of_day(timestamp), "count": {"$lt": BUCKET_SIZE}},
+            {"$push": {"messages": stored}, "$inc": {"count": 1}, "$min": {"start": timestamp}, "$max": {"end": timestamp}},
+            upsert=True
+        )
+        return message
+
+    def _unpack(self, bucket):
+        for m in bucket["messages"]:
+            m["family_id"] = bucket["family_id"]
+        return bucket["messages"]
+
+    def latest(self, family_id, limit, max_time_ms=None):
+        """The newest `limit` messages, oldest first. Buckets are read newest first until no
+           remaining bucket can hold anything newer than what has been collected.
+        """
+        cursor = db.message_buckets.find({"family_id": family_id}).sort("end", DESCENDING).batch_size(2)
+        if max_time_ms:
+            cursor = cursor.max_time_ms(max_time_ms)
+        messages = []
+        with cursor:
+            for bucket in cursor:
+                if len(messages) >= limit:
+                    messages.sort(key=_order)
+                    if messages[-limit]["timestamp"] > bucket["end"]:
+                        break
+                messages.extend(self._unpack(bucket))
+        messages.sort(key=_order)
+        return messages[-limit:]
+
+    def since(self, family_id, cursor, limit):
+        """Messages after a (timestamp, _id) cursor, oldest first."""
+        after = decode_time_cursor(cursor)
+        messages = []
+        buckets = db.message_buckets.find({"family_id": family_id, "end": {"$gte": after[0]}}).sort("start", ASCENDING).batch_size(2)
+        with buckets:
+            for bucket in buckets:
+                if len(messages) >= limit:
+                    messages.sort(key=_order)
+                    if messages[limit - 1]["timestamp"] < bucket["start"]:
+                        break
+                messages.extend(m for m in self._unpack(bucket) if _order(m) > after)
+        messages.sort(key=_order)
+        return messages[:limit]
+
+    def get(self, family_id, message_id):
+        message_id = ObjectId(message_id)
+        bucket = db.message_buckets.find_one({"family_id": family_id, "messages._id": message_id},
+                                             {"family_id": 1, "messages": {"$elemMatch": {"_id": message_id}}})
+        return self._unpack(bucket)[0] if bucket else None
+
+    def count_unread(self, family_id, user_id, after, limit):
+        result = list(db.message_buckets.aggregate([
+            {"$match": {"family_id": family_id, "end": {"$gt": after}}},
+            {"$unwind": "$messages"},
+            {"$match": {"messages.recipient_ids": user_id, "messages.timestamp": {"$gt": after}}},
+            {"$limit": limit},
+            {"$count": "unread"}
+        ]))
+        return result[0]["unread"] if result else 0
+
+    def text_search(self, query, projection, limit):
+        """Rank buckets with the text index, then keep the messages in them containing a search word.
+           Each message takes its bucket's score; word matching is plain substring, without stemming.
+        """
+        words = [w for w in re.findall(r"\w+", query["$text"]["$search"].lower()) if w]
+        buckets = db.message_buckets.find(query, {"family_id": 1, "messages": 1, "score": TEXT_SCORE}) \
+            .sort([("score", TEXT_SCORE)]).limit(limit)
+        hits = []
+        for bucket in buckets:
+            for m in self._unpack(bucket):
+                if any(w in m.get("content", "").lower() for w in words):
+                    m["score"] = bucket["score"]
+                    hits.append(m)
+                    if len(hits) >= limit:
+                        return hits
+        return hits
+
+def compact_messages(older_than, batch_size=1000):
+    """Fold messages documents older than `older_than` into day buckets, one batch at a time.
+       Old messages are read in a single pass over the (family_id, timestamp, _id) index. Messages
+       already held by a stored bucket are not bucketed again, and messages are only deleted once a
+       stored bucket holds them, so an interrupted run can be resumed with any batch size.
+       Returns (messages moved, buckets written).
+    """
+    moved = written = 0
+    cursor = (db.messages.find({"timestamp": {"$lt": older_than}})
+              .sort([("family_id", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)]).batch_size(batch_size))
+    while True:
+        batch = list(islice(cursor, batch_size))
+        if not batch:
+            break
+
+        ids = [m["_id"] for m in batch]
+        family_ids = list({m["family_id"] for m in batch})
+        already = _bucketed(family_ids, ids)
+        buckets = []
+        for m in batch:
+            if m["_id"] in already:
+                continue
+            day = start_of_day(m["timestamp"])
+            bucket = buckets[-1] if buckets else None
+            if bucket is None or bucket["family_id"] != m["family_id"] or bucket["day"] != day or bucket["count"] >= BUCKET_SIZE:
+                bucket = {"_id": m["_id"], "family_id": m["family_id"], "day": day, "count": 0,
+                          "start": m["timestamp"], "messages": []}
+                buckets.append(bucket)
+            bucket["messages"].append({k: v for k, v in m.items() if k != "family_id"})
+            bucket["count"] += 1
+            bucket["end"] = m["timestamp"]
+        if buckets:
+            try:
+                written += len(db.message_buckets.insert_many(buckets, ordered=False).inserted_ids)
+            except BulkWriteError as e:
+                if any(err["code"] != 11000 for err in e.details["writeErrors"]):
+                    raise
+                written += e.details["nInserted"]
+
+        stored = _bucketed(family_ids, ids)
+        moved += db.messages.delete_many({"_id": {"$in": [i for i in ids if i in stored]}}).deleted_count
+    return moved, written
+
+def _bucketed(family_ids, message_ids):
+    """The ids among message_ids that some stored bucket already holds."""
+    wanted = set(message_ids)
+    buckets = db.message_buckets.find({"family_id": {"$in": family_ids}, "messages._id": {"$in": message_ids}},
+                                      {"messages._id": 1})
+    return {m["_id"] for b in buckets for m in b["messages"] if m["_id"] in wanted}
+
+message_store = BucketStore() if MESSAGE_STORAGE == "bucketed" else DocumentStore()
@@ -0,0 +1,140 @@
+# src/utils/migrations.py
+import hashlib
+from bson.objectid import ObjectId
+from pymongo import UpdateOne
+from src.utils.db import get_db
+from src.tasks import comment_preview
+from src.calendar import bump_calendar_version
+from src.utils.dates import parse_date
+
+db = get_db()
+
+def _embedded_comment_id(task_id, index):
+    # Deterministic ids make re-running an interrupted batch a no-op for comments already copied.
+    return ObjectId(hashlib.sha1(f"{task_id}:{index}".encode()).digest()[:12])
+
+def migrate_task_comments(batch_size=500):
+    """Move embedded tasks.comments arrays into task_comments, one batch of tasks at a time.
+       The app no longer writes to the embedded arrays, so this is safe to run while it serves traffic,
+       and safe to re-run after an interruption. Returns (tasks migrated, comments moved).
+    """
+    migrated_tasks = moved_comments = 0
+    while True:
+        batch = list(db.tasks.find({"comments": {"$exists": True}}, {"family_id": 1, "comments": 1}).limit(batch_size))
+        if not batch:
+            break
+
+        user_ids = {c["user_id"] for t in batch for c in t["comments"] or []}
+        names = {u["_id"]: u.get("username", "") for u in db.users.find({"_id": {"$in": list(user_ids)}}, {"username": 1})}
+
+        comment_ops = []
+        for t in batch:
+            for i, c in enumerate(t["comments"] or []):
+                comment_ops.append(UpdateOne({"_id": _embedded_comment_id(t["_id"], i)}, {"$setOnInsert": {
+                    "task_id": t["_id"],
+                    "family_id": t["family_id"],
+                    "user_id": c["user_id"],
+                    "user_name": names.get(c["user_id"], ""),
+                    "comment": c["comment"],
+                    "timestamp": c["timestamp"]
+                }}, upsert=True))
+        if comment_ops:
+            db.task_comments.bulk_write(comment_ops, ordered=False)
+            moved_comments += len(comment_ops)
+
+        # Recount from task_comments so comments added since the deploy are included.
+        stats = {row["_id"]: row for row in db.task_comments.aggregate([
+            {"$match": {"task_id": {"$in": [t["_id"] for t in batch]}}},
+            {"$sort": {"timestamp": 1}},
+            {"$group": {"_id": "$task_id", "count": {"$sum": 1}, "last": {"$last": "$$ROOT"}}}
+        ])}
+        task_ops = []
+        for t in batch:
+            update = {"$unset": {"comments": ""}, "$set": {"comment_count": 0}}
+            if t["_id"] in stats:
+                update["$set"] = {"comment_count": stats[t["_id"]]["count"], "last_comment": comment_preview(stats[t["_id"]]["last"])}
+            task_ops.append(UpdateOne({"_id": t["_id"]}, update))
+        db.tasks.bulk_write(task_ops, ordered=False)
+        migrated_tasks += len(batch)
+    return migrated_tasks, moved_comments
+
+def _event_dates(event):
+    update = {"date": parse_date(event["date"], event.get("time") or "00:00")}
+    rule = event.get("rrule")
+    if rule and isinstance(rule.get("until"), str):
+        update["rrule.until"] = parse_date(rule["until"])
+    if event.get("exdates"):
+        update["exdates"] = [parse_date(d) for d in event["exdates"]]
+    return update
+
+# collection -> (string field selecting unconverted documents, projection, converter)
+DATE_MIGRATIONS = {
+    "events": ("date", {"family_id": 1, "date": 1, "time": 1, "rrule": 1, "exdates": 1}, _event_dates),
+    "tasks": ("due_date", {"due_date": 1}, lambda t: {"due_date": parse_date(t["due_date"])}),
+    "expenses": ("date", {"date": 1}, lambda x: {"date": parse_date(x["date"])}),
+}
+
+def migrate_dates(batch_size=500):
+    """Convert "YYYY-MM-DD" string dates to BSON datetimes in place, one _id-ordered batch at a time.
+       Only documents whose field is still a string are selected, so the run can be interrupted and
+       resumed, and each update is conditioned on the old value so it never clobbers a concurrent edit.
+       Unparseable values are left as they are. Families whose events changed get their calendar
+       version bumped once at the end. Returns {collection: (converted, unparseable)}.
+    """
+    results = {}
+    calendar_families = set()
+    for collection, (field, projection, convert) in DATE_MIGRATIONS.items():
+        converted = failed = 0
+        last_id = None
+        while True:
+            query = {field: {"$type": "string"}}
+            if last_id is not None:
+                query["_id"] = {"$gt": last_id}
+            batch = list(db[collection].find(query, projection).sort("_id", 1).limit(batch_size))
+            if not batch:
+                break
+            last_id = batch[-1]["_id"]
+
+            ops = []
+            for doc in batch:
+                try:
+                    ops.append(UpdateOne({"_id": doc["_id"], field: doc[field]}, {"$set": convert(doc)}))
+                except ValueError:
+                    failed += 1
+                    continue
+                if collection == "events":
+                    calendar_families.add(doc["family_id"])
+            if ops:
+                converted += db[collection].bulk_write(ops, ordered=False).modified_count
+        results[collection] = (converted, failed)
+    for family_id in calendar_families:
+        bump_calendar_version(family_id)
+    return results
+
+def migrate_read_cursors(batch_size=500):
+    """Replace messages.read_by arrays with per-user read cursors, one _id-ordered batch at a time.
+       Each user's cursor moves to the newest message they had marked read, so older messages they
+       skipped also count as read afterwards. Safe to re-run. Returns (messages processed, cursor updates).
+    """
+    processed = updates = 0
+    while True:
+        batch = list(db.messages.find({"read_by": {"$exists": True}}, {"family_id": 1, "read_by": 1, "timestamp": 1})
+                     .sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+
+        newest = {}
+        for m in batch:
+            for user_id in m["read_by"] or []:
+                key = (user_id, m["family_id"])
+                newest[key] = max(newest.get(key, m["timestamp"]), m["timestamp"])
+        if newest:
+            db.read_cursors.bulk_write([
+                UpdateOne({"user_id": user_id, "family_id": family_id}, {"$max": {"last_read": timestamp}}, upsert=True)
+                for (user_id, family_id), timestamp in newest.items()
+            ], ordered=False)
+            updates += len(newest)
+
+        db.messages.update_many({"_id": {"$in": [m["_id"] for m in batch]}}, {"$unset": {"read_by": ""}})
+        processed += len(batch)
+    return processed, updates
@@ -1,35 +1,74 @@
 # src/utils/notifications.py
 from datetime import datetime
 from bson.objectid import ObjectId
+from pymongo import UpdateOne
 from src.utils.db import get_db
 
 db = get_db()
 
-def send_notification(user_id, message):
-    """Send a notification to a specific user."""
-    db.notifications.insert_one({
-        "user_id": ObjectId(user_id),
+def notify_users(user_ids, message):
+    """Fan a notification out to several users: one unordered insert_many plus one bulk counter update."""
+    recipients = [ObjectId(uid) for uid in dict.fromkeys(str(uid) for uid in user_ids)]
+    if not recipients:
+        return
+    now = datetime.utcnow()
+    db.notifications.insert_many([{
+        "user_id": uid,
         "message": message,
         "read": False,
-        "timestamp": datetime.utcnow()
-    })
+        "timestamp": now
+    } for uid in recipients], ordered=False)
+    db.notification_counters.bulk_write([
+        UpdateOne({"_id": uid}, {"$inc": {"unread": 1}}, upsert=True) for uid in recipients
+    ], ordered=False)
 
-def parse_mentions(text, family_members):
-    """Parse @mentions from text. Returns a list of user_ids mentioned.
-       family_members: list of user docs with 'username' and '_id'.
-    """
-    mentions = []
-    # Extract words starting with '@'
-    words = text.split()
-    for w in words:
-        if w.startswith("@"):
-            username = w[1:]
-            for m in family_members:
-                if m.get("username") == username:
-                    mentions.append(str(m["_id"]))
-    return mentions
+def send_notification(user_id, message):
+    """Send a notification to a specific user."""
+    notify_users([user_id], message)
 
 def notify_mentions(mentioned_user_ids, message):
     """Send notification to all mentioned users."""
-    for uid in mentioned_user_ids:
-        send_notification(uid, message)
+    notify_users(mentioned_user_ids, message)
+
+def unread_count(user_id):
+    counter = db.notification_counters.find_one({"_id": ObjectId(user_id)})
+    return counter["unread"] if counter else 0
+
+def mark_read(user_id, notification_id):
+    result = db.notifications.update_one({"_id": ObjectId(notification_id), "user_id": ObjectId(user_id), "read": False},
+                                         {"$set": {"read": True}})
+    if result.modified_count:
+        db.notification_counters.update_one({"_id": ObjectId(user_id)}, {"$inc": {"unread": -1}})
+    return result.modified_count
+
+def mark_all_read(user_id):
+    """Mark every unread notification read in one update_many.
+       The counter is decremented by what was actually marked, so notifications
+       arriving concurrently still count as unread. Counters that predate this
+       or have drifted are repaired by rebuild_unread_counters.
+    """
+    result = db.notifications.update_many({"user_id": ObjectId(user_id), "read": False}, {"$set": {"read": True}})
+    if result.modified_count:
+        db.notification_counters.update_one({"_id": ObjectId(user_id)}, {"$inc": {"unread": -result.modified_count}})
+    return result.modified_count
+
+def rebuild_unread_counters(batch_size=1000):
+    """Recount notification_counters from the unread notifications, for counters that predate
+       them or have drifted. Users with no unread notifications are reset to 0.
+       Returns (users with unread notifications, counters reset to 0).
+    """
+    ops = []
+    counted = []
+    for row in db.notifications.aggregate([
+        {"$match": {"read": False}},
+        {"$group": {"_id": "$user_id", "unread": {"$sum": 1}}}
+    ]):
+        counted.append(row["_id"])
+        ops.append(UpdateOne({"_id": row["_id"]}, {"$set": {"unread": row["unread"]}}, upsert=True))
+        if len(ops) >= batch_size:
+            db.notification_counters.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        db.notification_counters.bulk_write(ops, ordered=False)
+    reset = db.notification_counters.update_many({"_id": {"$nin": counted}, "unread": {"$ne": 0}}, {"$set": {"unread": 0}})
+    return len(counted), reset.modified_count
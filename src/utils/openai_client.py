@@ -1,21 +1,210 @@
 # src/utils/openai_client.py
+"""OpenAI REST calls over one pooled, keep-alive session.
+
+Every call has a connect and read timeout, 429 and 5xx responses are retried with jittered
+exponential backoff, and a circuit breaker fails calls fast while the API keeps failing.
+Latencies are recorded per endpoint in fixed-bucket histograms.
+"""
+import base64
+import bisect
+import json
 import os
-import openai
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from src.utils.llm_cache import cached_call, prompt_key
+
+# Point at a local stub (see benchmarks/openai_stub.py) for load tests.
+OPENAI_API_BASE = os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", 5))
+COMPLETION_TIMEOUT = float(os.getenv("OPENAI_COMPLETION_TIMEOUT", 90))
+IMAGE_REQUEST_TIMEOUT = float(os.getenv("OPENAI_IMAGE_TIMEOUT", 60))
+TRANSCRIPTION_TIMEOUT = float(os.getenv("OPENAI_TRANSCRIPTION_TIMEOUT", 120))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", 3))
+OPENAI_RETRY_BASE_SECONDS = float(os.getenv("OPENAI_RETRY_BASE_SECONDS", 0.5))
+OPENAI_RETRY_MAX_SECONDS = float(os.getenv("OPENAI_RETRY_MAX_SECONDS", 8))
+# Enough connections for the meal image pool plus request threads.
+OPENAI_POOL_SIZE = int(os.getenv("OPENAI_POOL_SIZE", 16))
+BREAKER_FAILURES = int(os.getenv("OPENAI_BREAKER_FAILURES", 5))
+BREAKER_RESET_SECONDS = float(os.getenv("OPENAI_BREAKER_RESET_SECONDS", 30))
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+MEALS_MODEL = "text-davinci-003"
+
+# Transport failures worth another attempt; any other requests error fails the call at once.
+RETRYABLE_ERRORS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.ContentDecodingError, requests.JSONDecodeError)
+
+class OpenAIError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+class CircuitOpenError(OpenAIError):
+    pass
+
+class CircuitBreaker:
+    """Opens after `failures` consecutive failed calls; after reset_seconds one trial call is let
+       through, and its outcome closes or reopens the circuit.
+    """
+
+    def __init__(self, failures=BREAKER_FAILURES, reset_seconds=BREAKER_RESET_SECONDS):
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self._consecutive = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half-open" if time.monotonic() - self._opened_at >= self.reset_seconds else "open"
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_seconds or self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive += 1
+            self._trial_running = False
+            if self._opened_at is not None or self._consecutive >= self.failures:
+                self._opened_at = time.monotonic()
 
-openai.api_key = os.getenv("OPENAI_API_KEY")
+class LatencyHistogram:
+    """Per-endpoint request latencies in fixed millisecond buckets."""
 
-def generate_meals(family_preferences):
+    def __init__(self, bounds_ms=LATENCY_BUCKETS_MS):
+        self.bounds_ms = bounds_ms
+        self._counts = {}
+        self._sums = {}
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint, seconds):
+        ms = seconds * 1000
+        with self._lock:
+            counts = self._counts.setdefault(endpoint, [0] * (len(self.bounds_ms) + 1))
+            counts[bisect.bisect_left(self.bounds_ms, ms)] += 1
+            self._sums[endpoint] = self._sums.get(endpoint, 0) + ms
+
+    def snapshot(self):
+        """{endpoint: {"buckets": {"<=50ms": n, ..., ">60000ms": n}, "count": n, "mean_ms": x}}"""
+        labels = [f"<={b}ms" for b in self.bounds_ms] + [f">{self.bounds_ms[-1]}ms"]
+        with self._lock:
+            return {endpoint: {
+                "buckets": dict(zip(labels, counts)),
+                "count": sum(counts),
+                "mean_ms": self._sums[endpoint] / sum(counts)
+            } for endpoint, counts in self._counts.items()}
+
+class OpenAIClient:
+    """A shared requests.Session to the OpenAI API. Safe to use from several threads."""
+
+    def __init__(self, base_url=OPENAI_API_BASE, api_key=OPENAI_API_KEY, max_retries=OPENAI_MAX_RETRIES,
+                 breaker=None, histogram=None):
+        self.base_url = base_url.rstrip("/")
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+        self.histogram = histogram or LatencyHistogram()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=OPENAI_POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        if api_key:
+            self.session.headers["Authorization"] = f"Bearer {api_key}"
+
+    def _backoff(self, attempt, response=None):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), OPENAI_RETRY_MAX_SECONDS)
+        return min(OPENAI_RETRY_MAX_SECONDS, OPENAI_RETRY_BASE_SECONDS * 2 ** attempt) * random.uniform(0.5, 1.5)
+
+    def post(self, path, timeout, **kwargs):
+        """POST to path and return the decoded JSON body. Raises CircuitOpenError without calling
+           the API while the circuit is open, and OpenAIError once retries are exhausted.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"OpenAI circuit open, not calling {path}")
+        # Every exit records an outcome, so a half-open trial call never stays claimed.
+        api_up = False
+        try:
+            error = None
+            for attempt in range(self.max_retries + 1):
+                response = None
+                start = time.perf_counter()
+                try:
+                    response = self.session.post(self.base_url + path, timeout=(OPENAI_CONNECT_TIMEOUT, timeout), **kwargs)
+                    if response.ok:
+                        body = response.json()
+                        api_up = True
+                        return body
+                except RETRYABLE_ERRORS as e:
+                    error = OpenAIError(f"{path}: {e}")
+                    response = None
+                except requests.RequestException as e:
+                    raise OpenAIError(f"{path}: {e}") from e
+                finally:
+                    self.histogram.observe(path, time.perf_counter() - start)
+
+                if response is not None:
+                    error = OpenAIError(f"{path}: HTTP {response.status_code} {response.text[:200]}", response.status_code)
+                    if response.status_code != 429 and response.status_code < 500:
+                        # The request itself was rejected; the API is up, and retrying will not help.
+                        api_up = True
+                        raise error
+                if attempt < self.max_retries:
+                    time.sleep(self._backoff(attempt, response))
+            raise error
+        finally:
+            if api_up:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+
+client = OpenAIClient()
+
+def latency_histograms():
+    return client.histogram.snapshot()
+
+def _is_json(text):
+    try:
+        json.loads(text)
+    except ValueError:
+        return False
+    return True
+
+def generate_meals(family_preferences, week_start, refresh=False):
+    """Meal plan JSON text for the preferences and week (YYYY-MM-DD). The same preferences and week
+       reuse a cached plan unless refresh.
+    """
+    # Sorted so the same preferences always build the same prompt, and so the same cache key.
     prompt = f"""
     Given the following family dietary preferences:
-    Restrictions: {', '.join(family_preferences.get('dietary_restrictions', []))}
-    Likes: {', '.join(family_preferences.get('common_likes', []))}
-    Dislikes: {', '.join(family_preferences.get('common_dislikes', []))}
+    Restrictions: {', '.join(sorted(family_preferences.get('dietary_restrictions', [])))}
+    Likes: {', '.join(sorted(family_preferences.get('common_likes', [])))}
+    Dislikes: {', '.join(sorted(family_preferences.get('common_dislikes', [])))}
 
-    Generate a 7-day meal plan (breakfast, lunch, dinner) with recipes and ingredients.
+    Generate a 7-day meal plan (breakfast, lunch, dinner) for the week starting {week_start} with recipes and ingredients.
     Include a short description for each meal and assume {family_preferences.get('servings',4)} servings.
     Respond in JSON:
     {{
-      "week_start": "<YYYY-MM-DD>",
+      "week_start": "{week_start}",
       "meals": [
         {{
           "day": "Mon",
@@ -28,24 +217,31 @@ def generate_meals(family_preferences):
       ]
     }}
     """
-    response = openai.Completion.create(
-        engine="text-davinci-003",
-        prompt=prompt,
-        max_tokens=2000,
-        temperature=0.7,
-    )
-    return response.choices[0].text.strip()
+    def complete():
+        response = client.post("/completions", COMPLETION_TIMEOUT, json={
+            "model": MEALS_MODEL,
+            "prompt": prompt,
+            "max_tokens": 2000,
+            "temperature": 0.7
+        })
+        return response["choices"][0]["text"].strip()
+    return cached_call("generate_meals", prompt_key(MEALS_MODEL, prompt), complete, refresh=refresh, valid=_is_json)
 
 def generate_image(meal_name, description):
+    """PNG bytes of a generated photo. Returned inline because hosted image URLs expire."""
     prompt = f"Create a realistic photograph of {meal_name}. {description}"
-    img_response = openai.Image.create(
-        prompt=prompt,
-        n=1,
-        size="512x512"
-    )
-    return img_response["data"][0]["url"]
+    img_response = client.post("/images/generations", IMAGE_REQUEST_TIMEOUT, json={
+        "prompt": prompt,
+        "n": 1,
+        "size": "512x512",
+        "response_format": "b64_json"
+    })
+    return base64.b64decode(img_response["data"][0]["b64_json"])
 
 def transcribe_audio(audio_path):
+    # Read up front so a retried upload sends the whole file again.
     with open(audio_path, "rb") as f:
-        transcript = openai.Audio.transcribe("whisper-1", f)
-    return transcript
+        audio = f.read()
+    transcript = client.post("/audio/transcriptions", TRANSCRIPTION_TIMEOUT,
+                             files={"file": (os.path.basename(audio_path), audio)}, data={"model": "whisper-1"})
+    return transcript["text"]
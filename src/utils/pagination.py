@@ -0,0 +1,37 @@
+# src/utils/pagination.py
+import base64
+import json
+from datetime import datetime
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+
+def encode_time_cursor(doc, field="timestamp"):
+    """Opaque keyset cursor for feeds ordered by (timestamp, _id)."""
+    return base64.urlsafe_b64encode(json.dumps([doc[field].isoformat(), str(doc["_id"])]).encode()).decode()
+
+def decode_time_cursor(cursor):
+    """(timestamp, _id) from a cursor. Raises ValueError if it was not made by encode_time_cursor."""
+    try:
+        timestamp, doc_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(timestamp), ObjectId(doc_id)
+    except (ValueError, TypeError, InvalidId) as e:
+        raise ValueError("Invalid cursor") from e
+
+def page_limit(value, default, maximum):
+    """A page size from a query parameter, clamped to 1..maximum. Raises ValueError if it is not an integer."""
+    if value in (None, ""):
+        return default
+    try:
+        return max(1, min(int(value), maximum))
+    except ValueError:
+        raise ValueError("limit must be an integer") from None
+
+def older_than(cursor, field="timestamp"):
+    """Query clause selecting documents before a cursor in (field, _id) descending order."""
+    timestamp, doc_id = decode_time_cursor(cursor)
+    return {"$or": [{field: {"$lt": timestamp}}, {field: timestamp, "_id": {"$lt": doc_id}}]}
+
+def newer_than(cursor, field="timestamp"):
+    """Query clause selecting documents after a cursor in (field, _id) ascending order."""
+    timestamp, doc_id = decode_time_cursor(cursor)
+    return {"$or": [{field: {"$gt": timestamp}}, {field: timestamp, "_id": {"$gt": doc_id}}]}
@@ -0,0 +1,111 @@
+# src/utils/pubsub.py
+"""In-process publish/subscribe for pushing live updates to open connections.
+
+A subscriber blocks on its own queue, so an idle connection costs one waiting thread and an
+empty queue; nothing runs until something is published. Publishers in other processes are only
+seen through relay_inserts, which republishes a collection's change stream locally.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from pymongo.errors import PyMongoError
+
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv("SUBSCRIBER_QUEUE_SIZE", 100))
+RELAY_RETRY_SECONDS = float(os.getenv("RELAY_RETRY_SECONDS", 5))
+
+logger = logging.getLogger(__name__)
+
+class Subscription:
+    def __init__(self, broker, topic):
+        self.broker = broker
+        self.topic = topic
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        # Set when a publish found the queue full; the consumer should resync from its own cursor.
+        self.overflowed = False
+
+    def get(self, timeout=None):
+        """The next payload, or None if nothing arrived within timeout."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class Broker:
+    def __init__(self):
+        self._topics = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, topic):
+        sub = Subscription(self, topic)
+        with self._lock:
+            self._topics[topic].add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            subs = self._topics.get(sub.topic)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._topics[sub.topic]
+
+    def publish(self, topic, payload):
+        """Hand payload to every subscriber of topic without blocking. Returns how many received it."""
+        with self._lock:
+            subs = list(self._topics.get(topic, ()))
+        delivered = 0
+        for sub in subs:
+            try:
+                sub.queue.put_nowait(payload)
+                delivered += 1
+            except queue.Full:
+                sub.overflowed = True
+        return delivered
+
+    def subscriber_count(self, topic=None):
+        with self._lock:
+            if topic is not None:
+                return len(self._topics.get(topic, ()))
+            return sum(len(subs) for subs in self._topics.values())
+
+broker = Broker()
+
+def relay_inserts(collection, topic_for, payload_for, stop_event=None):
+    """Publish every document inserted into collection, by any process, via a change stream.
+       Requires a replica set. Resumes after errors from the last seen change.
+    """
+    stop_event = stop_event or threading.Event()
+    resume_token = None
+    while not stop_event.is_set():
+        try:
+            with collection.watch([{"$match": {"operationType": "insert"}}], resume_after=resume_token,
+                                  max_await_time_ms=1000) as stream:
+                while not stop_event.is_set():
+                    change = stream.try_next()
+                    if change is None:
+                        continue
+                    resume_token = stream.resume_token
+                    doc = change["fullDocument"]
+                    broker.publish(topic_for(doc), payload_for(doc))
+        except PyMongoError as e:
+            logger.warning(f"Change stream relay for {collection.name} failed, retrying: {e}")
+            time.sleep(RELAY_RETRY_SECONDS)
+
+def start_relay(collection, topic_for, payload_for):
+    """Run relay_inserts on a daemon thread. Returns the event that stops it."""
+    stop_event = threading.Event()
+    threading.Thread(target=relay_inserts, args=(collection, topic_for, payload_for, stop_event),
+                     name=f"relay-{collection.name}", daemon=True).start()
+    return stop_event
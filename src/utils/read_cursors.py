@@ -0,0 +1,37 @@
+# src/utils/read_cursors.py
+"""Per-user read position in a family's message thread.
+
+A user has read every message up to their cursor's last_read timestamp, so marking read is a single
+monotonic $max and unread counts are a range count over the messages addressed to them.
+"""
+import os
+from datetime import datetime
+from bson.objectid import ObjectId
+from src.utils.db import get_db
+from src.utils.message_store import message_store
+
+db = get_db()
+
+# Counting stops here, so a long-absent user costs no more than this many index keys.
+UNREAD_COUNT_LIMIT = int(os.getenv("UNREAD_COUNT_LIMIT", 999))
+
+def _key(user_id, family_id):
+    return {"user_id": ObjectId(user_id), "family_id": ObjectId(family_id)}
+
+def last_read(user_id, family_id):
+    cursor = db.read_cursors.find_one(_key(user_id, family_id), {"last_read": 1})
+    return cursor["last_read"] if cursor else datetime.min
+
+def mark_read_through(user_id, family_id, timestamp):
+    """Move the user's cursor forward to timestamp; it never moves backwards."""
+    db.read_cursors.update_one(_key(user_id, family_id),
+                               {"$max": {"last_read": timestamp}, "$set": {"updated_at": datetime.utcnow()}},
+                               upsert=True)
+
+def mark_all_read(user_id, family_id):
+    mark_read_through(user_id, family_id, datetime.utcnow())
+
+def unread_count(user_id, family_id):
+    """Messages addressed to the user after their cursor, capped at UNREAD_COUNT_LIMIT."""
+    return message_store.count_unread(ObjectId(family_id), ObjectId(user_id), last_read(user_id, family_id),
+                                      UNREAD_COUNT_LIMIT)
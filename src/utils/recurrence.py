@@ -0,0 +1,140 @@
+# src/utils/recurrence.py
+"""RRULE-style recurrence stored once on an event and expanded on demand.
+
+A rule is {"freq": "daily"|"weekly"|"monthly"|"yearly", "interval": int,
+"until": datetime of the last day or None, "count": int or None}. Skipped
+occurrences are kept beside it on the event as `exdates` (datetimes; only the day counts).
+"""
+import calendar
+import os
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from src.utils.dates import parse_date
+
+FREQUENCIES = ("daily", "weekly", "monthly", "yearly")
+RECURRENCE_CACHE_SIZE = int(os.getenv("RECURRENCE_CACHE_SIZE", 4096))
+
+def as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value[:10], "%Y-%m-%d").date()
+
+def make_rule(freq, interval=1, until=None, count=None):
+    """Build a rule from form-style values. Returns None for "none" or an unknown frequency."""
+    freq = (freq or "").lower()
+    if freq not in FREQUENCIES:
+        return None
+    return {
+        "freq": freq,
+        "interval": max(1, int(interval or 1)),
+        "until": parse_date(until),
+        "count": int(count) if count else None
+    }
+
+def _nth(start, freq, n):
+    # start is a datetime; the time of day carries through to every occurrence.
+    """The candidate n periods after start, or None when that date does not exist (31 April, 29 Feb 2023)."""
+    if freq == "daily":
+        return start + timedelta(days=n)
+    if freq == "weekly":
+        return start + timedelta(weeks=n)
+    months = start.month - 1 + n * (12 if freq == "yearly" else 1)
+    year, month = start.year + months // 12, months % 12 + 1
+    if start.day > calendar.monthrange(year, month)[1]:
+        return None
+    return start.replace(year=year, month=month)
+
+def _periods_before(start, freq, interval, day):
+    """How many whole steps fit between start and day, so expansion can jump straight to the window."""
+    if freq in ("daily", "weekly"):
+        step = interval * (7 if freq == "weekly" else 1)
+        return max(0, (day - start).days // step)
+    months = (day.year - start.year) * 12 + day.month - start.month
+    return max(0, months // (interval * (12 if freq == "yearly" else 1)))
+
+def _may_skip(start, freq):
+    return (freq == "monthly" and start.day > 28) or (freq == "yearly" and (start.month, start.day) == (2, 29))
+
+@lru_cache(maxsize=RECURRENCE_CACHE_SIZE)
+def occurrence_dates(start, freq, interval, before, count, window_start, window_end):
+    """Start datetimes of a series in [window_start, window_end) and earlier than `before`
+       (the day after UNTIL, or None), as a tuple. Pure in its arguments, so repeated views
+       of the same window are served from the LRU.
+    """
+    last = min(window_end, before) if before else window_end
+    if last <= start or window_start >= last:
+        return ()
+    # Candidate k is occurrence k unless invalid dates are skipped; COUNT then needs a walk from the start.
+    k = 0 if count and _may_skip(start, freq) else _periods_before(start, freq, interval, window_start)
+    produced = k
+    dates = []
+    while count is None or produced < count:
+        day = _nth(start, freq, k * interval)
+        k += 1
+        if day is None:
+            continue
+        if day >= last:
+            break
+        produced += 1
+        if day >= window_start:
+            dates.append(day)
+    return tuple(dates)
+
+def expand(event, window_start, window_end):
+    """Occurrences of a recurring event in [window_start, window_end), as shallow copies with
+       `date` set to the occurrence. Every copy keeps the series' _id.
+    """
+    rule = event["rrule"]
+    until = rule.get("until")
+    dates = occurrence_dates(
+        event["date"], rule["freq"], rule.get("interval") or 1,
+        parse_date(until) + timedelta(days=1) if until else None, rule.get("count"),
+        window_start, window_end
+    )
+    skipped = {as_date(d) for d in event.get("exdates") or ()}
+    return [dict(event, date=d) for d in dates if d.date() not in skipped]
+
+def to_rrule(rule):
+    """Serialize a rule as an iCalendar RRULE value."""
+    parts = [f"FREQ={rule['freq'].upper()}", f"INTERVAL={rule.get('interval') or 1}"]
+    if rule.get("until"):
+        parts.append(f"UNTIL={as_date(rule['until']):%Y%m%d}T235959Z")
+    if rule.get("count"):
+        parts.append(f"COUNT={rule['count']}")
+    return ";".join(parts)
+
+WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+
+def _implied(part, value, freq, start):
+    """Whether a BY* part only restates what DTSTART already gives the series."""
+    if start is None:
+        return False
+    if part == "BYDAY":
+        return freq == "weekly" and value == WEEKDAYS[start.weekday()]
+    if part == "BYMONTHDAY":
+        return freq in ("monthly", "yearly") and value == str(start.day)
+    if part == "BYMONTH":
+        return freq == "yearly" and value == str(start.month)
+    return False
+
+def parse_rrule(value, start=None):
+    """Parse an iCalendar RRULE value for a series beginning at `start`. BY* parts are only accepted
+       where they repeat DTSTART (BYDAY=MO on a weekly series starting on a Monday); any other BY* part
+       or a FREQ outside FREQUENCIES raises ValueError rather than importing a different series.
+    """
+    parts = dict(p.partition("=")[::2] for p in value.upper().split(";") if p)
+    freq = parts.get("FREQ", "").lower()
+    if freq not in FREQUENCIES:
+        raise ValueError(f"unsupported RRULE FREQ={parts.get('FREQ', '')}")
+    for part, part_value in parts.items():
+        if part.startswith("BY") and not _implied(part, part_value, freq, start):
+            raise ValueError(f"unsupported RRULE part {part}={part_value}")
+    until = parts.get("UNTIL")
+    return make_rule(
+        freq,
+        parts.get("INTERVAL"),
+        f"{until[:4]}-{until[4:6]}-{until[6:8]}" if until else None,
+        parts.get("COUNT")
+    )
@@ -0,0 +1,59 @@
+# src/utils/search.py
+"""Ranked family search over events, tasks and messages.
+
+Each collection has a text index prefixed by family_id (declared in its blueprint's
+manifest), so a search only touches the family's own index entries.
+"""
+import os
+from src.utils.db import get_db
+from src.utils.message_store import message_store, TEXT_SCORE
+
+db = get_db()
+
+SEARCH_PAGE_SIZE = 20
+# Deepest result reachable by paging; every page re-ranks from the top.
+MAX_SEARCH_RESULTS = int(os.getenv("MAX_SEARCH_RESULTS", 200))
+
+def _event_hit(e):
+    return {"kind": "event", "id": str(e["_id"]), "title": e.get("title", ""), "text": e.get("description", ""),
+            "date": e.get("date"), "score": e["score"]}
+
+def _task_hit(t):
+    return {"kind": "task", "id": str(t["_id"]), "title": t.get("title", ""), "text": t.get("description", ""),
+            "date": t.get("due_date"), "score": t["score"]}
+
+def _message_hit(m):
+    return {"kind": "message", "id": str(m["_id"]), "title": "", "text": m.get("content", ""),
+            "date": m.get("timestamp"), "sender_id": m.get("sender_id"), "score": m["score"]}
+
+def _find_scored(collection):
+    def find(query, projection, limit):
+        return db[collection].find(query, dict(projection, score=TEXT_SCORE)).sort([("score", TEXT_SCORE)]).limit(limit)
+    return find
+
+# collection -> (fields to fetch, hit builder, scored finder)
+SOURCES = {
+    "events": (["title", "description", "date"], _event_hit, _find_scored("events")),
+    "tasks": (["title", "description", "due_date"], _task_hit, _find_scored("tasks")),
+    "messages": (["content", "timestamp", "sender_id"], _message_hit, message_store.text_search),
+}
+
+def text_query(family_id, terms):
+    """A family-scoped $text filter. family_id must be an equality match to use the prefixed index."""
+    return {"family_id": family_id, "$text": {"$search": terms}}
+
+def search_family(family_id, terms, page=1, page_size=SEARCH_PAGE_SIZE, collections=None, filters=None):
+    """One page of hits across collections, merged by text score.
+       filters maps a collection to extra conditions, e.g. {"tasks": {"assigned_to": user_id}}.
+       Each collection returns at most its best page * page_size + 1 matches. Returns (hits, has_more).
+    """
+    wanted = min(page * page_size, MAX_SEARCH_RESULTS)
+    hits = []
+    for name in collections or SOURCES:
+        fields, to_hit, find = SOURCES[name]
+        query = dict(text_query(family_id, terms), **(filters or {}).get(name, {}))
+        hits.extend(to_hit(doc) for doc in find(query, dict.fromkeys(fields, 1), wanted + 1))
+
+    hits.sort(key=lambda h: h["score"], reverse=True)
+    start = (page - 1) * page_size
+    return hits[start:start + page_size], len(hits) > wanted and wanted < MAX_SEARCH_RESULTS
@@ -0,0 +1,102 @@
+# src/utils/tokens.py
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import jwt
+from bson.objectid import ObjectId
+from dotenv import load_dotenv
+from src.utils.db import get_db
+
+load_dotenv()
+
+db = get_db()
+JWT_SECRET = os.getenv("JWT_SECRET", "changeme")
+JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
+TOKEN_LIFETIME = timedelta(hours=1)
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 4096))
+# How long a verified token is trusted before its claims version is re-checked against users.
+CLAIMS_RECHECK_SECONDS = int(os.getenv("CLAIMS_RECHECK_SECONDS", 60))
+
+class StaleClaimsError(jwt.InvalidTokenError):
+    """The token is validly signed but the user's role or membership changed since it was minted."""
+
+class TokenCache:
+    """Small thread-safe LRU of verified token payloads keyed by token hash."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            payload, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return payload
+
+    def put(self, key, payload, expires_at):
+        with self._lock:
+            self._entries[key] = (payload, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def evict_user(self, user_id):
+        with self._lock:
+            for key in [k for k, (p, _) in self._entries.items() if p["user_id"] == user_id]:
+                del self._entries[key]
+
+_cache = TokenCache(TOKEN_CACHE_SIZE)
+
+def mint_token(user):
+    """Issue a session JWT carrying the user's role, family and claims version."""
+    payload = {
+        "sub": user["email"],
+        "user_id": str(user["_id"]),
+        "family_id": str(user["family_id"]),
+        "role": user.get("role", "child"),
+        "ver": user.get("claims_version", 0),
+        "exp": datetime.utcnow() + TOKEN_LIFETIME
+    }
+    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+
+def verify_token(token):
+    """Decode a session JWT, serving repeat verifications from the LRU.
+       Raises jwt.ExpiredSignatureError, StaleClaimsError or jwt.InvalidTokenError.
+    """
+    key = hashlib.sha256(token.encode()).hexdigest()
+    payload = _cache.get(key)
+    if payload is not None:
+        return payload
+
+    payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+    current = db.users.find_one({"_id": ObjectId(payload["user_id"])}, {"claims_version": 1})
+    if current is None or current.get("claims_version", 0) != payload.get("ver", 0):
+        raise StaleClaimsError("Token claims are out of date")
+    _cache.put(key, payload, min(payload["exp"], time.time() + CLAIMS_RECHECK_SECONDS))
+    return payload
+
+def refresh_token(stale_token):
+    """Re-mint a token whose claims went stale. Returns (token, payload) or (None, None) if the user is gone."""
+    payload = jwt.decode(stale_token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+    user = db.users.find_one({"_id": ObjectId(payload["user_id"])})
+    if not user:
+        return None, None
+    token = mint_token(user)
+    return token, verify_token(token)
+
+def bump_claims_version(user_id):
+    """Invalidate every outstanding token for a user after their role or family changes.
+       Other processes pick the change up within CLAIMS_RECHECK_SECONDS.
+    """
+    db.users.update_one({"_id": ObjectId(user_id)}, {"$inc": {"claims_version": 1}})
+    _cache.evict_user(str(user_id))
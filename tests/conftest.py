@@ -0,0 +1,59 @@
+# tests/conftest.py
+"""Runs the app against an in-memory mongomock client; nothing here needs a MongoDB server."""
+import os
+import mongomock
+import pytest
+from bson.objectid import ObjectId
+
+os.environ["ENSURE_INDEXES_ON_STARTUP"] = "false"
+
+from src.utils import db as db_module
+
+# Must happen before any src module calls get_db() at import time.
+db_module._client = mongomock.MongoClient()
+
+import app as app_module
+from src.auth import pwd_context
+
+PASSWORD = "correct horse"
+
+@pytest.fixture
+def db():
+    database = db_module.get_db()
+    yield database
+    db_module._client.drop_database(database.name)
+
+@pytest.fixture
+def app():
+    app_module.app.config["TESTING"] = True
+    return app_module.app
+
+@pytest.fixture
+def family(db):
+    """A family with a parent and a child. Returns (family_id, parent_id, child_id)."""
+    family_id = ObjectId()
+    parent_id = db.users.insert_one({"email": "parent@example.com", "username": "parent", "role": "parent",
+                                     "family_id": family_id, "email_verified": True,
+                                     "hashed_password": pwd_context.hash(PASSWORD)}).inserted_id
+    child_id = db.users.insert_one({"email": "child@example.com", "username": "child", "role": "child",
+                                    "family_id": family_id, "email_verified": True,
+                                    "hashed_password": pwd_context.hash(PASSWORD)}).inserted_id
+    db.families.insert_one({"_id": family_id, "name": "Test", "invite_code": "INVITE",
+                            "members": [parent_id, child_id]})
+    return family_id, parent_id, child_id
+
+@pytest.fixture
+def client(app, family):
+    """A test client logged in as the family's parent."""
+    test_client = app.test_client()
+    response = test_client.post("/auth/login", data={"email": "parent@example.com", "password": PASSWORD})
+    assert response.status_code == 302
+    return test_client
+
+@pytest.fixture
+def child_client(app, family):
+    """A test client logged in as the family's child."""
+    test_client = app.test_client()
+    response = test_client.post("/auth/login", data={"email": "child@example.com", "password": PASSWORD})
+    assert response.status_code == 302
+    return test_client
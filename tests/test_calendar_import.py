@@ -0,0 +1,39 @@
+# tests/test_calendar_import.py
+import io
+from datetime import datetime
+from src.calendar import calendar_version
+
+ICS = b"""BEGIN:VCALENDAR\r
+BEGIN:VEVENT\r
+UID:lessons\r
+SUMMARY:Piano\r
+DTSTART:20240101T160000\r
+RRULE:FREQ=WEEKLY;COUNT=10\r
+EXDATE:20240108T160000\r
+END:VEVENT\r
+BEGIN:VEVENT\r
+UID:lessons\r
+RECURRENCE-ID:20240115T160000\r
+SUMMARY:Piano (moved)\r
+DTSTART:20240116T160000\r
+END:VEVENT\r
+END:VCALENDAR\r
+"""
+
+def upload(client):
+    return client.post("/calendar/import_ics", data={"ics_file": (io.BytesIO(ICS), "cal.ics")},
+                       content_type="multipart/form-data", follow_redirects=True)
+
+def test_reimport_keeps_skipped_occurrences_and_leaves_version_alone(client, db, family):
+    family_id = family[0]
+    upload(client)
+    series = db.events.find_one({"ics_uid": "lessons"})
+    client.post(f"/calendar/skip/{series['_id']}/2024-01-22")
+    version, _ = calendar_version(family_id)
+
+    response = upload(client)
+
+    assert b"0 new, 0 updated, 2 unchanged" in response.data
+    assert calendar_version(family_id)[0] == version
+    exdates = db.events.find_one({"_id": series["_id"]})["exdates"]
+    assert sorted(exdates) == [datetime(2024, 1, 8, 16), datetime(2024, 1, 15, 16), datetime(2024, 1, 22)]
@@ -0,0 +1,33 @@
+# tests/test_ics_stream.py
+import io
+from datetime import datetime
+from src.utils.ics_stream import read_vevents
+
+def vevent(dtstart, rrule):
+    return f"BEGIN:VEVENT\r\nUID:{rrule}\r\nSUMMARY:x\r\nDTSTART:{dtstart}\r\nRRULE:{rrule}\r\nEND:VEVENT\r\n"
+
+def read(*events):
+    errors = []
+    body = "BEGIN:VCALENDAR\r\n" + "".join(events) + "END:VCALENDAR\r\n"
+    return list(read_vevents(io.BytesIO(body.encode()), errors)), errors
+
+def test_by_parts_repeating_dtstart_are_accepted():
+    # 2024-01-01 is a Monday.
+    events, errors = read(vevent("20240101T090000", "FREQ=WEEKLY;BYDAY=MO"),
+                          vevent("20240101T090000", "FREQ=MONTHLY;BYMONTHDAY=1"))
+    assert errors == []
+    assert [e["rrule"]["freq"] for e in events] == ["weekly", "monthly"]
+    assert events[0]["date"] == datetime(2024, 1, 1, 9)
+
+def test_unsupported_rules_are_reported_not_imported_as_one_offs():
+    events, errors = read(vevent("20240101T090000", "FREQ=WEEKLY;BYDAY=MO,WE"),
+                          vevent("20240101T090000", "FREQ=MONTHLY;BYDAY=1MO"),
+                          vevent("20240101T090000", "FREQ=MONTHLY;BYDAY=MO;BYSETPOS=-1"),
+                          vevent("20240101T090000", "FREQ=HOURLY"))
+    assert events == []
+    assert [message for _, message in errors] == [
+        "unsupported RRULE part BYDAY=MO,WE",
+        "unsupported RRULE part BYDAY=1MO",
+        "unsupported RRULE part BYDAY=MO",
+        "unsupported RRULE FREQ=HOURLY",
+    ]
@@ -0,0 +1,54 @@
+# tests/test_identity.py
+from collections import Counter
+import mongomock
+import pytest
+from flask import g
+from src.utils.identity import Identity
+
+@pytest.fixture
+def finds(monkeypatch):
+    """Counts find/find_one calls that reach the database, per collection."""
+    counts = Counter()
+    original = mongomock.collection.Collection.find
+
+    def find(self, *args, **kwargs):
+        counts[self.name] += 1
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(mongomock.collection.Collection, "find", find)
+    return counts
+
+def claims(family, role="parent"):
+    family_id, parent_id, _ = family
+    return {"user_id": str(parent_id), "family_id": str(family_id), "role": role}
+
+def test_members_page_loads_family_and_members_once(client, finds):
+    client.get("/family/members")  # verifies the token once; later requests hit the token cache
+    finds.clear()
+    with client:
+        response = client.get("/family/members")
+        assert response.status_code == 200
+        assert g.identity.queries == {"families": 1, "users": 1}
+    assert finds == {"families": 1, "users": 1}
+
+def test_user_after_members_reuses_member_doc(db, family, finds):
+    identity = Identity(claims(family))
+    assert len(identity.members) == 2
+    assert identity.user["_id"] == family[1]
+    identity.family
+    identity.members
+    assert identity.queries == {"families": 1, "users": 1}
+    assert finds == {"families": 1, "users": 1}
+
+def test_members_after_user_only_fetches_the_others(db, family, finds):
+    identity = Identity(claims(family))
+    assert identity.user["_id"] == family[1]
+    assert {m["_id"] for m in identity.members} == {family[1], family[2]}
+    identity.user
+    assert identity.queries == {"families": 1, "users": 2}
+    assert finds == {"families": 1, "users": 2}
+
+def test_role_from_claims_needs_no_lookup(db, family, finds):
+    identity = Identity(claims(family, role="child"))
+    assert not identity.is_parent
+    assert finds == {}
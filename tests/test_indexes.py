@@ -0,0 +1,69 @@
+# tests/test_indexes.py
+import os
+from types import SimpleNamespace
+import pytest
+from bson.objectid import ObjectId
+from pymongo import MongoClient, IndexModel, ASCENDING
+from pymongo.errors import PyMongoError
+import app as app_module
+from src.utils.indexes import ensure_indexes, verify_query_plans
+
+def test_one_failed_index_does_not_stop_the_rest(db):
+    db.things.insert_many([{"code": "a"}, {"code": "a"}])
+    broken = SimpleNamespace(INDEXES={"things": [IndexModel([("code", ASCENDING)], unique=True),
+                                                 IndexModel([("kind", ASCENDING)])]})
+    later = SimpleNamespace(INDEXES={"others": [IndexModel([("family_id", ASCENDING)])]})
+
+    created, failed = ensure_indexes(db, [broken, later])
+
+    assert failed == ["things.code_1"]
+    assert created == ["things.kind_1", "others.family_id_1"]
+    assert "kind_1" in db.things.index_information()
+
+class ExplainedCollection:
+    """Stands in for a collection whose explain() returns a fixed winning plan."""
+
+    def __init__(self, plan):
+        self.plan = plan
+
+    def find(self, query):
+        return self
+
+    def sort(self, sort):
+        return self
+
+    def explain(self):
+        return {"queryPlanner": {"winningPlan": self.plan}}
+
+def test_verify_query_plans_reports_nested_collscans():
+    ixscan = {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "family_id_1"}}
+    collscan = {"stage": "SUBPLAN", "inputStage": {"stage": "OR", "inputStages": [
+        {"stage": "IXSCAN"}, {"stage": "COLLSCAN"}]}}
+    db = {"indexed": ExplainedCollection(ixscan), "scanned": ExplainedCollection(collscan)}
+    module = SimpleNamespace(QUERY_SHAPES=[("indexed", {"family_id": 1}, None),
+                                           ("scanned", {"family_id": 1}, [("date", ASCENDING)])])
+
+    assert verify_query_plans(db, [module]) == [("scanned", {"family_id": 1}, [("date", ASCENDING)])]
+
+@pytest.fixture
+def mongodb():
+    """A throwaway database on the server at MONGODB_URI; skips when none is reachable."""
+    client = MongoClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017"), serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command("ping")
+    except PyMongoError:
+        pytest.skip("needs a MongoDB server (set MONGODB_URI)")
+    database = client[f"home_management_test_{ObjectId()}"]
+    yield database
+    client.drop_database(database.name)
+    client.close()
+
+def test_every_registered_query_shape_uses_an_index(mongodb):
+    created, failed = ensure_indexes(mongodb, app_module.MANIFEST_MODULES)
+    assert failed == []
+    assert verify_query_plans(mongodb, app_module.MANIFEST_MODULES) == []
+
+def test_unindexed_query_shape_is_reported(mongodb):
+    mongodb.unindexed.insert_one({"family_id": ObjectId()})
+    module = SimpleNamespace(QUERY_SHAPES=[("unindexed", {"family_id": ObjectId()}, None)])
+    assert len(verify_query_plans(mongodb, [module])) == 1
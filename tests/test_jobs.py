@@ -0,0 +1,73 @@
+# tests/test_jobs.py
+from datetime import datetime, timedelta
+from bson.objectid import ObjectId
+from src.utils import jobs
+
+def test_worker_that_lost_its_lease_does_not_overwrite_the_new_attempt(db, monkeypatch):
+    job_id = jobs.enqueue("meal_plan", ObjectId(), ObjectId(), {})
+    attempts = []
+
+    def handler(job, progress):
+        attempts.append(job["attempts"])
+        if len(attempts) == 1:
+            # The first attempt stalls past its lease, and another worker reclaims and finishes the job.
+            db.jobs.update_one({"_id": job_id}, {"$set": {"lease_until": datetime.utcnow() - timedelta(seconds=1)}})
+            assert jobs.JobWorker().run_one()
+            return "stale"
+        return "current"
+
+    monkeypatch.setattr(jobs, "_resolve", lambda target: handler)
+    assert jobs.JobWorker().run_one()
+    job = db.jobs.find_one({"_id": job_id})
+    assert attempts == [1, 2]
+    assert job["status"] == "succeeded"
+    assert job["result"] == "current"
+
+def test_failed_transcription_removes_the_upload(db, tmp_path, monkeypatch):
+    audio = tmp_path / "recording.wav"
+    audio.write_bytes(b"RIFF")
+    monkeypatch.setattr(jobs, "JOB_MAX_ATTEMPTS", 1)
+    monkeypatch.setattr("src.meals.transcribe_audio", lambda path: (_ for _ in ()).throw(RuntimeError("API down")))
+    job_id = jobs.enqueue("transcription", ObjectId(), ObjectId(), {"audio_path": str(audio)})
+
+    assert jobs.JobWorker().run_one()
+    assert db.jobs.find_one({"_id": job_id})["status"] == "failed"
+    assert not audio.exists()
+
+def test_expired_last_attempt_fails_instead_of_running_again(db, tmp_path, monkeypatch):
+    audio = tmp_path / "recording.wav"
+    audio.write_bytes(b"RIFF")
+    monkeypatch.setattr(jobs, "JOB_MAX_ATTEMPTS", 2)
+    job_id = jobs.enqueue("transcription", ObjectId(), ObjectId(), {"audio_path": str(audio)},
+                          dedupe_key="transcription:1")
+    # The worker running the last attempt died holding its lease.
+    db.jobs.update_one({"_id": job_id}, {"$set": {"status": "running", "attempts": 2,
+                                                  "lease_until": datetime.utcnow() - timedelta(seconds=1)}})
+
+    assert not jobs.JobWorker().run_one()
+    job = db.jobs.find_one({"_id": job_id})
+    assert job["status"] == "failed"
+    assert job["attempts"] == 2
+    assert "active_key" not in job
+    assert not audio.exists()
+
+def test_transcription_upload_is_kept_until_the_owning_attempt_records_its_result(db, tmp_path, monkeypatch):
+    audio = tmp_path / "recording.wav"
+    audio.write_bytes(b"RIFF")
+    seen = []
+
+    def transcribe(path):
+        seen.append(audio.exists())
+        if len(seen) == 1:
+            # Another worker takes over this attempt's lease and finishes first.
+            db.jobs.update_one({"_id": job_id}, {"$set": {"lease_until": datetime.utcnow() - timedelta(seconds=1)}})
+            assert jobs.JobWorker().run_one()
+        return "I like broccoli"
+
+    monkeypatch.setattr("src.meals.transcribe_audio", transcribe)
+    job_id = jobs.enqueue("transcription", ObjectId(), ObjectId(), {"audio_path": str(audio)})
+
+    assert jobs.JobWorker().run_one()
+    assert seen == [True, True]
+    assert db.jobs.find_one({"_id": job_id})["status"] == "succeeded"
+    assert not audio.exists()
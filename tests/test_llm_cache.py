@@ -0,0 +1,70 @@
+# tests/test_llm_cache.py
+import threading
+import time
+from src.utils import llm_cache, openai_client
+from src.utils.llm_cache import cached_call
+
+FOLLOWERS = 4
+
+def wait_for_followers(db, namespace):
+    deadline = time.monotonic() + 5
+    while (db.llm_cache_stats.find_one({"_id": namespace}) or {}).get("shared", 0) < FOLLOWERS:
+        assert time.monotonic() < deadline, "followers never joined the in-flight call"
+        time.sleep(0.01)
+
+def run_together(target):
+    results, threads = [], [threading.Thread(target=lambda: results.append(target())) for _ in range(FOLLOWERS + 1)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    return results
+
+def test_concurrent_misses_for_one_key_call_the_model_once(db):
+    calls = []
+
+    def call():
+        calls.append(1)
+        wait_for_followers(db, "test")
+        return "plan"
+
+    results = run_together(lambda: cached_call("test", "key", call))
+
+    assert calls == [1]
+    assert results == ["plan"] * (FOLLOWERS + 1)
+    assert db.llm_cache.find_one({"_id": "key"})["response"] == "plan"
+
+def test_leader_failure_is_raised_to_followers_and_releases_the_key(db):
+    def call():
+        wait_for_followers(db, "test")
+        raise RuntimeError("model down")
+
+    def attempt():
+        try:
+            return cached_call("test", "key", call)
+        except RuntimeError as e:
+            return str(e)
+
+    assert run_together(attempt) == ["model down"] * (FOLLOWERS + 1)
+    assert "key" not in llm_cache._inflight
+    assert db.llm_cache.find_one({"_id": "key"}) is None
+    assert cached_call("test", "key", lambda: "recovered") == "recovered"
+
+def test_meal_plans_are_cached_per_week(db, monkeypatch):
+    prompts = []
+
+    def post(path, timeout, json=None):
+        prompts.append(json["prompt"])
+        return {"choices": [{"text": '{"week_start": "%d"}' % len(prompts)}]}
+
+    monkeypatch.setattr(openai_client.client, "post", post)
+    prefs = {"dietary_restrictions": [], "common_likes": ["pasta"], "common_dislikes": []}
+
+    first = openai_client.generate_meals(prefs, "2024-01-01")
+    second = openai_client.generate_meals(prefs, "2024-01-08")
+
+    assert first != second
+    assert len(prompts) == 2
+    assert openai_client.generate_meals(prefs, "2024-01-01") == first
+    assert openai_client.generate_meals(prefs, "2024-01-01", refresh=True) != first
+    assert len(prompts) == 3
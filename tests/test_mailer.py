@@ -0,0 +1,107 @@
+# tests/test_mailer.py
+"""The outbox worker against a local aiosmtpd server standing in for the SMTP relay."""
+import smtplib
+import socket
+from datetime import datetime, timedelta
+import pytest
+from src.utils import mailer
+from src.utils.mailer import OutboxWorker, SMTPSession, queue_email
+
+controller = pytest.importorskip("aiosmtpd.controller")
+
+class Relay:
+    """Accepts every message, or answers each DATA with `reply` when one is set."""
+
+    def __init__(self):
+        self.received = []
+        self.reply = None
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.reply:
+            return self.reply
+        self.received.append(envelope)
+        return "250 OK"
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+@pytest.fixture
+def relay(monkeypatch):
+    monkeypatch.setattr(mailer, "SMTP_FROM", "family@example.com")
+    handler = Relay()
+    server = controller.Controller(handler, hostname="127.0.0.1", port=free_port())
+    server.start()
+    handler.port = server.port
+    yield handler
+    server.stop()
+
+@pytest.fixture
+def worker(relay):
+    worker = OutboxWorker(SMTPSession("127.0.0.1", relay.port, user="", starttls=False))
+    yield worker
+    worker.session.close()
+
+def make_due(db):
+    db.email_outbox.update_many({"status": "pending"}, {"$set": {"next_attempt_at": datetime.utcnow()}})
+
+def test_queued_messages_are_sent_over_one_session(db, relay, worker):
+    queue_email("a@example.com", "Hello", "First")
+    queue_email("b@example.com", "Hello", "Second")
+
+    assert worker.drain_once() == 2
+    assert [e.rcpt_tos for e in relay.received] == [["a@example.com"], ["b@example.com"]]
+    assert db.email_outbox.count_documents({"status": "sent", "lease_token": {"$exists": False}}) == 2
+
+def test_rejected_message_is_retried_with_backoff(db, relay, worker):
+    queue_email("a@example.com", "Hello", "Body")
+    relay.reply = "451 Try again later"
+
+    before = datetime.utcnow()
+    worker.drain_once()
+    message = db.email_outbox.find_one()
+    assert message["status"] == "pending"
+    assert message["attempts"] == 1
+    assert "451" in message["last_error"]
+    delay = (message["next_attempt_at"] - before).total_seconds()
+    assert mailer.OUTBOX_RETRY_BASE_SECONDS * 0.8 <= delay <= mailer.OUTBOX_RETRY_BASE_SECONDS * 1.2 + 1
+    assert worker.drain_once() == 0
+
+    relay.reply = None
+    make_due(db)
+    assert worker.drain_once() == 1
+    assert db.email_outbox.find_one()["status"] == "sent"
+    assert len(relay.received) == 1
+
+def test_message_fails_after_max_attempts(db, relay, worker, monkeypatch):
+    monkeypatch.setattr(mailer, "OUTBOX_MAX_ATTEMPTS", 3)
+    queue_email("a@example.com", "Hello", "Body")
+    relay.reply = "554 Rejected"
+
+    for _ in range(3):
+        make_due(db)
+        assert worker.drain_once() == 1
+    message = db.email_outbox.find_one()
+    assert message["status"] == "failed"
+    assert message["attempts"] == 3
+    make_due(db)
+    assert worker.drain_once() == 0
+
+def test_worker_that_lost_its_lease_does_not_overwrite_the_new_claim(db, relay, worker):
+    queue_email("a@example.com", "Hello", "Body")
+
+    class StalledSession:
+        def send(self, msg):
+            # This send outlives its lease; another worker reclaims the message and delivers it.
+            db.email_outbox.update_one({}, {"$set": {"lease_until": datetime.utcnow() - timedelta(seconds=1)}})
+            assert worker.drain_once() == 1
+            raise smtplib.SMTPServerDisconnected("timed out")
+
+        def close(self):
+            pass
+
+    OutboxWorker(StalledSession()).drain_once()
+    message = db.email_outbox.find_one()
+    assert message["status"] == "sent"
+    assert message["attempts"] == 0
@@ -0,0 +1,39 @@
+# tests/test_message_store.py
+from datetime import datetime, timedelta
+from bson.objectid import ObjectId
+from src.utils import message_store
+from src.utils.message_store import BucketStore, compact_messages
+
+def seed(db, family_id, count, start=datetime(2024, 1, 1, 8)):
+    messages = [{"_id": ObjectId(), "family_id": family_id, "sender_id": ObjectId(), "content": f"message {i}",
+                 "timestamp": start + timedelta(minutes=i)} for i in range(count)]
+    db.messages.insert_many(messages)
+    return messages
+
+def test_compaction_moves_every_old_message_once(db):
+    family_id = ObjectId()
+    messages = seed(db, family_id, 25)
+
+    moved, written = compact_messages(datetime(2024, 2, 1), batch_size=10)
+
+    assert moved == 25
+    assert db.messages.count_documents({}) == 0
+    stored = [m["_id"] for b in db.message_buckets.find() for m in b["messages"]]
+    assert sorted(stored) == sorted(m["_id"] for m in messages)
+    assert [m["_id"] for m in BucketStore().latest(family_id, 25)] == [m["_id"] for m in messages]
+
+def test_resumed_compaction_with_another_batch_size_does_not_duplicate(db, monkeypatch):
+    family_id = ObjectId()
+    seed(db, family_id, 25)
+    # An interrupted run stored its buckets but died before deleting the messages they hold.
+    monkeypatch.setattr(message_store, "_bucketed", lambda family_ids, ids: set())
+    compact_messages(datetime(2024, 2, 1), batch_size=10)
+    monkeypatch.undo()
+    assert db.messages.count_documents({}) == 25
+
+    moved, written = compact_messages(datetime(2024, 2, 1), batch_size=7)
+
+    assert written == 0
+    assert moved == 25
+    stored = [m["_id"] for b in db.message_buckets.find() for m in b["messages"]]
+    assert len(stored) == len(set(stored)) == 25
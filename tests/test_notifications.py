@@ -0,0 +1,29 @@
+# tests/test_notifications.py
+import mongomock
+from bson.objectid import ObjectId
+from src.utils import notifications
+
+def test_rebuild_recounts_counters_that_predate_the_counter(db):
+    user_id = ObjectId()
+    db.notifications.insert_many([{"user_id": user_id, "message": "m", "read": False} for _ in range(3)])
+    stale = db.notification_counters.insert_one({"unread": -4}).inserted_id
+
+    assert notifications.rebuild_unread_counters() == (1, 1)
+    assert notifications.unread_count(user_id) == 3
+    assert notifications.unread_count(stale) == 0
+
+def test_mark_all_read_keeps_notifications_that_arrive_meanwhile(db, monkeypatch):
+    user_id = ObjectId()
+    notifications.send_notification(user_id, "first")
+    original = mongomock.collection.Collection.update_many
+
+    def update_many(self, *args, **kwargs):
+        result = original(self, *args, **kwargs)
+        if self.name == "notifications":
+            # Arrives after the notifications are marked, before the counter is updated.
+            notifications.send_notification(user_id, "second")
+        return result
+
+    monkeypatch.setattr(mongomock.collection.Collection, "update_many", update_many)
+    assert notifications.mark_all_read(user_id) == 1
+    assert notifications.unread_count(user_id) == 1
@@ -0,0 +1,105 @@
+# tests/test_openai_client.py
+"""OpenAIClient against a stub transport and a fake clock, so retries and the breaker run without waiting."""
+import json
+import time
+from types import SimpleNamespace
+import pytest
+import requests
+from src.utils import openai_client
+from src.utils.openai_client import CircuitBreaker, CircuitOpenError, OpenAIClient, OpenAIError
+
+def reply(status, body=None, headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response._content = json.dumps(body or {"error": status}).encode()
+    response.headers.update(headers or {})
+    return response
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = SimpleNamespace(now=1000.0, sleeps=[], perf_counter=time.perf_counter)
+    fake.monotonic = lambda: fake.now
+    fake.sleep = fake.sleeps.append
+    monkeypatch.setattr(openai_client, "time", fake)
+    return fake
+
+def stub(client, *replies):
+    """Answer the client's requests with replies in order; returns the list of requested URLs."""
+    queue, calls = list(replies), []
+
+    def post(url, timeout=None, **kwargs):
+        calls.append(url)
+        return queue.pop(0)
+
+    client.session.post = post
+    return calls
+
+def make_client(max_retries=0, failures=2):
+    return OpenAIClient(base_url="http://stub", max_retries=max_retries,
+                        breaker=CircuitBreaker(failures=failures, reset_seconds=30))
+
+def test_breaker_opens_then_lets_one_trial_through_after_the_reset(clock):
+    client = make_client()
+    calls = stub(client, reply(500), reply(500), reply(200, {"ok": True}))
+
+    for _ in range(2):
+        with pytest.raises(OpenAIError):
+            client.post("/completions", 1)
+    assert client.breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        client.post("/completions", 1)
+    assert len(calls) == 2
+
+    clock.now += 30
+    assert client.breaker.state == "half-open"
+    assert client.post("/completions", 1) == {"ok": True}
+    assert client.breaker.state == "closed"
+    assert len(calls) == 3
+
+def test_failed_trial_reopens_the_breaker(clock):
+    client = make_client()
+    calls = stub(client, reply(500), reply(500), reply(503))
+    for _ in range(2):
+        with pytest.raises(OpenAIError):
+            client.post("/completions", 1)
+
+    clock.now += 30
+    with pytest.raises(OpenAIError):
+        client.post("/completions", 1)
+    assert client.breaker.state == "open"
+    clock.now += 29
+    with pytest.raises(CircuitOpenError):
+        client.post("/completions", 1)
+    assert len(calls) == 3
+
+def test_rate_limits_and_server_errors_are_retried(clock):
+    client = make_client(max_retries=3)
+    calls = stub(client, reply(429, headers={"Retry-After": "2"}), reply(502), reply(200, {"ok": True}))
+
+    assert client.post("/completions", 1) == {"ok": True}
+    assert len(calls) == 3
+    assert clock.sleeps[0] == 2
+    assert len(clock.sleeps) == 2
+    assert client.breaker.state == "closed"
+
+def test_gives_up_after_max_retries(clock):
+    client = make_client(max_retries=2, failures=5)
+    calls = stub(client, reply(500), reply(500), reply(500))
+
+    with pytest.raises(OpenAIError) as raised:
+        client.post("/completions", 1)
+    assert raised.value.status == 500
+    assert len(calls) == 3
+    assert len(clock.sleeps) == 2
+
+def test_client_errors_are_not_retried_and_do_not_trip_the_breaker(clock):
+    client = make_client(max_retries=3, failures=1)
+    calls = stub(client, reply(400), reply(404))
+
+    for status in (400, 404):
+        with pytest.raises(OpenAIError) as raised:
+            client.post("/completions", 1)
+        assert raised.value.status == status
+    assert len(calls) == 2
+    assert clock.sleeps == []
+    assert client.breaker.state == "closed"
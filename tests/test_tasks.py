@@ -0,0 +1,17 @@
+# tests/test_tasks.py
+from datetime import datetime
+
+def test_children_only_read_comments_on_their_own_tasks(client, child_client, db, family):
+    family_id, parent_id, child_id = family
+    theirs = db.tasks.insert_one({"family_id": family_id, "title": "Feed cat", "assigned_to": child_id}).inserted_id
+    others = db.tasks.insert_one({"family_id": family_id, "title": "Taxes", "assigned_to": parent_id}).inserted_id
+    db.task_comments.insert_many([
+        {"task_id": task_id, "family_id": family_id, "user_id": parent_id, "user_name": "parent",
+         "comment": "note", "timestamp": datetime(2024, 1, 1)}
+        for task_id in (theirs, others)
+    ])
+
+    assert len(child_client.get(f"/tasks/{theirs}/comments").get_json()["comments"]) == 1
+    assert child_client.get(f"/tasks/{others}/comments").status_code == 404
+    assert client.get(f"/tasks/{others}/comments").status_code == 200
+    assert child_client.get("/tasks/not-an-id/comments").status_code == 400